@@ -0,0 +1 @@
+"""Benchmarks for the data layer. Run modules with `python -m benchmarks.<name>`."""
@@ -0,0 +1,175 @@
+"""Times the crud read and write paths against a seeded database and reports p50/p95/p99.
+
+Usage: python -m benchmarks.crud_timings [--db FILE] [--runs N] [--only a,b] [--out FILE] [--compare BASELINE]
+
+Without --db a temporary database is seeded with benchmarks.workload (scale
+options as there). Write cases add rows, so point --db at a copy. --out
+writes the results as JSON. --compare prints each case against an earlier
+JSON result and exits 1 if any p95 regressed by more than --threshold.
+"""
+import argparse
+import json
+import math
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+
+import crud
+import database
+import notifier
+from benchmarks import workload
+
+class Sample:
+    """Random arguments drawn from what's actually in the database."""
+
+    def __init__(self, conn, rnd: random.Random):
+        self.rnd = rnd
+        self.user_ids = [r[0] for r in conn.execute("SELECT id FROM users")]
+        self.post_ids = [r[0] for r in conn.execute("SELECT id FROM posts")]
+        self.follows = conn.execute("SELECT follower_id, followed_id FROM follows ORDER BY random() LIMIT 5000").fetchall()
+        self.pairs = conn.execute("SELECT user_lo, user_hi, last_message_id FROM conversations WHERE last_message_id IS NOT NULL").fetchall()
+
+    def user(self) -> int: return self.rnd.choice(self.user_ids)
+    def post(self) -> int: return self.rnd.choice(self.post_ids)
+    def follow(self): return self.rnd.choice(self.follows)
+    def pair(self): return self.rnd.choice(self.pairs)
+    def term(self) -> str: return self.rnd.choice(workload.WORDS + workload.TAGS)
+
+def _feed_page2(s: Sample):
+    u = s.user()
+    return u, crud.page_cursor(crud.get_feed(u))
+
+def _older_messages(s: Sample):
+    a, b, _ = s.pair()
+    window = crud.get_messages_between(a, b)
+    return a, b, window[0]["id"] if window else None
+
+# (name, make_args(sample) -> tuple, call(*args)); only call is timed
+CASES = [
+    ("get_feed", lambda s: (s.user(),), crud.get_feed),
+    ("get_feed_page2", _feed_page2, lambda u, before: crud.get_feed(u, before=before)),
+    ("hydrate_posts", lambda s: ([p["id"] for p in crud.get_feed(s.user())], s.user()), crud.hydrate_posts),
+    ("get_posts_for_user", lambda s: (s.user(),), crud.get_posts_for_user),
+    ("get_recent_posts", lambda s: (), crud.get_recent_posts),
+    ("get_liked_posts_for_user", lambda s: (s.user(),), crud.get_liked_posts_for_user),
+    ("get_replies_for_user", lambda s: (s.user(),), crud.get_replies_for_user),
+    ("get_replies_for_post", lambda s: (s.post(),), crud.get_replies_for_post),
+    ("search_posts", lambda s: (s.term(),), crud.search_posts),
+    ("search_users", lambda s: (f"user{s.rnd.randint(1, 99)}",), crud.search_users),
+    ("search_usernames", lambda s: (f"user{s.rnd.randint(1, 99)}",), crud.search_usernames),
+    ("get_user_by_id", lambda s: (s.user(),), crud.get_user_by_id),
+    ("get_user_by_username", lambda s: (f"user{s.user()}",), crud.get_user_by_username),
+    ("get_follower_count", lambda s: (s.user(),), crud.get_follower_count),
+    ("get_following_count", lambda s: (s.user(),), crud.get_following_count),
+    ("get_likes_for_post", lambda s: (s.post(),), crud.get_likes_for_post),
+    ("is_following", lambda s: s.follow(), crud.is_following),
+    ("get_common_followers", lambda s: (s.user(), s.user()), crud.get_common_followers),
+    ("get_followers_list", lambda s: (s.user(),), crud.get_followers_list),
+    ("get_messages_between", lambda s: s.pair()[:2], crud.get_messages_between),
+    ("get_messages_between_older", _older_messages, lambda a, b, before_id: crud.get_messages_between(a, b, before_id=before_id)),
+    ("get_messages_since", lambda s: s.pair(), crud.get_messages_since),
+    ("get_inbox", lambda s: (s.user(),), crud.get_inbox),
+    ("get_unread_message_count", lambda s: (s.user(),), crud.get_unread_message_count),
+    ("get_notifications", lambda s: (s.user(),), crud.get_notifications),
+    ("get_notification_state", lambda s: (s.user(),), crud.get_notification_state),
+    # Writes. Notifications they trigger are flushed after the case, outside the timings.
+    ("create_post", lambda s: (s.user(), workload.random_text(s.rnd)), crud.create_post),
+    ("like_post", lambda s: (s.user(), s.post()), crud.like_post),
+    ("reply_to_post", lambda s: (s.user(), s.post(), workload.random_text(s.rnd)), crud.reply_to_post),
+    ("follow_user", lambda s: (s.user(), s.user()), crud.follow_user),
+    ("send_message", lambda s: (*s.pair()[:2], workload.random_text(s.rnd)), crud.send_message),
+]
+
+def percentile(sorted_ms: list, p: float) -> float:
+    """Nearest-rank percentile of an ascending list."""
+    return sorted_ms[max(0, math.ceil(p / 100 * len(sorted_ms)) - 1)]
+
+def time_case(sample: Sample, make_args, call, runs: int, warmup: int) -> dict:
+    timings = []
+    for i in range(warmup + runs):
+        args = make_args(sample)
+        start = time.perf_counter()
+        call(*args)
+        elapsed = (time.perf_counter() - start) * 1000
+        if i >= warmup: timings.append(elapsed)
+    timings.sort()
+    return {"runs": runs, "p50_ms": round(percentile(timings, 50), 4), "p95_ms": round(percentile(timings, 95), 4),
+            "p99_ms": round(percentile(timings, 99), 4), "mean_ms": round(statistics.fmean(timings), 4), "max_ms": round(timings[-1], 4)}
+
+def run(runs: int, warmup: int, only=None, rng_seed: int = 42) -> dict:
+    conn = database.get_conn()
+    sample = Sample(conn, random.Random(rng_seed))
+    results = {}
+    for name, make_args, call in CASES:
+        if only and name not in only: continue
+        results[name] = time_case(sample, make_args, call, runs, warmup)
+        notifier.flush()
+        print(f"{name:28s} p50 {results[name]['p50_ms']:9.3f} ms   p95 {results[name]['p95_ms']:9.3f} ms   p99 {results[name]['p99_ms']:9.3f} ms")
+    return results
+
+def compare(baseline: dict, current: dict, threshold: float) -> list:
+    """Prints current against baseline per case. Returns the names whose p95 grew by more than threshold."""
+    regressed = []
+    print(f"\n{'case':28s} {'p50 base -> now':>24s} {'p95 base -> now':>30s}")
+    for name, now in current["results"].items():
+        base = baseline["results"].get(name)
+        if not base:
+            print(f"{name:28s} (new)")
+            continue
+        ratio = now["p95_ms"] / base["p95_ms"] if base["p95_ms"] else float("inf")
+        flag = "  REGRESSED" if ratio > threshold else ""
+        if flag: regressed.append(name)
+        print(f"{name:28s} {base['p50_ms']:9.3f} -> {now['p50_ms']:9.3f} ms {base['p95_ms']:9.3f} -> {now['p95_ms']:9.3f} ms  x{ratio:5.2f}{flag}")
+    return regressed
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--db", help="existing database to benchmark (migrated first); default: seed a temporary one")
+    parser.add_argument("--runs", type=int, default=200, help="timed calls per case")
+    parser.add_argument("--warmup", type=int, default=10, help="untimed calls per case")
+    parser.add_argument("--only", help="comma-separated case names")
+    parser.add_argument("--out", help="write results as JSON to this file")
+    parser.add_argument("--compare", help="earlier JSON result to compare against")
+    parser.add_argument("--threshold", type=float, default=1.25, help="p95 ratio above which --compare reports a regression")
+    workload.add_arguments(parser)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        database.configure(args.db or os.path.join(tmp, "bench.db"))
+        conn = database.get_conn()
+        database.migrate(conn)
+        scale = {"users": args.users, "posts": args.posts, "follows_per_user": args.follows_per_user, "likes": args.likes, "replies": args.replies,
+                 "messages": args.messages, "notifications": args.notifications, "alpha": args.alpha, "seed": args.seed}
+        if not args.db:
+            started = time.perf_counter()
+            workload.seed_from_args(conn, args)
+            print(f"Seeded in {time.perf_counter() - started:.1f} s")
+        tables = ("users", "follows", "posts", "likes", "replies", "messages", "notifications", "timeline")
+        counts = {t: conn.execute(f"SELECT COUNT(*) FROM {t}").fetchone()[0] for t in tables}
+        results = run(args.runs, args.warmup, set(args.only.split(",")) if args.only else None, args.seed)
+        notifier.flush()
+        database.close_all()
+
+    report = {
+        "meta": {"created_at": time.time(), "python": platform.python_version(), "sqlite": sqlite3.sqlite_version, "platform": platform.platform(),
+                 "db": args.db, "scale": None if args.db else scale, "rows": counts, "runs": args.runs, "warmup": args.warmup},
+        "results": results,
+    }
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f: json.dump(report, f, indent=2)
+        print(f"Wrote {args.out}")
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f: baseline = json.load(f)
+        regressed = compare(baseline, report, args.threshold)
+        if regressed:
+            print(f"{len(regressed)} case(s) regressed: {', '.join(regressed)}")
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
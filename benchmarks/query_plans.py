@@ -0,0 +1,71 @@
+"""Shows query plans and timings of the hot queries before and after the index migration.
+
+Usage: python -m benchmarks.query_plans [--users N] [--posts N]
+"""
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+
+import database
+
+# (name, sql, params) for the read paths the secondary indexes target.
+QUERIES = [
+    ("get_feed", "SELECT p.*, u.username, u.display_name, u.profile_pic_path FROM posts p JOIN users u ON p.user_id = u.id WHERE p.user_id IN (SELECT followed_id FROM follows WHERE follower_id = ?) OR p.user_id = ? ORDER BY p.created_at DESC LIMIT 50", (1, 1)),
+    ("get_posts_for_user", "SELECT p.*, u.username, u.display_name, u.profile_pic_path FROM posts p JOIN users u ON p.user_id = u.id WHERE p.user_id = ? ORDER BY p.created_at DESC LIMIT 50", (1,)),
+    ("get_recent_posts", "SELECT p.*, u.username, u.display_name, u.profile_pic_path FROM posts p JOIN users u ON p.user_id = u.id ORDER BY p.created_at DESC LIMIT 100", ()),
+    ("get_replies_for_post", "SELECT r.*, u.username, u.display_name FROM replies r JOIN users u ON r.user_id = u.id WHERE r.post_id = ? ORDER BY r.created_at", (1,)),
+    ("get_messages_between", "SELECT m.* FROM messages m WHERE (sender_id = ? AND receiver_id = ?) OR (sender_id = ? AND receiver_id = ?) ORDER BY m.created_at", (1, 2, 2, 1)),
+    ("get_notifications", "SELECT * FROM notifications WHERE user_id = ? ORDER BY created_at DESC LIMIT 200", (1,)),
+    ("get_follower_count", "SELECT COUNT(follower_id) as cnt FROM follows WHERE followed_id = ?", (1,)),
+    ("get_likes_for_post", "SELECT COUNT(*) as cnt FROM likes WHERE post_id = ?", (1,)),
+]
+
+def seed(conn, users: int, posts: int):
+    """Fills the base tables with random rows."""
+    rnd = random.Random(42)
+    now = time.time()
+    conn.executemany("INSERT INTO users (id, username, display_name, created_at) VALUES (?, ?, ?, ?)", ((i, f"user{i}", f"User {i}", now) for i in range(1, users + 1)))
+    conn.executemany("INSERT INTO posts (user_id, text, created_at) VALUES (?, ?, ?)", ((rnd.randint(1, users), f"post {i}", now - rnd.random() * 86400 * 30) for i in range(posts)))
+    conn.executemany("INSERT OR IGNORE INTO follows (follower_id, followed_id, created_at) VALUES (?, ?, ?)", ((rnd.randint(1, users), rnd.randint(1, users), now) for _ in range(users * 20)))
+    conn.executemany("INSERT OR IGNORE INTO likes (user_id, post_id, created_at) VALUES (?, ?, ?)", ((rnd.randint(1, users), rnd.randint(1, posts), now) for _ in range(posts * 2)))
+    conn.executemany("INSERT INTO replies (post_id, user_id, text, created_at) VALUES (?, ?, ?, ?)", ((rnd.randint(1, posts), rnd.randint(1, users), "reply", now) for _ in range(posts // 2)))
+    conn.executemany("INSERT INTO messages (sender_id, receiver_id, text, created_at) VALUES (?, ?, ?, ?)", ((rnd.randint(1, users), rnd.randint(1, users), "hi", now - i) for i in range(posts // 2)))
+    conn.executemany("INSERT INTO notifications (user_id, text, seen, created_at) VALUES (?, ?, ?, ?)", ((rnd.randint(1, users), "note", rnd.randint(0, 1), now - i) for i in range(posts)))
+    conn.commit()
+
+def report(conn, label: str, runs: int):
+    print(f"\n=== {label} (schema version {database.schema_version(conn)}) ===")
+    for name, sql, params in QUERIES:
+        plan = [row["detail"] for row in conn.execute("EXPLAIN QUERY PLAN " + sql, params)]
+        timings = []
+        for _ in range(runs):
+            start = time.perf_counter()
+            conn.execute(sql, params).fetchall()
+            timings.append((time.perf_counter() - start) * 1000)
+        print(f"{name}: median {statistics.median(timings):.3f} ms")
+        for line in plan: print(f"    {line}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--posts", type=int, default=100000)
+    parser.add_argument("--runs", type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        database.configure(os.path.join(tmp, "bench.db"))
+        conn = database.get_conn()
+        database.migrate(conn, target=1)
+        seed(conn, args.users, args.posts)
+        conn.execute("ANALYZE")
+        report(conn, "before", args.runs)
+        database.migrate(conn)
+        conn.execute("ANALYZE")
+        report(conn, "after", args.runs)
+        database.close_all()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""Times search_posts and search_users on corpora of growing size, to check that latency stays flat.
+
+Usage: python -m benchmarks.search_scaling [--sizes 5000,20000,100000] [--users N] [--runs N]
+
+Each size gets a fresh temporary database seeded with benchmarks.workload
+(posts = size, everything else small). Search terms are drawn from the
+workload vocabulary, so most of them match a large share of the corpus.
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+import crud
+import database
+from benchmarks import workload
+from benchmarks.crud_timings import percentile
+
+def time_search(call, terms, runs: int, rnd: random.Random, paged: bool) -> list:
+    timings = []
+    for _ in range(runs):
+        term = rnd.choice(terms)
+        before = crud.page_cursor(call(term)) if paged else None
+        start = time.perf_counter()
+        call(term, before=before)
+        timings.append((time.perf_counter() - start) * 1000)
+    return sorted(timings)
+
+def run_size(path: str, size: int, users: int, runs: int, seed: int) -> dict:
+    database.configure(path)
+    conn = database.get_conn()
+    database.migrate(conn)
+    workload.seed(conn, users=users, posts=size, follows_per_user=5, likes=0, replies=0, messages=0, notifications=0, rng_seed=seed)
+    rnd = random.Random(seed)
+    cases = {
+        "search_posts": time_search(crud.search_posts, workload.WORDS + workload.TAGS, runs, rnd, False),
+        "search_posts_page2": time_search(crud.search_posts, workload.WORDS + workload.TAGS, runs, rnd, True),
+        "search_users": time_search(crud.search_users, [f"user{i}" for i in range(1, 10)], runs, rnd, False),
+    }
+    database.close_all()
+    return {name: (percentile(t, 50), percentile(t, 95)) for name, t in cases.items()}
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="5000,20000,100000", help="comma-separated post counts")
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--runs", type=int, default=100, help="timed searches per case and size")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    sizes = [int(s) for s in args.sizes.split(",")]
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in sizes:
+            started = time.perf_counter()
+            results[size] = run_size(os.path.join(tmp, f"search{size}.db"), size, args.users, args.runs, args.seed)
+            print(f"{size} posts seeded and searched in {time.perf_counter() - started:.1f} s")
+
+    print(f"\n{'case':20s}" + "".join(f"{f'{s} posts p50/p95':>26s}" for s in sizes))
+    for name in results[sizes[0]]:
+        print(f"{name:20s}" + "".join(f"{results[s][name][0]:12.3f}/{results[s][name][1]:9.3f} ms" for s in sizes))
+    print(f"(search ranks at most {crud.SEARCH_CANDIDATES} of the newest matches per query)")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,126 @@
+"""Seeds a database with a synthetic social workload.
+
+Follows, post authorship and likes are drawn from Zipf-like distributions. A
+few accounts get most of the followers, likes and traffic, as on a real
+network. Rows are written with executemany. Derived tables (counters,
+timelines, conversations, inbox, notification state and actors) are rebuilt from
+them, using the same idempotent steps the migrations use.
+
+Usage: python -m benchmarks.workload --db bench.db [--users N] [--posts N] ...
+"""
+import argparse
+import itertools
+import random
+import time
+
+import database
+
+WORDS = ("sui", "move", "gas", "wallet", "nft", "defi", "build", "ship", "gm", "web3", "node", "stake",
+         "validator", "token", "swap", "bridge", "zk", "rollup", "airdrop", "mint", "hello", "today", "launch", "bug")
+TAGS = ("#sui", "#web3", "#defi", "#nft", "#gm", "#buildinpublic", "#crypto", "#move")
+
+DEFAULTS = {"users": 5000, "posts": 50000, "follows_per_user": 30, "likes": 150000, "replies": 25000,
+            "messages": 50000, "notifications": 50000, "alpha": 1.1, "days": 30}
+
+def zipf_weights(n: int, alpha: float) -> list:
+    """Cumulative weights where rank r gets weight 1 / r**alpha."""
+    return list(itertools.accumulate(1.0 / (r ** alpha) for r in range(1, n + 1)))
+
+def random_text(rnd: random.Random) -> str:
+    words = rnd.choices(WORDS, k=rnd.randint(4, 16))
+    if rnd.random() < 0.4: words.insert(rnd.randrange(len(words) + 1), rnd.choice(TAGS))
+    return " ".join(words)
+
+def seed(conn, users: int = DEFAULTS["users"], posts: int = DEFAULTS["posts"], follows_per_user: int = DEFAULTS["follows_per_user"],
+         likes: int = DEFAULTS["likes"], replies: int = DEFAULTS["replies"], messages: int = DEFAULTS["messages"],
+         notifications: int = DEFAULTS["notifications"], alpha: float = DEFAULTS["alpha"], days: int = DEFAULTS["days"], rng_seed: int = 42) -> dict:
+    """Fills an empty, fully migrated database. Returns the row counts written."""
+    rnd = random.Random(rng_seed)
+    now = time.time()
+    span = days * 86400
+    # Ranks are shuffled so user ids don't correlate with popularity. Posting activity
+    # has its own ranking: tying it to follower count makes timelines quadratic in the heavy hitters.
+    user_weights = zipf_weights(users, alpha)
+    popular, active = list(range(1, users + 1)), list(range(1, users + 1))
+    rnd.shuffle(popular)
+    rnd.shuffle(active)
+    pick_users = lambda k: rnd.choices(popular, cum_weights=user_weights, k=k)
+    pick_authors = lambda k: rnd.choices(active, cum_weights=user_weights, k=k)
+
+    conn.executemany(
+        "INSERT INTO users (id, username, display_name, password_hash, bio, created_at, wallet_address, private_key, mnemonic) VALUES (?, ?, ?, '!', ?, ?, ?, '', '')",
+        ((i, f"user{i}", f"User {i}", random_text(rnd), now - span - rnd.random() * span, f"0x{i:064x}") for i in range(1, users + 1)))
+
+    follows = set()
+    for follower in range(1, users + 1):
+        k = min(users - 1, max(1, int(rnd.expovariate(1 / follows_per_user))))
+        follows.update((follower, f) for f in pick_users(k) if f != follower)
+    conn.executemany("INSERT INTO follows (follower_id, followed_id, created_at) VALUES (?, ?, ?)", ((a, b, now - rnd.random() * span) for a, b in follows))
+
+    conn.executemany("INSERT INTO posts (id, user_id, text, created_at) VALUES (?, ?, ?, ?)",
+                     ((i, author, random_text(rnd), now - rnd.random() * span) for i, author in enumerate(pick_authors(posts), 1)))
+
+    post_order = list(range(1, posts + 1))
+    rnd.shuffle(post_order)
+    post_weights = zipf_weights(posts, alpha)
+    pick_posts = lambda k: rnd.choices(post_order, cum_weights=post_weights, k=k)
+    conn.executemany("INSERT OR IGNORE INTO likes (user_id, post_id, created_at) VALUES (?, ?, ?)",
+                     ((rnd.randint(1, users), p, now - rnd.random() * span) for p in pick_posts(likes)))
+    conn.executemany("INSERT INTO replies (post_id, user_id, text, created_at) VALUES (?, ?, ?, ?)",
+                     ((p, rnd.randint(1, users), random_text(rnd), now - rnd.random() * span) for p in pick_posts(replies)))
+
+    # DMs go mostly between an account and someone it follows; threads get a popularity skew too
+    pairs = rnd.sample(sorted(follows), min(len(follows), max(1, messages // 20)))
+    pair_weights = zipf_weights(len(pairs), alpha)
+    thread = sorted((now - rnd.random() * span, p) for p in rnd.choices(pairs, cum_weights=pair_weights, k=messages))
+    conn.executemany("INSERT INTO messages (sender_id, receiver_id, text, created_at) VALUES (?, ?, ?, ?)",
+                     ((a, b, random_text(rnd), ts) if rnd.random() < 0.5 else (b, a, random_text(rnd), ts) for ts, (a, b) in thread))
+
+    kinds = ("like", "reply", "follow", "message")
+    conn.executemany("INSERT INTO notifications (user_id, kind, actor_id, post_id, event_count, seen, created_at) VALUES (?, ?, ?, ?, ?, 0, ?)",
+                     sorted(((u, rnd.choice(kinds), rnd.randint(1, users), rnd.randint(1, posts), rnd.randint(1, 5), now - rnd.random() * span)
+                             for u in pick_users(notifications)), key=lambda n: n[5]))
+    conn.commit()
+
+    with database.transaction() as c:
+        for sql in database.REBUILD_STATS: c.execute(sql)
+        database.rebuild_timelines(c)
+        database.add_conversation_ids(c)
+        for sql in database.INBOX_TABLES + database.NOTIFICATION_STATE_TABLES + database.NOTIFICATION_ACTOR_TABLES: c.execute(sql)
+        # Everything older than the newest third has been seen (ids follow created_at)
+        c.execute("UPDATE notification_state SET last_seen_id = ?", (notifications * 2 // 3,))
+        c.execute("UPDATE notification_state SET unread_count = (SELECT COUNT(*) FROM notifications n WHERE n.user_id = notification_state.user_id AND n.id > notification_state.last_seen_id)")
+    conn.execute("ANALYZE")
+    tables = ("users", "follows", "posts", "likes", "replies", "messages", "conversations", "notifications", "timeline")
+    return {t: conn.execute(f"SELECT COUNT(*) FROM {t}").fetchone()[0] for t in tables}
+
+def add_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--users", type=int, default=DEFAULTS["users"])
+    parser.add_argument("--posts", type=int, default=DEFAULTS["posts"])
+    parser.add_argument("--follows-per-user", type=int, default=DEFAULTS["follows_per_user"], help="mean out-degree")
+    parser.add_argument("--likes", type=int, default=DEFAULTS["likes"])
+    parser.add_argument("--replies", type=int, default=DEFAULTS["replies"])
+    parser.add_argument("--messages", type=int, default=DEFAULTS["messages"])
+    parser.add_argument("--notifications", type=int, default=DEFAULTS["notifications"])
+    parser.add_argument("--alpha", type=float, default=DEFAULTS["alpha"], help="Zipf exponent of popularity")
+    parser.add_argument("--seed", type=int, default=42)
+
+def seed_from_args(conn, args) -> dict:
+    return seed(conn, args.users, args.posts, args.follows_per_user, args.likes, args.replies, args.messages,
+                args.notifications, args.alpha, rng_seed=args.seed)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--db", required=True, help="database file to create")
+    add_arguments(parser)
+    args = parser.parse_args()
+    database.configure(args.db)
+    conn = database.get_conn()
+    database.migrate(conn)
+    started = time.perf_counter()
+    counts = seed_from_args(conn, args)
+    print(f"Seeded {args.db} in {time.perf_counter() - started:.1f} s: " + ", ".join(f"{t}={n}" for t, n in counts.items()))
+    database.close_all()
+
+if __name__ == "__main__":
+    main()
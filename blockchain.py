@@ -1,13 +1,20 @@
+import asyncio
+import threading
 import warnings
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Tuple
 import requests
-from config import SUI_RPC_URL
+from config import (SUI_RPC_URL, SUI_CLIENT_POOL_MAX, SUI_MAX_CONCURRENT_RPC, SUI_BATCH_CONCURRENCY,
+                    BALANCE_TTL, BALANCE_STALE_TTL, MARKET_TTL, MARKET_STALE_TTL, CHAIN_READ_TIMEOUT)
+from cache import TTLCache
 
 # Suppress warnings
 warnings.filterwarnings("ignore", category=DeprecationWarning)
 
-from pysui import SuiConfig, SyncClient
+from pysui import SuiConfig, SyncClient, AsyncClient
 from pysui.sui.sui_txn import SyncTransaction
 from pysui.sui.sui_types import SuiInteger, SuiAddress
+from pysui.sui.sui_builders.get_builders import GetCoinTypeBalance
 from pysui.sui.sui_crypto import gen_mnemonic_phrase, recover_key_and_address
 from pysui.abstracts.client_keypair import SignatureScheme
 
@@ -22,43 +29,189 @@ def generate_new_wallet():
     )
     return str(address), keypair.serialize(), mnemonic
 
+# --- CLIENT REGISTRY ---
+# Clients are long-lived: constructing one costs several RPC round trips and each
+# keeps its own keep-alive HTTP connection pool. Keyed by (client class, RPC URL,
+# signer key); least recently used entries are closed past SUI_CLIENT_POOL_MAX.
+_clients = OrderedDict()
+_clients_lock = threading.Lock()
+
+def _close_client(client):
+    if isinstance(client, AsyncClient):
+        asyncio.run_coroutine_threadsafe(client.close(), _get_loop())
+    else:
+        client.close()
+
+def get_client(kind=SyncClient, private_key: Optional[str] = None, rpc_url: str = SUI_RPC_URL):
+    """Returns the shared SyncClient/AsyncClient for rpc_url, signing with private_key if given."""
+    key = (kind, rpc_url, private_key)
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is not None:
+            _clients.move_to_end(key)
+            return client
+    created = kind(SuiConfig.user_config(prv_keys=[private_key] if private_key else [], rpc_url=rpc_url))
+    evicted = []
+    with _clients_lock:
+        client = _clients.setdefault(key, created)
+        _clients.move_to_end(key)
+        while len(_clients) > SUI_CLIENT_POOL_MAX:
+            evicted.append(_clients.popitem(last=False)[1])
+    if client is not created: evicted.append(created)
+    for c in evicted:
+        try: _close_client(c)
+        except Exception: pass
+    return client
+
+# --- ASYNC RPC LOOP ---
+# One background event loop serves all async RPC work; Streamlit script threads
+# submit coroutines with run_async(). _rpc_slots bounds concurrent requests.
+_loop = None
+_loop_lock = threading.Lock()
+_rpc_slots = asyncio.Semaphore(SUI_MAX_CONCURRENT_RPC)
+
+def _get_loop() -> asyncio.AbstractEventLoop:
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="sui-rpc-loop", daemon=True).start()
+        return _loop
+
+def run_async(coro, timeout: Optional[float] = None):
+    """Runs a coroutine on the shared RPC loop and blocks until it finishes."""
+    return asyncio.run_coroutine_threadsafe(coro, _get_loop()).result(timeout)
+
+async def _async_client(private_key: Optional[str] = None) -> AsyncClient:
+    # Client construction does blocking HTTP, keep it off the loop
+    return await asyncio.to_thread(get_client, AsyncClient, private_key)
+
+# --- BALANCES ---
+_reads = TTLCache()
+
+def _to_sui(result) -> float:
+    if not result.is_ok():
+        raise RuntimeError(result.result_string)
+    total_mist = sum(int(obj.balance) for obj in result.result_data.data)
+    return total_mist / 1_000_000_000
+
+def _fetch_balance(address: str) -> float:
+    """Fetches the SUI balance for an address. Raises on RPC errors."""
+    return _to_sui(get_client().get_gas(SuiAddress(address)))
+
 def get_sui_balance(address: str):
     """Gets SUI balance for an address."""
     try:
-        cfg = SuiConfig.user_config(prv_keys=[], rpc_url=SUI_RPC_URL)
-        client = SyncClient(cfg)
-        result = client.get_gas(SuiAddress(address))
-        if result.is_ok():
-            total_mist = sum(int(obj.balance) for obj in result.result_data.data)
-            return total_mist / 1_000_000_000
-        return 0.0
+        return _fetch_balance(address)
     except Exception:
         return 0.0
 
-def send_sui_payment(sender_priv_key: str, recipient_addr: str, amount_sui: float):
-    """Sends SUI payment."""
-    amount_mist = int(amount_sui * 1_000_000_000)
+def get_cached_balance(address: str) -> float:
+    """Cached get_sui_balance. Serves a stale value while refreshing in the background."""
+    return _reads.get(("balance", address), lambda: _fetch_balance(address), ttl=BALANCE_TTL,
+                      stale_ttl=BALANCE_STALE_TTL, default=0.0, timeout=CHAIN_READ_TIMEOUT)
+
+def get_wallet_snapshot(address: str) -> Tuple[float, float, float]:
+    """(balance, price, 24h change %) for the wallet view. Cold reads run concurrently."""
+    _reads.prefetch("market", _fetch_market_data, MARKET_TTL)
+    _reads.prefetch(("balance", address), lambda: _fetch_balance(address), BALANCE_TTL)
+    price, change_pct = get_cached_market_data()
+    return get_cached_balance(address), price, change_pct
+
+async def _fetch_total_balance_async(client: AsyncClient, address: str) -> float:
+    async with _rpc_slots:
+        result = await client.execute(GetCoinTypeBalance(owner=SuiAddress(address)))
+    if not result.is_ok():
+        raise RuntimeError(result.result_string)
+    return int(result.result_data.total_balance) / 1_000_000_000
+
+async def get_balances_async(addresses: Iterable[str], concurrency: int = SUI_BATCH_CONCURRENCY) -> Tuple[Dict[str, float], Dict[str, str]]:
+    """Fetches many balances concurrently, at most `concurrency` at a time.
+    Returns (balances, errors), each keyed by address. Successful reads also refresh the balance cache."""
+    addresses = list(dict.fromkeys(addresses))
+    balances, errors = {}, {}
     try:
-        cfg = SuiConfig.user_config(prv_keys=[sender_priv_key], rpc_url=SUI_RPC_URL)
-        client = SyncClient(cfg)
-        txn = SyncTransaction(client=client)
+        client = await _async_client()
+    except Exception as e:
+        return balances, {a: str(e) for a in addresses}
+    slots = asyncio.Semaphore(concurrency)
+
+    async def fetch(address):
+        async with slots:
+            try:
+                balances[address] = await _fetch_total_balance_async(client, address)
+                _reads.put(("balance", address), balances[address])
+            except Exception as e:
+                errors[address] = str(e) or type(e).__name__
+
+    await asyncio.gather(*(fetch(a) for a in addresses))
+    return balances, errors
+
+def get_balances(addresses: Iterable[str], concurrency: int = SUI_BATCH_CONCURRENCY) -> Tuple[Dict[str, float], Dict[str, str]]:
+    """Blocking get_balances_async, run on the shared RPC loop."""
+    return run_async(get_balances_async(addresses, concurrency))
+
+def invalidate_balance(*addresses: str):
+    """Drops cached balances, e.g. after a transfer touching these addresses."""
+    for address in addresses: _reads.invalidate(("balance", address))
+
+def _tx_outcome(result) -> Tuple[bool, str]:
+    if result.is_ok():
+        digest = result.result_data.digest if hasattr(result.result_data, 'digest') else "Unknown Digest"
+        return True, digest
+    return False, result.result_string
+
+# --- QUEUED TRANSFERS (see txqueue.py) ---
+MIST_PER_SUI = 1_000_000_000
+GAS_BUDGET_MIST = 5_000_000
+
+class InsufficientFunds(Exception):
+    pass
+
+def to_mist(amount_sui: float) -> int:
+    return int(round(amount_sui * MIST_PER_SUI))
+
+def pick_gas_coin(address: str, need_mist: int) -> Optional[str]:
+    """Returns the largest SUI coin's object id if it alone covers need_mist, else None
+    (the SDK then merges coins). Raises InsufficientFunds if the whole balance is short."""
+    result = get_client().get_gas(SuiAddress(address), fetch_all=True)
+    if not result.is_ok():
+        raise RuntimeError(result.result_string)
+    coins = result.result_data.data
+    total = sum(int(c.balance) for c in coins)
+    if total < need_mist:
+        raise InsufficientFunds(f"Balance {total / MIST_PER_SUI:.4f} SUI is below the {need_mist / MIST_PER_SUI:.4f} SUI needed")
+    best = max(coins, key=lambda c: int(c.balance))
+    return best.coin_object_id if int(best.balance) >= need_mist else None
+
+def build_transfer(sender_priv_key: str, transfers: List[Tuple[str, int]]) -> SyncTransaction:
+    """One transaction paying each (recipient_address, amount_mist) from the sender's gas coin."""
+    txn = SyncTransaction(client=get_client(SyncClient, sender_priv_key))
+    for recipient_addr, amount_mist in transfers:
         split_coin = txn.split_coin(coin=txn.gas, amounts=[SuiInteger(amount_mist)])
         txn.transfer_objects(transfers=[split_coin], recipient=SuiAddress(recipient_addr))
-        result = txn.execute(gas_budget="5000000")
-        if result.is_ok():
-            digest = result.result_data.digest if hasattr(result.result_data, 'digest') else "Unknown Digest"
-            return True, digest
-        else:
-            return False, result.result_string
-    except Exception as e:
-        return False, str(e)
-    
+    return txn
+
+def execute_transfer(txn: SyncTransaction, gas_object: Optional[str] = None, gas_budget: int = GAS_BUDGET_MIST) -> Tuple[bool, str]:
+    """Signs and submits txn. Returns (ok, digest_or_error) when the node answered;
+    transport errors propagate because the transaction may or may not have landed."""
+    return _tx_outcome(txn.execute(gas_budget=str(gas_budget), use_gas_object=gas_object))
+
+def _fetch_market_data():
+    """Fetches current SUI price and 24h change. Raises on errors."""
+    url = "https://api.binance.com/api/v3/ticker/24hr?symbol=SUIUSDT"
+    response = requests.get(url, timeout=5)
+    data = response.json()
+    return float(data['lastPrice']), float(data['priceChangePercent'])
+
 def get_sui_market_data():
     """Fetches current SUI price."""
     try:
-        url = "https://api.binance.com/api/v3/ticker/24hr?symbol=SUIUSDT"
-        response = requests.get(url, timeout=5)
-        data = response.json()
-        return float(data['lastPrice']), float(data['priceChangePercent'])
+        return _fetch_market_data()
     except:
         return 1.56, 2.22
+
+def get_cached_market_data():
+    """Cached get_sui_market_data, shared by all sessions."""
+    return _reads.get("market", _fetch_market_data, ttl=MARKET_TTL, stale_ttl=MARKET_STALE_TTL,
+                      default=(1.56, 2.22), timeout=CHAIN_READ_TIMEOUT)
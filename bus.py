@@ -0,0 +1,21 @@
+"""In-process pub/sub of per-topic version counters.
+
+Writers call publish(topic) after committing; readers compare version(topic)
+with the last version they saw and only go to the database when it moved.
+The bus is per process, so readers should still resync from the database now
+and then to pick up writes made by other processes.
+"""
+import threading
+from typing import Hashable
+
+_versions = {}
+_lock = threading.Lock()
+
+def publish(topic: Hashable) -> int:
+    """Bumps the topic's version. Returns the new version."""
+    with _lock:
+        _versions[topic] = _versions.get(topic, 0) + 1
+        return _versions[topic]
+
+def version(topic: Hashable) -> int:
+    return _versions.get(topic, 0)
@@ -0,0 +1,134 @@
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+
+class LRUCache:
+    """Thread-safe LRU cache bounded by the total size of its values, shared by every session in the process."""
+
+    def __init__(self, max_bytes: int, sizeof=len):
+        self.max_bytes = max_bytes
+        self._sizeof = sizeof
+        self._data = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key][0]
+            self.misses += 1
+            return default
+
+    def put(self, key, value):
+        size = self._sizeof(value)
+        if size > self.max_bytes: return
+        with self._lock:
+            if key in self._data: self._bytes -= self._data.pop(key)[1]
+            self._data[key] = (value, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, (_, evicted) = self._data.popitem(last=False)
+                self._bytes -= evicted
+                self.evictions += 1
+
+    def invalidate(self, key):
+        with self._lock:
+            if key in self._data: self._bytes -= self._data.pop(key)[1]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"entries": len(self._data), "bytes": self._bytes, "max_bytes": self.max_bytes, "hits": self.hits, "misses": self.misses, "evictions": self.evictions}
+
+
+class TTLCache:
+    """Process-wide cache for slow remote reads.
+
+    Each get() names its own TTL. Within the TTL the cached value is returned;
+    for stale_ttl seconds after that the stale value is returned while one
+    background refresh runs. Concurrent misses for a key share a single load
+    (single-flight). Failed loads are not cached; callers get the last known
+    value if any, else the default."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._inflight = {}
+        self.hits = self.stale_hits = self.misses = self.errors = 0
+
+    def _load(self, key, loader, future: Future):
+        try:
+            value = loader()
+        except Exception as e:
+            with self._lock:
+                self.errors += 1
+                self._inflight.pop(key, None)
+            future.set_exception(e)
+            return
+        with self._lock:
+            self._entries[key] = (value, time.monotonic())
+            self._inflight.pop(key, None)
+        future.set_result(value)
+
+    def get(self, key, loader, ttl: float, stale_ttl: float = 0.0, default=None, timeout=None):
+        """Returns the cached value for key, loading it with loader() when needed.
+        timeout bounds how long a cold miss waits; the load keeps running in the background."""
+        now = time.monotonic()
+        start_refresh = leader = False
+        with self._lock:
+            entry = self._entries.get(key)
+            age = now - entry[1] if entry else None
+            if entry and age < ttl:
+                self.hits += 1
+                return entry[0]
+            future = self._inflight.get(key)
+            if future is None:
+                future = Future()
+                self._inflight[key] = future
+                leader = True
+            if entry and age < ttl + stale_ttl:
+                self.stale_hits += 1
+                start_refresh = leader
+            else:
+                self.misses += 1
+        if start_refresh:
+            threading.Thread(target=self._load, args=(key, loader, future), daemon=True).start()
+            return entry[0]
+        if entry and age < ttl + stale_ttl:
+            return entry[0]
+        if leader:
+            if timeout is None: self._load(key, loader, future)
+            else: threading.Thread(target=self._load, args=(key, loader, future), daemon=True).start()
+        try:
+            return future.result(timeout=timeout)
+        except (Exception, FutureTimeout):
+            return entry[0] if entry else default
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic())
+
+    def prefetch(self, key, loader, ttl: float):
+        """Starts a background load for key unless it is fresh or already loading."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if (entry and time.monotonic() - entry[1] < ttl) or key in self._inflight:
+                return
+            future = self._inflight[key] = Future()
+        threading.Thread(target=self._load, args=(key, loader, future), daemon=True).start()
+
+    def invalidate(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"entries": len(self._entries), "inflight": len(self._inflight), "hits": self.hits, "stale_hits": self.stale_hits, "misses": self.misses, "errors": self.errors}
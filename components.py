@@ -1,14 +1,17 @@
 import streamlit as st
-import os
 import sqlite3
-from typing import List
-from database import get_conn
-from utils import get_image_base64, human_time
-import crud 
+import time
+from typing import List, Optional
+from utils import human_time
+from config import PAGE_SIZE, DEFAULT_AVATAR_URL, CHAT_POLL_INTERVAL, CHAT_RESYNC_INTERVAL, CHAT_WINDOW, TX_STATUS_POLL_INTERVAL
+import bus
+import crud
+import media
+import txqueue
+import indexer
 
 # --- CSS STYLES ---
-def apply_theme():
-    st.markdown("""
+THEME_CSS = """
     <style>
     @import url('https://fonts.googleapis.com/css2?family=Patrick+Hand&display=swap');
     html, body, [class*="css"] { font-family: 'Patrick Hand', cursive, sans-serif; color: #000000; }
@@ -42,11 +45,60 @@ def apply_theme():
     div[data-testid="stFileUploaderDropzone"] svg { fill: black !important; stroke: black !important; }
     section[data-testid="stFileUploader"] button { background-color: #29B6F6 !important; color: black !important; border: 2px solid black !important; box-shadow: 3px 3px 0px 0px black !important; font-weight: 900 !important; text-transform: uppercase; }
     </style>
-    """, unsafe_allow_html=True)
+    """
+
+def apply_theme():
+    # Streamlit rebuilds the page on every rerun, so the stylesheet is re-emitted each time
+    st.markdown(THEME_CSS, unsafe_allow_html=True)
+
+# --- FLASH MESSAGES ---
+def flash(message: str, icon: Optional[str] = None):
+    """Queues a toast for the next run, for messages raised just before st.rerun()."""
+    st.session_state.flash = (message, icon)
+
+def show_flash():
+    message = st.session_state.pop("flash", None)
+    if message: st.toast(message[0], icon=message[1])
 
 # --- POST RENDERING ---
-def render_post(p, key_prefix: str = "default"):
+def render_posts(posts, key_prefix: str = "default"):
+    """Renders a list of posts, hydrating counts and viewer flags in one batch."""
+    user = st.session_state.user
+    meta = crud.hydrate_posts([p['id'] for p in posts], user['id'] if user else None)
+    for p in posts: render_post(p, key_prefix, meta[p['id']])
+
+def avatar_src(path) -> str:
+    """Returns the <img> src for a profile picture, or the default avatar."""
+    return media.image_src(path, "avatar") or DEFAULT_AVATAR_URL
+
+# --- PAGINATION ---
+def load_pages(state_key: str, fetch_page):
+    """Fetches as many pages as the viewer has loaded so far. Returns (rows, next_cursor)."""
+    rows, before = [], None
+    for _ in range(st.session_state.get(state_key, 1)):
+        page = fetch_page(before)
+        rows.extend(page)
+        before = crud.page_cursor(page, PAGE_SIZE)
+        if before is None: break
+    return rows, before
+
+def load_more_button(state_key: str, next_cursor):
+    if next_cursor and st.button("Load more", key=f"{state_key}_more", use_container_width=True):
+        st.session_state[state_key] = st.session_state.get(state_key, 1) + 1
+        st.rerun()
+
+def render_post_pages(state_key: str, fetch_page, key_prefix: str, empty_msg: str):
+    """Renders a cursor-paginated post list with a 'Load more' button. fetch_page(before) returns one page."""
+    posts, next_cursor = load_pages(state_key, fetch_page)
+    if not posts: st.info(empty_msg)
+    render_posts(posts, key_prefix)
+    load_more_button(state_key, next_cursor)
+
+def render_post(p, key_prefix: str = "default", meta: Optional[dict] = None):
     p = dict(p)
+    if meta is None:
+        user = st.session_state.user
+        meta = crud.hydrate_posts([p['id']], user['id'] if user else None)[p['id']]
     st.write("\n")
     
     with st.container(border=True):
@@ -54,11 +106,8 @@ def render_post(p, key_prefix: str = "default"):
         
         # 1. Profile Picture
         with header_cols[0]:
-            img_src = "https://cdn-icons-png.flaticon.com/512/149/149071.png"
-            if p.get('profile_pic_path') and os.path.exists(p['profile_pic_path']):
-                b64 = get_image_base64(p['profile_pic_path'])
-                if b64: img_src = f"data:image/png;base64,{b64}"
-            
+            img_src = avatar_src(p.get('profile_pic_path'))
+
             st.markdown(f"""
                 <div style="width: 55px; height: 55px; border-radius: 50%; overflow: hidden; display: flex; justify-content: center; align-items: center;">
                     <img src="{img_src}" style="width: 100%; height: 100%; object-fit: cover; border: none !important;">
@@ -81,13 +130,10 @@ def render_post(p, key_prefix: str = "default"):
             st.markdown(f"<div style='margin-top: 10px; font-size: 1.4em; line-height: 1.4; color: #000;'>{p['text']}</div>", unsafe_allow_html=True)
         
         # Post Image
-        if p.get('image_path'):
-            abs_path = os.path.abspath(p['image_path'])
-            if os.path.exists(abs_path):
-                b64_str = get_image_base64(abs_path)
-                if b64_str:
-                    html = f"""<div style="width: 100%; margin-top: 10px; border: 3px solid black; box-shadow: 4px 4px 0px 0px black; overflow: hidden;"><img src="data:image/png;base64,{b64_str}" style="width: 100%; height: auto; display: block; object-fit: cover;"></div>"""
-                    st.markdown(html, unsafe_allow_html=True)
+        post_img_src = media.image_src(p.get('image_path'), "feed")
+        if post_img_src:
+            html = f"""<div style="width: 100%; margin-top: 10px; border: 3px solid black; box-shadow: 4px 4px 0px 0px black; overflow: hidden;"><img src="{post_img_src}" loading="lazy" style="width: 100%; height: auto; display: block; object-fit: cover;"></div>"""
+            st.markdown(html, unsafe_allow_html=True)
 
         st.write("") 
         st.write("") 
@@ -97,17 +143,14 @@ def render_post(p, key_prefix: str = "default"):
         post_id = p['id']
         user = st.session_state.user
         
-        liked = False
-        bookmarked = False
-        if user:
-            liked = get_conn().cursor().execute("SELECT 1 FROM likes WHERE user_id = ? AND post_id = ?", (user['id'], post_id)).fetchone() is not None
-            bookmarked = get_conn().cursor().execute("SELECT 1 FROM bookmarks WHERE user_id = ? AND post_id = ?", (user['id'], post_id)).fetchone() is not None
+        liked = meta['liked']
+        bookmarked = meta['bookmarked']
         
         like_icon = "❤️" if liked else "🤍"
         bookmark_icon = "✅" if bookmarked else "🔖"
 
         if user:
-            if row[0].button(f"{like_icon} {crud.get_likes_for_post(post_id)}", key=f"{key_prefix}_like:{post_id}"):
+            if row[0].button(f"{like_icon} {meta['likes']}", key=f"{key_prefix}_like:{post_id}"):
                 if liked: crud.unlike_post(user['id'], post_id)
                 else: crud.like_post(user['id'], post_id)
                 st.rerun()
@@ -119,12 +162,12 @@ def render_post(p, key_prefix: str = "default"):
                 else: crud.bookmark_post(user['id'], post_id)
                 st.rerun()
         else:
-            row[0].write(f"❤️ {crud.get_likes_for_post(post_id)}")
+            row[0].write(f"❤️ {meta['likes']}")
             row[1].write("💬")
             row[2].write("🔖")
             
         if key_prefix != "reply_ctx":
-            replies = crud.get_replies_for_post(post_id)
+            replies = meta['replies']
             if replies:
                 with st.expander(f"{len(replies)} replies"):
                     for r in replies:
@@ -134,12 +177,57 @@ def render_post(p, key_prefix: str = "default"):
     st.markdown("---")
 
 # --- REAL-TIME CHAT ---
-@st.fragment(run_every=2)
+def _chat_key(current_user_id, other_user_id) -> str:
+    topic = crud.conversation_topic(current_user_id, other_user_id)
+    return f"chat:{topic[1]}:{topic[2]}"
+
+def _sync_chat(current_user_id, other_user_id) -> bool:
+    """Brings the conversation window cached in session state up to date; returns True if it changed.
+    Opening a chat loads the latest CHAT_WINDOW messages; after that only messages newer than the last
+    one seen are fetched, and only when the message bus says something changed (or on periodic resync)."""
+    topic = crud.conversation_topic(current_user_id, other_user_id)
+    key = _chat_key(current_user_id, other_user_id)
+    chat = st.session_state.get(key)
+    if chat is None:
+        msgs = [dict(m) for m in crud.get_messages_between(current_user_id, other_user_id, CHAT_WINDOW)]
+        st.session_state[key] = {"version": bus.version(topic), "synced_at": time.time(), "messages": msgs,
+                                 "last_id": msgs[-1]["id"] if msgs else 0, "window": CHAT_WINDOW, "has_older": len(msgs) == CHAT_WINDOW}
+        crud.mark_conversation_read(current_user_id, other_user_id)
+        return True
+    version, now = bus.version(topic), time.time()
+    if version == chat["version"] and now - chat["synced_at"] < CHAT_RESYNC_INTERVAL: return False
+    new = crud.get_messages_since(current_user_id, other_user_id, chat["last_id"])
+    if new:
+        chat["messages"].extend(dict(m) for m in new)
+        chat["last_id"] = new[-1]["id"]
+        if any(m["sender_id"] == other_user_id for m in new): crud.mark_conversation_read(current_user_id, other_user_id)
+        if len(chat["messages"]) > chat["window"]:
+            chat["messages"] = chat["messages"][-chat["window"]:]
+            chat["has_older"] = True
+    chat["version"], chat["synced_at"] = version, now
+    return bool(new)
+
+def _load_older(chat, current_user_id, other_user_id):
+    older = crud.get_messages_between(current_user_id, other_user_id, CHAT_WINDOW, before_id=chat["messages"][0]["id"])
+    chat["messages"] = [dict(m) for m in older] + chat["messages"]
+    chat["window"] += CHAT_WINDOW
+    chat["has_older"] = len(older) == CHAT_WINDOW
+
+@st.fragment(run_every=CHAT_POLL_INTERVAL)
+def _watch_chat(current_user_id, other_user_id):
+    """Renders nothing. Polls the bus and reruns the page only when the open chat got new messages."""
+    if _sync_chat(current_user_id, other_user_id): st.rerun()
+
 def render_realtime_chat(current_user_id, other_user_id, current_user_name, other_user_name):
-    msgs = crud.get_messages_between(current_user_id, other_user_id)
+    _sync_chat(current_user_id, other_user_id)
+    chat = st.session_state[_chat_key(current_user_id, other_user_id)]
+    msgs = chat["messages"]
+    _watch_chat(current_user_id, other_user_id)
     with st.container(height=400, border=True):
         if not msgs: 
             st.caption("No messages yet. Say hi! 👋")
+        if chat["has_older"] and msgs:
+            st.button("Load older", key=f"chat_older_{other_user_id}", on_click=_load_older, args=(chat, current_user_id, other_user_id))
         
         for m in msgs:
             is_me = (m['sender_id'] == current_user_id)
@@ -158,6 +246,45 @@ def render_realtime_chat(current_user_id, other_user_id, current_user_name, othe
                 </div></div>
                 """, unsafe_allow_html=True)
 
+# --- OUTGOING TRANSFERS ---
+TX_STATUS_ICONS = {"queued": "⏳", "sending": "📡", "sent": "✅", "failed": "❌", "unknown": "❓"}
+
+def _transfer_list(txns):
+    st.subheader("Recent Transfers")
+    with st.container(border=True):
+        for t in txns:
+            line = f"{TX_STATUS_ICONS.get(t['status'], '')} **{t['amount_mist'] / 1e9:.4f} SUI** {t['kind']} to `{t['recipient_address'][:10]}…` — {t['status']} · {human_time(t['created_at'])}"
+            if t['digest']: line += f"  \n`{t['digest']}`"
+            elif t['error'] and t['status'] != "sent": line += f"  \n*{t['error']}*"
+            st.markdown(line)
+
+@st.fragment(run_every=TX_STATUS_POLL_INTERVAL)
+def _live_transfers(user_id: int):
+    """Rerenders the list while transfers are in flight; once none are, reruns the page to stop polling."""
+    txns = txqueue.get_txns_for_user(user_id)
+    if not any(t['status'] in txqueue.PENDING for t in txns): st.rerun()
+    _transfer_list(txns)
+
+def render_transfers(user_id: int):
+    """Recent queued transfers. Statuses update live only while one is queued or sending."""
+    txns = txqueue.get_txns_for_user(user_id)
+    if not txns: return
+    if any(t['status'] in txqueue.PENDING for t in txns): _live_transfers(user_id)
+    else: _transfer_list(txns)
+
+def render_chain_activity(address: str):
+    """On-chain history of a wallet from the local ledger, with 'Load more'."""
+    rows, next_cursor = load_pages("pages:chain_activity", lambda before: indexer.get_history(address, PAGE_SIZE, before))
+    if not rows: return
+    st.subheader("Activity")
+    with st.container(border=True):
+        for a in rows:
+            sign, direction = ("+", "from") if a['amount_mist'] > 0 else ("", "to")
+            who = f"@{a['counterparty_username']}" if a['counterparty_username'] else f"`{(a['counterparty'] or '?')[:10]}…`"
+            when = human_time(a['timestamp']) if a['timestamp'] else "pending"
+            st.markdown(f"**{sign}{a['amount_mist'] / 1e9:.4f} SUI** {direction} {who} · {when}  \n`{a['digest']}`")
+    load_more_button("pages:chain_activity", next_cursor)
+
 def render_user_list(title: str, user_list: List[sqlite3.Row]):
     st.header(title)
     if not user_list:
@@ -167,11 +294,7 @@ def render_user_list(title: str, user_list: List[sqlite3.Row]):
         with st.container(border=True):
             cols = st.columns([1, 4, 2])
             with cols[0]:
-                img_src = "https://cdn-icons-png.flaticon.com/512/149/149071.png"
-                if u['profile_pic_path'] and os.path.exists(u['profile_pic_path']):
-                    b64 = get_image_base64(u['profile_pic_path'])
-                    if b64: img_src = f"data:image/png;base64,{b64}"
-                st.image(img_src, width=50)
+                st.markdown(f"""<img src="{avatar_src(u['profile_pic_path'])}" style="width: 50px; height: 50px; object-fit: cover;">""", unsafe_allow_html=True)
             with cols[1]:
                 st.write(f"**{u['display_name']}**")
                 st.caption(f"@{u['username']}")
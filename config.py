@@ -2,13 +2,99 @@ import os
 
 # Database and Paths
 DB_PATH = "twitter_clone.db"
+DB_BUSY_TIMEOUT_MS = 5000
+DB_CACHE_SIZE_KB = 16384
+DB_MMAP_SIZE = 128 * 1024 * 1024
+DB_POOL_MAX_IDLE = 8
+
+# Home timeline. When enabled, create_post fans each post out to its author's
+# followers; accounts above the follower cap are pulled at read time instead.
+# After toggling or changing the cap, run `python manage.py rebuild-timelines`.
+TIMELINE_ENABLED = True
+TIMELINE_FANOUT_MAX_FOLLOWERS = 5000
+TIMELINE_BACKFILL_POSTS = 200
+
+# Rows per page for cursor-paginated lists
+PAGE_SIZE = 20
+# Search ranks only this many of the newest matches, so latency doesn't grow with the corpus
+SEARCH_CANDIDATES = 1000
+
+# Chat: how often an open chat checks the in-process message bus (cheap), and
+# how often it rereads the database anyway to catch writes from other processes.
+# The chat only re-renders when one of those finds new messages.
+CHAT_POLL_INTERVAL = 2
+CHAT_RESYNC_INTERVAL = 30
+CHAT_WINDOW = 50              # messages shown per window; "Load older" adds another
+
 UPLOAD_DIR = "uploads"
 PROFILE_PIC_DIR = os.path.join(UPLOAD_DIR, "profiles")
 POST_IMAGE_DIR = os.path.join(UPLOAD_DIR, "posts")
 
+# Content-addressed image store. Originals live in MEDIA_DIR as <sha256>.<ext>;
+# resized variants go to Streamlit's static folder and are served from MEDIA_URL_PREFIX.
+MEDIA_DIR = os.path.join(UPLOAD_DIR, "media")
+MEDIA_STATIC_DIR = os.path.join("static", "media")
+MEDIA_URL_PREFIX = "app/static/media"
+# name -> (width, height); a None height keeps the aspect ratio, otherwise the image is center-cropped
+MEDIA_VARIANTS = {"avatar": (256, 256), "feed": (1280, None)}
+MEDIA_QUALITY = 82
+DEFAULT_AVATAR_URL = "https://cdn-icons-png.flaticon.com/512/149/149071.png"
+
+# Process-wide cache of base64-encoded images (legacy uploads rendered inline)
+IMAGE_CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+# Process-wide cache of public user profiles, by id (crud.get_user_by_id)
+USER_CACHE_MAX_ENTRIES = 10000
+
 # Blockchain Config
 SUI_RPC_URL = "https://fullnode.mainnet.sui.io:443"
+SUI_CLIENT_POOL_MAX = 64      # cached RPC clients (one per signer plus shared readers)
+SUI_MAX_CONCURRENT_RPC = 16   # in-flight requests on the async RPC loop
+SUI_BATCH_CONCURRENCY = 8     # per-batch limit for get_balances()
+
+# Outgoing transaction queue (txqueue.py)
+TXQUEUE_WORKERS = 4
+TXQUEUE_MAX_ATTEMPTS = 5
+TXQUEUE_BACKOFF_BASE = 2.0    # seconds, doubled per attempt
+TXQUEUE_BACKOFF_MAX = 120.0
+TXQUEUE_POLL_INTERVAL = 1.0
+TX_STATUS_POLL_INTERVAL = 2   # seconds between status refreshes of a user's in-flight transfers
+TIP_BATCH_WINDOW = 3.0        # seconds a tip waits for others from the same sender
+TIP_BATCH_MAX = 50            # tips per programmable transaction block
+TIP_BATCH_GAS_PER_TRANSFER = 2_000_000  # extra gas budget (MIST) per additional tip
+
+# Notification writer (notifier.py): events are buffered this long and written in one transaction
+NOTIFY_BATCH_WINDOW = 0.2
+NOTIFY_BATCH_MAX = 500
+
+# Pre-derived wallet pool (walletpool.py). Refilled to the target from a process
+# pool whenever it drops below the low-water mark.
+WALLET_POOL_ENABLED = True
+WALLET_POOL_LOW_WATER = 20
+WALLET_POOL_TARGET = 100
+WALLET_POOL_PROCESSES = 2
+WALLET_POOL_CHUNK = 10
+WALLET_POOL_CHECK_INTERVAL = 30
+
+# Bulk importer (importer.py / manage.py import)
+IMPORT_BATCH_ROWS = 20000     # rows per executemany + commit
+IMPORT_WALLET_CHUNK = 250     # wallets per process-pool task
+
+# On-chain ledger indexer (indexer.py)
+INDEXER_ENABLED = True
+INDEXER_INTERVAL = 60         # seconds between sweeps; wallets with recent activity are synced on each
+INDEXER_IDLE_AFTER = 86400    # a wallet with no activity for this long counts as idle
+INDEXER_IDLE_INTERVAL = 900   # seconds between syncs of an idle wallet
+INDEXER_PAGE_SIZE = 50
+
+# Chain/market read cache (seconds). Stale values are served while a refresh runs.
+BALANCE_TTL = 15
+BALANCE_STALE_TTL = 300
+MARKET_TTL = 60
+MARKET_STALE_TTL = 900
+CHAIN_READ_TIMEOUT = 3
 
-# Create directories on load
-os.makedirs(PROFILE_PIC_DIR, exist_ok=True)
-os.makedirs(POST_IMAGE_DIR, exist_ok=True)
+def ensure_dirs():
+    """Creates the upload and media directories. Called once at startup."""
+    for path in (PROFILE_PIC_DIR, POST_IMAGE_DIR, MEDIA_DIR, MEDIA_STATIC_DIR):
+        os.makedirs(path, exist_ok=True)
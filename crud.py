@@ -1,67 +1,169 @@
+import json
+import re
 import sqlite3
-from typing import List, Optional
-from database import get_conn
+from typing import Dict, List, Optional, Tuple
+import bus
+import database
+import notifier
+import walletpool
+from database import get_conn, transaction, REBUILD_STATS, REBUILD_SEARCH
+from cache import LRUCache
 from utils import hash_password, now_ts
 from blockchain import generate_new_wallet
+from config import TIMELINE_ENABLED, TIMELINE_FANOUT_MAX_FOLLOWERS, TIMELINE_BACKFILL_POSTS, PAGE_SIZE, CHAT_WINDOW, USER_CACHE_MAX_ENTRIES, SEARCH_CANDIDATES
+
+# Max bound parameters per IN (...) list; stays under SQLite's historical 999 limit.
+SQL_IN_CHUNK = 500
+
+# Keyset pagination. Paged queries return sort_key/sort_id columns and accept
+# before=(sort_key, sort_id) to continue strictly after the previous page.
+Cursor = Tuple[float, int]
+_FIRST_PAGE = (float("inf"), 0)
+
+# Columns safe to cache and hand to views. Password hashes and wallet secrets are read separately when needed.
+PUBLIC_USER_FIELDS = "id, username, display_name, bio, profile_pic_path, created_at, wallet_address"
+# Profiles by id and ids by username. Per process; update_user_details invalidates its own entry.
+_profiles = LRUCache(USER_CACHE_MAX_ENTRIES, sizeof=lambda profile: 1)
+_usernames = LRUCache(USER_CACHE_MAX_ENTRIES, sizeof=lambda user_id: 1)
+
+_SEARCH_TOKEN = re.compile(r"[#@]?\w+")
+
+def _fts_query(term: str, tags: bool = True) -> str:
+    """Builds an FTS5 prefix query from free text. Plain words also match #word and @word."""
+    parts = []
+    for token in _SEARCH_TOKEN.findall(term.lower()):
+        if token[0] in "#@": parts.append(f'"{token}"*' if tags else f'"{token[1:]}"*')
+        elif tags: parts.append(f'("{token}"* OR "#{token}"* OR "@{token}"*)')
+        else: parts.append(f'"{token}"*')
+    return " AND ".join(parts)
+
+def _like_prefix(prefix: str) -> str:
+    """A LIKE pattern matching strings that start with prefix. Use with ESCAPE '\\'."""
+    return prefix.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+
+def page_cursor(rows, limit: int = PAGE_SIZE) -> Optional[Cursor]:
+    """Returns the cursor for the page after rows, or None if rows was the last page."""
+    if len(rows) < limit: return None
+    return (rows[-1]["sort_key"], rows[-1]["sort_id"])
+
+def _bump_post_stat(conn, post_id: int, column: str, delta: int):
+    conn.execute(f"INSERT INTO post_stats (post_id, {column}) VALUES (?, ?) ON CONFLICT(post_id) DO UPDATE SET {column} = {column} + excluded.{column}", (post_id, delta))
+
+def _bump_user_stat(conn, user_id: int, column: str, delta: int):
+    conn.execute(f"INSERT INTO user_stats (user_id, {column}) VALUES (?, ?) ON CONFLICT(user_id) DO UPDATE SET {column} = {column} + excluded.{column}", (user_id, delta))
+
+def _is_pulled_author(conn, user_id: int) -> bool:
+    """True for accounts whose posts are merged into feeds at read time instead of fanned out."""
+    return conn.execute("SELECT 1 FROM timeline_pull_authors WHERE user_id = ?", (user_id,)).fetchone() is not None
+
+def _fan_out(conn, user_id: int, post_id: int, created_at: float):
+    """Writes a new post into its author's timeline and, below the follower cap, every follower's."""
+    conn.execute("INSERT OR IGNORE INTO timeline (user_id, created_at, post_id, author_id) VALUES (?, ?, ?, ?)", (user_id, created_at, post_id, user_id))
+    row = conn.execute("SELECT follower_count FROM user_stats WHERE user_id = ?", (user_id,)).fetchone()
+    if row and row["follower_count"] > TIMELINE_FANOUT_MAX_FOLLOWERS:
+        conn.execute("INSERT OR IGNORE INTO timeline_pull_authors (user_id) VALUES (?)", (user_id,))
+    else:
+        conn.execute("INSERT OR IGNORE INTO timeline (user_id, created_at, post_id, author_id) SELECT follower_id, ?, ?, ? FROM follows WHERE followed_id = ?", (created_at, post_id, user_id, user_id))
 
 # --- USERS ---
 def create_user(username: str, display_name: str, password: str, bio: str = "", profile_pic_path: Optional[str] = None) -> Optional[int]:
-    conn = get_conn()
-    c = conn.cursor()
-    wallet_addr, priv_key, mnemonic = generate_new_wallet()
     try:
-        c.execute(
-            """INSERT INTO users (username, display_name, password_hash, bio, profile_pic_path, created_at, wallet_address, private_key, mnemonic) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""",
-            (username, display_name, hash_password(password), bio, profile_pic_path, now_ts(), wallet_addr, priv_key, mnemonic),
-        )
-        conn.commit()
+        with transaction() as conn:
+            wallet_addr, priv_key, mnemonic = walletpool.claim(conn) or generate_new_wallet()
+            c = conn.cursor()
+            c.execute(
+                """INSERT INTO users (username, display_name, password_hash, bio, profile_pic_path, created_at, wallet_address, private_key, mnemonic) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                (username, display_name, hash_password(password), bio, profile_pic_path, now_ts(), wallet_addr, priv_key, mnemonic),
+            )
         return c.lastrowid
     except sqlite3.IntegrityError:
         return None
 
 def authenticate(username: str, password: str) -> Optional[dict]:
     c = get_conn().cursor()
-    c.execute("SELECT * FROM users WHERE username = ?", (username,))
+    c.execute("SELECT id, password_hash FROM users WHERE username = ?", (username,))
     row = c.fetchone()
     if not row: return None
-    if row["password_hash"] == hash_password(password): return dict(row)
+    if row["password_hash"] == hash_password(password): return get_user_by_id(row["id"])
     return None
 
 def get_user_by_id(user_id: int) -> Optional[dict]:
-    c = get_conn().cursor()
-    c.execute("SELECT * FROM users WHERE id = ?", (user_id,))
-    row = c.fetchone()
-    return dict(row) if row else None
+    """Public profile fields of a user (no password hash or wallet secrets), from the profile cache."""
+    profile = _profiles.get(user_id)
+    if profile is None:
+        row = get_conn().execute(f"SELECT {PUBLIC_USER_FIELDS} FROM users WHERE id = ?", (user_id,)).fetchone()
+        if not row: return None
+        profile = dict(row)
+        _profiles.put(user_id, profile)
+        _usernames.put(profile["username"], user_id)
+    return dict(profile)
 
 def get_user_by_username(username: str) -> Optional[dict]:
-    c = get_conn().cursor()
-    c.execute("SELECT * FROM users WHERE username = ?", (username,))
-    row = c.fetchone()
-    return dict(row) if row else None
+    user_id = _usernames.get(username)
+    if user_id is None:
+        row = get_conn().execute("SELECT id FROM users WHERE username = ?", (username,)).fetchone()
+        if not row: return None
+        user_id = row["id"]
+        _usernames.put(username, user_id)
+    return get_user_by_id(user_id)
+
+def get_wallet_secrets(user_id: int) -> Optional[sqlite3.Row]:
+    """(private_key, mnemonic) of a user's custodial wallet. Never cached; load only when they're shown or used."""
+    return get_conn().execute("SELECT private_key, mnemonic FROM users WHERE id = ?", (user_id,)).fetchone()
 
 def update_user_details(user_id: int, display_name: str, bio: str, new_pic_path: Optional[str] = None):
-    conn = get_conn()
-    c = conn.cursor()
-    if new_pic_path:
-        c.execute("UPDATE users SET display_name = ?, bio = ?, profile_pic_path = ? WHERE id = ?", (display_name, bio, new_pic_path, user_id))
-    else:
-        c.execute("UPDATE users SET display_name = ?, bio = ? WHERE id = ?", (display_name, bio, user_id))
-    conn.commit()
+    with transaction() as conn:
+        c = conn.cursor()
+        if new_pic_path:
+            c.execute("UPDATE users SET display_name = ?, bio = ?, profile_pic_path = ? WHERE id = ?", (display_name, bio, new_pic_path, user_id))
+        else:
+            c.execute("UPDATE users SET display_name = ?, bio = ? WHERE id = ?", (display_name, bio, user_id))
+    _profiles.invalidate(user_id)
     return get_user_by_id(user_id)
 
-def search_users(term: str) -> List[sqlite3.Row]:
+def get_wallet_addresses() -> List[sqlite3.Row]:
+    """(id, username, wallet_address) for every user with a wallet."""
+    return get_conn().execute("SELECT id, username, wallet_address FROM users WHERE wallet_address IS NOT NULL AND wallet_address != '' ORDER BY id").fetchall()
+
+def search_usernames(prefix: str, limit: int = 8, exclude_id: Optional[int] = None) -> List[sqlite3.Row]:
+    """Usernames starting with prefix (ASCII case-insensitive), for typeahead. LIKE walks idx_users_username_nocase."""
+    if not prefix: return []
     c = get_conn().cursor()
-    q = f"%{term}%"
-    c.execute("SELECT * FROM users WHERE username LIKE ? OR display_name LIKE ? LIMIT 50", (q, q))
+    c.execute("SELECT id, username, display_name, profile_pic_path FROM users WHERE username LIKE ? ESCAPE '\\' AND id != ? ORDER BY username COLLATE NOCASE LIMIT ?",
+              (_like_prefix(prefix), exclude_id or 0, limit))
+    return c.fetchall()
+
+def search_users(term: str, limit=PAGE_SIZE, before: Optional[Cursor] = None) -> List[sqlite3.Row]:
+    """Usernames starting with the term come first, shortest (an exact match) first, from a range scan
+    on idx_users_username_nocase. The other matches follow, ranked by prefix match with usernames
+    weighted above display names; like search_posts, that ranking covers the newest SEARCH_CANDIDATES."""
+    query = _fts_query(term, tags=False)
+    if not query: return []
+    c = get_conn().cursor()
+    c.execute("""
+        WITH named AS (
+            SELECT id, 1e9 - length(username) AS sort_key FROM users
+            WHERE username LIKE :prefix ESCAPE '\\' ORDER BY username COLLATE NOCASE LIMIT :candidates
+        ), ranked AS (
+            SELECT rowid AS id, -bm25(users_fts, 10.0, 1.0) AS sort_key FROM users_fts
+            WHERE users_fts MATCH :query ORDER BY rowid DESC LIMIT :candidates
+        )
+        SELECT u.id, u.username, u.display_name, u.bio, u.profile_pic_path, m.sort_key, u.id AS sort_id
+        FROM (SELECT * FROM named UNION ALL SELECT * FROM ranked WHERE id NOT IN (SELECT id FROM named)) m
+        JOIN users u ON u.id = m.id
+        WHERE (m.sort_key, u.id) < (:sort_key, :sort_id) ORDER BY m.sort_key DESC, u.id DESC LIMIT :limit
+    """, {"prefix": _like_prefix(term.strip().lstrip("@")), "query": query, "candidates": SEARCH_CANDIDATES,
+          "sort_key": (before or _FIRST_PAGE)[0], "sort_id": (before or _FIRST_PAGE)[1], "limit": limit})
     return c.fetchall()
 
 # --- POSTS ---
 def create_post(user_id: int, text: str, image_path: Optional[str] = None, orig_post_id: Optional[int] = None) -> int:
-    conn = get_conn()
-    c = conn.cursor()
-    c.execute("INSERT INTO posts (user_id, text, image_path, created_at, orig_post_id) VALUES (?, ?, ?, ?, ?)", (user_id, text, image_path, now_ts(), orig_post_id))
-    post_id = c.lastrowid
-    conn.commit()
+    created_at = now_ts()
+    with transaction() as conn:
+        c = conn.cursor()
+        c.execute("INSERT INTO posts (user_id, text, image_path, created_at, orig_post_id) VALUES (?, ?, ?, ?, ?)", (user_id, text, image_path, created_at, orig_post_id))
+        post_id = c.lastrowid
+        if TIMELINE_ENABLED: _fan_out(conn, user_id, post_id, created_at)
     return post_id
 
 def get_post(post_id: int) -> Optional[sqlite3.Row]:
@@ -69,45 +171,80 @@ def get_post(post_id: int) -> Optional[sqlite3.Row]:
     c.execute("SELECT p.*, u.username, u.display_name, u.profile_pic_path FROM posts p JOIN users u ON p.user_id = u.id WHERE p.id = ?", (post_id,))
     return c.fetchone()
 
-def get_feed(user_id: int, limit=50) -> List[sqlite3.Row]:
+def get_feed(user_id: int, limit=PAGE_SIZE, before: Optional[Cursor] = None) -> List[sqlite3.Row]:
     c = get_conn().cursor()
-    c.execute("SELECT p.*, u.username, u.display_name, u.profile_pic_path FROM posts p JOIN users u ON p.user_id = u.id WHERE p.user_id IN (SELECT followed_id FROM follows WHERE follower_id = ?) OR p.user_id = ? ORDER BY p.created_at DESC LIMIT ?", (user_id, user_id, limit))
+    before = before or _FIRST_PAGE
+    if not TIMELINE_ENABLED:
+        c.execute("SELECT p.*, u.username, u.display_name, u.profile_pic_path, p.created_at AS sort_key, p.id AS sort_id FROM posts p JOIN users u ON p.user_id = u.id WHERE (p.user_id IN (SELECT followed_id FROM follows WHERE follower_id = ?) OR p.user_id = ?) AND (p.created_at, p.id) < (?, ?) ORDER BY p.created_at DESC, p.id DESC LIMIT ?", (user_id, user_id, *before, limit))
+        return c.fetchall()
+    c.execute("SELECT p.*, u.username, u.display_name, u.profile_pic_path, t.created_at AS sort_key, t.post_id AS sort_id FROM timeline t JOIN posts p ON p.id = t.post_id JOIN users u ON p.user_id = u.id WHERE t.user_id = ? AND (t.created_at, t.post_id) < (?, ?) ORDER BY t.created_at DESC, t.post_id DESC LIMIT ?", (user_id, *before, limit))
+    pushed = c.fetchall()
+    # Hybrid pull: posts of followed accounts above the fan-out cap are not in the timeline table.
+    # Each pulled author contributes at most one page, read off idx_posts_user_created.
+    c.execute("""
+        SELECT p.*, u.username, u.display_name, u.profile_pic_path, p.created_at AS sort_key, p.id AS sort_id
+        FROM follows f JOIN timeline_pull_authors a ON a.user_id = f.followed_id
+        JOIN posts p ON p.id IN (SELECT id FROM posts WHERE user_id = f.followed_id AND (created_at, id) < (?, ?) ORDER BY created_at DESC, id DESC LIMIT ?)
+        JOIN users u ON p.user_id = u.id
+        WHERE f.follower_id = ? ORDER BY p.created_at DESC, p.id DESC LIMIT ?
+    """, (*before, limit, user_id, limit))
+    pulled = c.fetchall()
+    if not pulled: return pushed
+    merged = {p["id"]: p for p in pushed + pulled}.values()
+    return sorted(merged, key=lambda p: (p["sort_key"], p["sort_id"]), reverse=True)[:limit]
+
+def get_posts_for_user(user_id: int, limit=PAGE_SIZE, before: Optional[Cursor] = None) -> List[sqlite3.Row]:
+    c = get_conn().cursor()
+    c.execute("SELECT p.*, u.username, u.display_name, u.profile_pic_path, p.created_at AS sort_key, p.id AS sort_id FROM posts p JOIN users u ON p.user_id = u.id WHERE p.user_id = ? AND (p.created_at, p.id) < (?, ?) ORDER BY p.created_at DESC, p.id DESC LIMIT ?", (user_id, *(before or _FIRST_PAGE), limit))
     return c.fetchall()
 
-def get_posts_for_user(user_id: int, limit=50) -> List[sqlite3.Row]:
+def get_recent_posts(limit=PAGE_SIZE, before: Optional[Cursor] = None) -> List[sqlite3.Row]:
     c = get_conn().cursor()
-    c.execute("SELECT p.*, u.username, u.display_name, u.profile_pic_path FROM posts p JOIN users u ON p.user_id = u.id WHERE p.user_id = ? ORDER BY p.created_at DESC LIMIT ?", (user_id, limit))
+    c.execute("SELECT p.*, u.username, u.display_name, u.profile_pic_path, p.created_at AS sort_key, p.id AS sort_id FROM posts p JOIN users u ON p.user_id = u.id WHERE (p.created_at, p.id) < (?, ?) ORDER BY p.created_at DESC, p.id DESC LIMIT ?", (*(before or _FIRST_PAGE), limit))
     return c.fetchall()
 
-def search_posts(term: str) -> List[sqlite3.Row]:
+def search_posts(term: str, limit=PAGE_SIZE, before: Optional[Cursor] = None) -> List[sqlite3.Row]:
+    """Ranks posts by bm25 relevance. The cursor is (-bm25 score, id), so pages continue like the time-ordered lists.
+    Only the newest SEARCH_CANDIDATES matches are ranked, read newest-first from the FTS index, so a common
+    term costs the same on a large corpus as on a small one."""
+    query = _fts_query(term)
+    if not query: return []
     c = get_conn().cursor()
-    q = f"%{term}%"
-    c.execute("SELECT p.*, u.username, u.display_name, u.profile_pic_path FROM posts p JOIN users u ON p.user_id = u.id WHERE p.text LIKE ? ORDER BY p.created_at DESC LIMIT 100", (q,))
+    c.execute("""
+        SELECT p.*, u.username, u.display_name, u.profile_pic_path, m.sort_key, p.id AS sort_id
+        FROM (SELECT rowid, -bm25(posts_fts) AS sort_key FROM posts_fts WHERE posts_fts MATCH ? ORDER BY rowid DESC LIMIT ?) m
+        JOIN posts p ON p.id = m.rowid JOIN users u ON p.user_id = u.id
+        WHERE (m.sort_key, p.id) < (?, ?) ORDER BY m.sort_key DESC, p.id DESC LIMIT ?
+    """, (query, SEARCH_CANDIDATES, *(before or _FIRST_PAGE), limit))
     return c.fetchall()
 
 # --- INTERACTIONS ---
 def create_notification(user_id: int, text: str):
-    conn = get_conn()
-    c = conn.cursor()
-    c.execute("INSERT INTO notifications (user_id, text, seen, created_at) VALUES (?, ?, 0, ?)", (user_id, text, now_ts()))
-    conn.commit()
+    """Stores a free-form notification immediately. Interaction events go through notifier.notify."""
+    with transaction() as conn:
+        conn.execute("INSERT INTO notifications (user_id, text, seen, created_at) VALUES (?, ?, 0, ?)", (user_id, text, now_ts()))
+        notifier.bump_unread(conn, user_id)
 
 def follow_user(follower_id: int, followed_id: int) -> bool:
-    conn = get_conn()
-    c = conn.cursor()
     try:
-        c.execute("INSERT INTO follows (follower_id, followed_id, created_at) VALUES (?, ?, ?)", (follower_id, followed_id, now_ts()))
-        conn.commit()
-        create_notification(followed_id, f"@{get_user_by_id(follower_id)['username']} followed you")
+        with transaction() as conn:
+            conn.execute("INSERT INTO follows (follower_id, followed_id, created_at) VALUES (?, ?, ?)", (follower_id, followed_id, now_ts()))
+            _bump_user_stat(conn, followed_id, "follower_count", 1)
+            _bump_user_stat(conn, follower_id, "following_count", 1)
+            if TIMELINE_ENABLED and not _is_pulled_author(conn, followed_id):
+                conn.execute("INSERT OR IGNORE INTO timeline (user_id, created_at, post_id, author_id) SELECT ?, created_at, id, user_id FROM posts WHERE user_id = ? ORDER BY created_at DESC LIMIT ?", (follower_id, followed_id, TIMELINE_BACKFILL_POSTS))
+        notifier.notify(followed_id, "follow", actor_id=follower_id)
         return True
     except sqlite3.IntegrityError:
         return False
 
 def unfollow_user(follower_id: int, followed_id: int):
-    conn = get_conn()
-    c = conn.cursor()
-    c.execute("DELETE FROM follows WHERE follower_id = ? AND followed_id = ?", (follower_id, followed_id))
-    conn.commit()
+    with transaction() as conn:
+        if conn.execute("DELETE FROM follows WHERE follower_id = ? AND followed_id = ?", (follower_id, followed_id)).rowcount:
+            _bump_user_stat(conn, followed_id, "follower_count", -1)
+            _bump_user_stat(conn, follower_id, "following_count", -1)
+            if TIMELINE_ENABLED:
+                conn.execute("DELETE FROM timeline WHERE user_id = ? AND author_id = ?", (follower_id, followed_id))
 
 def is_following(follower_id: int, followed_id: int) -> bool:
     c = get_conn().cursor()
@@ -115,72 +252,68 @@ def is_following(follower_id: int, followed_id: int) -> bool:
     return c.fetchone() is not None
 
 def like_post(user_id: int, post_id: int) -> bool:
-    conn = get_conn()
-    c = conn.cursor()
     try:
-        c.execute("INSERT INTO likes (user_id, post_id, created_at) VALUES (?, ?, ?)", (user_id, post_id, now_ts()))
-        conn.commit()
+        with transaction() as conn:
+            conn.execute("INSERT INTO likes (user_id, post_id, created_at) VALUES (?, ?, ?)", (user_id, post_id, now_ts()))
+            _bump_post_stat(conn, post_id, "like_count", 1)
         post = get_post(post_id)
-        if post: create_notification(post['user_id'], f"@{get_user_by_id(user_id)['username']} liked your post")
+        if post: notifier.notify(post['user_id'], "like", actor_id=user_id, post_id=post_id)
         return True
     except sqlite3.IntegrityError:
         return False
 
 def unlike_post(user_id: int, post_id: int):
-    conn = get_conn()
-    c = conn.cursor()
-    c.execute("DELETE FROM likes WHERE user_id = ? AND post_id = ?", (user_id, post_id))
-    conn.commit()
+    with transaction() as conn:
+        if conn.execute("DELETE FROM likes WHERE user_id = ? AND post_id = ?", (user_id, post_id)).rowcount:
+            _bump_post_stat(conn, post_id, "like_count", -1)
 
 def bookmark_post(user_id: int, post_id: int) -> bool:
-    conn = get_conn()
-    c = conn.cursor()
     try:
-        c.execute("INSERT INTO bookmarks (user_id, post_id, created_at) VALUES (?, ?, ?)", (user_id, post_id, now_ts()))
-        conn.commit()
+        with transaction() as conn:
+            conn.execute("INSERT INTO bookmarks (user_id, post_id, created_at) VALUES (?, ?, ?)", (user_id, post_id, now_ts()))
         return True
     except sqlite3.IntegrityError:
         return False
 
 def unbookmark_post(user_id: int, post_id: int):
-    conn = get_conn()
-    c = conn.cursor()
-    c.execute("DELETE FROM bookmarks WHERE user_id = ? AND post_id = ?", (user_id, post_id))
-    conn.commit()
+    with transaction() as conn:
+        conn.execute("DELETE FROM bookmarks WHERE user_id = ? AND post_id = ?", (user_id, post_id))
 
 def reply_to_post(user_id: int, post_id: int, text: str):
-    conn = get_conn()
-    c = conn.cursor()
-    c.execute("INSERT INTO replies (post_id, user_id, text, created_at) VALUES (?, ?, ?, ?)", (post_id, user_id, text, now_ts()))
-    conn.commit()
+    with transaction() as conn:
+        conn.execute("INSERT INTO replies (post_id, user_id, text, created_at) VALUES (?, ?, ?, ?)", (post_id, user_id, text, now_ts()))
+        _bump_post_stat(conn, post_id, "reply_count", 1)
     post = get_post(post_id)
-    if post: create_notification(post['user_id'], f"@{get_user_by_id(user_id)['username']} replied to your post")
+    if post: notifier.notify(post['user_id'], "reply", actor_id=user_id, post_id=post_id)
 
 # --- DATA GETTERS ---
-def get_liked_posts_for_user(user_id: int) -> List[sqlite3.Row]:
+def get_liked_posts_for_user(user_id: int, limit=PAGE_SIZE, before: Optional[Cursor] = None) -> List[sqlite3.Row]:
     c = get_conn().cursor()
-    c.execute("SELECT p.*, u.username, u.display_name, u.profile_pic_path FROM posts p JOIN users u ON p.user_id = u.id JOIN likes l ON l.post_id = p.id WHERE l.user_id = ? ORDER BY l.created_at DESC", (user_id,))
+    c.execute("SELECT p.*, u.username, u.display_name, u.profile_pic_path, l.created_at AS sort_key, l.rowid AS sort_id FROM likes l JOIN posts p ON l.post_id = p.id JOIN users u ON p.user_id = u.id WHERE l.user_id = ? AND (l.created_at, l.rowid) < (?, ?) ORDER BY l.created_at DESC, l.rowid DESC LIMIT ?", (user_id, *(before or _FIRST_PAGE), limit))
     return c.fetchall()
 
-def get_replies_for_user(user_id: int) -> List[sqlite3.Row]:
+def get_replies_for_user(user_id: int, limit=PAGE_SIZE, before: Optional[Cursor] = None) -> List[sqlite3.Row]:
     c = get_conn().cursor()
-    c.execute("SELECT r.id as reply_id, r.text as reply_text, r.created_at as reply_created_at, p.id as orig_post_id, p.text as orig_text, p.image_path as orig_image, p.created_at as orig_created, u.username as orig_username, u.display_name as orig_display, u.profile_pic_path as orig_pic FROM replies r JOIN posts p ON r.post_id = p.id JOIN users u ON p.user_id = u.id WHERE r.user_id = ? ORDER BY r.created_at DESC", (user_id,))
+    c.execute("SELECT r.id as reply_id, r.text as reply_text, r.created_at as reply_created_at, p.id as orig_post_id, p.text as orig_text, p.image_path as orig_image, p.created_at as orig_created, u.username as orig_username, u.display_name as orig_display, u.profile_pic_path as orig_pic, r.created_at AS sort_key, r.id AS sort_id FROM replies r JOIN posts p ON r.post_id = p.id JOIN users u ON p.user_id = u.id WHERE r.user_id = ? AND (r.created_at, r.id) < (?, ?) ORDER BY r.created_at DESC, r.id DESC LIMIT ?", (user_id, *(before or _FIRST_PAGE), limit))
     return c.fetchall()
 
 def get_likes_for_post(post_id: int) -> int:
     c = get_conn().cursor()
-    c.execute("SELECT COUNT(*) as cnt FROM likes WHERE post_id = ?", (post_id,))
-    return c.fetchone()["cnt"]
+    c.execute("SELECT like_count FROM post_stats WHERE post_id = ?", (post_id,))
+    row = c.fetchone()
+    return row["like_count"] if row else 0
 
 def get_following_count(user_id: int) -> int:
     c = get_conn().cursor()
-    c.execute("SELECT COUNT(followed_id) as cnt FROM follows WHERE follower_id = ?", (user_id,))
-    return c.fetchone()["cnt"]
+    c.execute("SELECT following_count FROM user_stats WHERE user_id = ?", (user_id,))
+    row = c.fetchone()
+    return row["following_count"] if row else 0
 
 def get_follower_count(user_id: int) -> int:
     c = get_conn().cursor()
-    c.execute("SELECT COUNT(follower_id) as cnt FROM follows WHERE followed_id = ?", (user_id,))
-    return c.fetchone()["cnt"]
+    c.execute("SELECT follower_count FROM user_stats WHERE user_id = ?", (user_id,))
+    row = c.fetchone()
+    return row["follower_count"] if row else 0
 
 def get_following_list(user_id: int) -> List[sqlite3.Row]:
     c = get_conn().cursor()
@@ -204,36 +337,187 @@ def get_common_followers(my_id: int, target_id: int) -> List[sqlite3.Row]:
     """, (target_id, my_id))
     return c.fetchall()
 
+def hydrate_posts(post_ids: List[int], viewer_id: Optional[int] = None) -> Dict[int, dict]:
+    """Fetches like counts, replies and the viewer's like/bookmark flags for many posts in a few set-based queries."""
+    ids = list(dict.fromkeys(post_ids))
+    meta = {pid: {"likes": 0, "replies": [], "reply_count": 0, "liked": False, "bookmarked": False} for pid in ids}
+    c = get_conn().cursor()
+    for i in range(0, len(ids), SQL_IN_CHUNK):
+        chunk = ids[i:i + SQL_IN_CHUNK]
+        marks = ",".join("?" * len(chunk))
+        for r in c.execute(f"SELECT post_id, like_count, reply_count FROM post_stats WHERE post_id IN ({marks})", chunk).fetchall():
+            meta[r["post_id"]]["likes"] = r["like_count"]
+            meta[r["post_id"]]["reply_count"] = r["reply_count"]
+        for r in c.execute(f"SELECT r.*, u.username, u.display_name FROM replies r JOIN users u ON r.user_id = u.id WHERE r.post_id IN ({marks}) ORDER BY r.created_at", chunk).fetchall():
+            meta[r["post_id"]]["replies"].append(r)
+        if viewer_id is not None:
+            for r in c.execute(f"SELECT post_id FROM likes WHERE user_id = ? AND post_id IN ({marks})", (viewer_id, *chunk)).fetchall():
+                meta[r["post_id"]]["liked"] = True
+            for r in c.execute(f"SELECT post_id FROM bookmarks WHERE user_id = ? AND post_id IN ({marks})", (viewer_id, *chunk)).fetchall():
+                meta[r["post_id"]]["bookmarked"] = True
+    return meta
+
 def get_replies_for_post(post_id: int) -> List[sqlite3.Row]:
     c = get_conn().cursor()
     c.execute("SELECT r.*, u.username, u.display_name FROM replies r JOIN users u ON r.user_id = u.id WHERE r.post_id = ? ORDER BY r.created_at", (post_id,))
     return c.fetchall()
 
-def get_bookmarks_for_user(user_id: int) -> List[sqlite3.Row]:
+def get_bookmarks_for_user(user_id: int, limit=PAGE_SIZE, before: Optional[Cursor] = None) -> List[sqlite3.Row]:
     c = get_conn().cursor()
-    c.execute("SELECT p.*, u.username, u.display_name, u.profile_pic_path FROM bookmarks b JOIN posts p ON b.post_id = p.id JOIN users u ON p.user_id = u.id WHERE b.user_id = ? ORDER BY b.created_at DESC", (user_id,))
+    c.execute("SELECT p.*, u.username, u.display_name, u.profile_pic_path, b.created_at AS sort_key, b.rowid AS sort_id FROM bookmarks b JOIN posts p ON b.post_id = p.id JOIN users u ON p.user_id = u.id WHERE b.user_id = ? AND (b.created_at, b.rowid) < (?, ?) ORDER BY b.created_at DESC, b.rowid DESC LIMIT ?", (user_id, *(before or _FIRST_PAGE), limit))
     return c.fetchall()
 
 # --- MESSAGING ---
+def conversation_topic(a: int, b: int) -> tuple:
+    """Bus topic for the DM between two users; publishing on it tells open chats to fetch new messages."""
+    return ("dm", min(a, b), max(a, b))
+
+def _conversation_id(conn, a: int, b: int) -> int:
+    lo, hi = min(a, b), max(a, b)
+    conn.execute("INSERT OR IGNORE INTO conversations (user_lo, user_hi) VALUES (?, ?)", (lo, hi))
+    return conn.execute("SELECT id FROM conversations WHERE user_lo = ? AND user_hi = ?", (lo, hi)).fetchone()[0]
+
+def get_conversation(a: int, b: int) -> Optional[sqlite3.Row]:
+    return get_conn().execute("SELECT * FROM conversations WHERE user_lo = ? AND user_hi = ?", (min(a, b), max(a, b))).fetchone()
+
 def send_message(sender_id: int, receiver_id: int, text: str):
-    conn = get_conn()
-    c = conn.cursor()
-    c.execute("INSERT INTO messages (sender_id, receiver_id, text, created_at) VALUES (?, ?, ?, ?)", (sender_id, receiver_id, text, now_ts()))
-    conn.commit()
-    create_notification(receiver_id, f"New message from @{get_user_by_id(sender_id)['username']}")
+    ts = now_ts()
+    with transaction() as conn:
+        cid = _conversation_id(conn, sender_id, receiver_id)
+        cur = conn.execute("INSERT INTO messages (sender_id, receiver_id, text, created_at, conversation_id) VALUES (?, ?, ?, ?, ?)", (sender_id, receiver_id, text, ts, cid))
+        conn.execute("UPDATE conversations SET last_message_id = ?, last_message_at = ? WHERE id = ?", (cur.lastrowid, ts, cid))
+        conn.executemany("""
+            INSERT INTO inbox (user_id, conversation_id, other_id, last_message_at, unread_count) VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT(user_id, conversation_id) DO UPDATE SET last_message_at = excluded.last_message_at, unread_count = unread_count + excluded.unread_count
+        """, [(sender_id, cid, receiver_id, ts, 0), (receiver_id, cid, sender_id, ts, 1 if receiver_id != sender_id else 0)])
+    bus.publish(conversation_topic(sender_id, receiver_id))
+    notifier.notify(receiver_id, "message", actor_id=sender_id)
+
+def get_messages_between(a: int, b: int, limit: int = CHAT_WINDOW, before_id: Optional[int] = None) -> List[sqlite3.Row]:
+    """The latest `limit` messages between a and b older than before_id, oldest first."""
+    conv = get_conversation(a, b)
+    if conv is None: return []
+    c = get_conn().cursor()
+    c.execute("SELECT * FROM messages WHERE conversation_id = ? AND id < ? ORDER BY id DESC LIMIT ?", (conv["id"], before_id or (conv["last_message_id"] or 0) + 1, limit))
+    return c.fetchall()[::-1]
+
+def get_messages_since(a: int, b: int, after_id: int = 0) -> List[sqlite3.Row]:
+    """Messages between a and b with id > after_id, oldest first."""
+    conv = get_conversation(a, b)
+    if conv is None or (conv["last_message_id"] or 0) <= after_id: return []
+    c = get_conn().cursor()
+    c.execute("SELECT * FROM messages WHERE conversation_id = ? AND id > ? ORDER BY id", (conv["id"], after_id))
+    return c.fetchall()
 
-def get_messages_between(a: int, b: int) -> List[sqlite3.Row]:
+def get_inbox(user_id: int, limit=PAGE_SIZE, before: Optional[Cursor] = None) -> List[sqlite3.Row]:
+    """The user's conversations, most recently active first, with the other user and the last message."""
     c = get_conn().cursor()
-    c.execute("SELECT m.*, su.username as sender_name, ru.username as receiver_name FROM messages m JOIN users su ON m.sender_id = su.id JOIN users ru ON m.receiver_id = ru.id WHERE (sender_id = ? AND receiver_id = ?) OR (sender_id = ? AND receiver_id = ?) ORDER BY m.created_at", (a, b, b, a))
+    c.execute("""
+        SELECT i.conversation_id, i.other_id, i.unread_count, i.last_message_at, u.username, u.display_name, u.profile_pic_path,
+               m.text AS last_text, m.sender_id AS last_sender_id, i.last_message_at AS sort_key, i.conversation_id AS sort_id
+        FROM inbox i JOIN users u ON u.id = i.other_id
+        JOIN conversations c ON c.id = i.conversation_id LEFT JOIN messages m ON m.id = c.last_message_id
+        WHERE i.user_id = ? AND (i.last_message_at, i.conversation_id) < (?, ?)
+        ORDER BY i.last_message_at DESC, i.conversation_id DESC LIMIT ?
+    """, (user_id, *(before or _FIRST_PAGE), limit))
     return c.fetchall()
 
+def get_unread_message_count(user_id: int) -> int:
+    """Unread messages across all conversations, for the sidebar badge."""
+    return get_conn().execute("SELECT COALESCE(SUM(unread_count), 0) FROM inbox WHERE user_id = ?", (user_id,)).fetchone()[0]
+
+def mark_conversation_read(user_id: int, other_id: int):
+    conv = get_conversation(user_id, other_id)
+    if conv is None: return
+    with transaction() as conn:
+        conn.execute("UPDATE inbox SET unread_count = 0 WHERE user_id = ? AND conversation_id = ? AND unread_count > 0", (user_id, conv["id"]))
+
+NOTIFICATION_VERBS = {"like": "liked your post", "reply": "replied to your post", "follow": "followed you", "tip": "tipped you"}
+
 def get_notifications(user_id: int) -> List[sqlite3.Row]:
     c = get_conn().cursor()
-    c.execute("SELECT * FROM notifications WHERE user_id = ? ORDER BY created_at DESC LIMIT 200", (user_id,))
+    c.execute("SELECT n.*, u.username AS actor_username FROM notifications n LEFT JOIN users u ON u.id = n.actor_id WHERE n.user_id = ? ORDER BY n.created_at DESC LIMIT 200", (user_id,))
     return c.fetchall()
 
-def mark_notifications_seen(user_id: int):
-    conn = get_conn()
-    c = conn.cursor()
-    c.execute("UPDATE notifications SET seen = 1 WHERE user_id = ?", (user_id,))
-    conn.commit()
+def notification_text(n) -> str:
+    """Formats a row from get_notifications, e.g. '@a and 12 others liked your post'."""
+    if n["kind"] is None: return n["text"]
+    actor, count = f"@{n['actor_username'] or 'someone'}", n["event_count"]
+    if n["kind"] == "message":
+        return f"New message from {actor}" if count == 1 else f"{count} new messages from {actor}"
+    others = f" and {count - 1} other{'s' if count > 2 else ''}" if count > 1 else ""
+    return f"{actor}{others} {NOTIFICATION_VERBS.get(n['kind'], n['kind'])}"
+
+def get_notification_state(user_id: int) -> Tuple[int, int]:
+    """(last_seen_id, unread_count) for the user. O(1): a primary-key lookup."""
+    row = get_conn().execute("SELECT last_seen_id, unread_count FROM notification_state WHERE user_id = ?", (user_id,)).fetchone()
+    return (row["last_seen_id"], row["unread_count"]) if row else (0, 0)
+
+def mark_notifications_seen(user_id: int, up_to_id: int):
+    """Moves the user's watermark to up_to_id (the newest notification they were shown)."""
+    with transaction() as conn:
+        conn.execute("""
+            INSERT INTO notification_state (user_id, last_seen_id, unread_count) VALUES (?, ?, 0)
+            ON CONFLICT(user_id) DO UPDATE SET last_seen_id = excluded.last_seen_id,
+                unread_count = (SELECT COUNT(*) FROM notifications WHERE user_id = excluded.user_id AND id > excluded.last_seen_id)
+            WHERE excluded.last_seen_id > notification_state.last_seen_id
+        """, (user_id, up_to_id))
+
+def prune_notifications(before_ts: float, batch: int = 5000, archive=None) -> int:
+    """Deletes seen notifications last updated before before_ts, in batches so the write lock is held briefly.
+    If archive is a text file, each deleted row is first written to it as a JSON line. Returns the number deleted."""
+    deleted, after_id = 0, 0
+    while True:
+        with transaction() as conn:
+            rows = conn.execute("""
+                SELECT n.* FROM notifications n JOIN notification_state s ON s.user_id = n.user_id
+                WHERE n.id > ? AND n.created_at < ? AND n.id <= s.last_seen_id ORDER BY n.id LIMIT ?
+            """, (after_id, before_ts, batch)).fetchall()
+            if archive is not None:
+                for r in rows: archive.write(json.dumps(dict(r)) + "\n")
+            conn.executemany("DELETE FROM notifications WHERE id = ?", [(r["id"],) for r in rows])
+            # Actors counted in the pruned rows go too; a later like or follow from them notifies afresh
+            conn.executemany("DELETE FROM notification_actors WHERE notification_id = ?", [(r["id"],) for r in rows])
+        deleted += len(rows)
+        if rows: after_id = rows[-1]["id"]
+        if len(rows) < batch: return deleted
+
+# --- DERIVED DATA ---
+def rebuild_stats():
+    """Recomputes post_stats and user_stats from the source tables."""
+    with transaction() as conn:
+        for sql in REBUILD_STATS: conn.execute(sql)
+
+def rebuild_timelines():
+    """Recomputes every home timeline from posts and follows."""
+    with transaction() as conn:
+        database.rebuild_timelines(conn)
+
+def rebuild_search_index():
+    """Rebuilds the posts and users full-text indexes from their content tables."""
+    with transaction() as conn:
+        for sql in REBUILD_SEARCH: conn.execute(sql)
+
+def verify_stats() -> List[dict]:
+    """Returns one entry per counter that disagrees with its source table."""
+    c = get_conn().cursor()
+    drift = []
+    c.execute("""
+        SELECT * FROM (
+            SELECT p.id AS post_id, COALESCE(s.like_count, 0) AS like_count, COALESCE(s.reply_count, 0) AS reply_count,
+                   (SELECT COUNT(*) FROM likes l WHERE l.post_id = p.id) AS actual_likes,
+                   (SELECT COUNT(*) FROM replies r WHERE r.post_id = p.id) AS actual_replies
+            FROM posts p LEFT JOIN post_stats s ON s.post_id = p.id
+        ) WHERE like_count != actual_likes OR reply_count != actual_replies
+    """)
+    drift += [{"post_id": r["post_id"], "stored": (r["like_count"], r["reply_count"]), "actual": (r["actual_likes"], r["actual_replies"])} for r in c.fetchall()]
+    c.execute("""
+        SELECT * FROM (
+            SELECT u.id AS user_id, COALESCE(s.follower_count, 0) AS follower_count, COALESCE(s.following_count, 0) AS following_count,
+                   (SELECT COUNT(*) FROM follows f WHERE f.followed_id = u.id) AS actual_followers,
+                   (SELECT COUNT(*) FROM follows f WHERE f.follower_id = u.id) AS actual_following
+            FROM users u LEFT JOIN user_stats s ON s.user_id = u.id
+        ) WHERE follower_count != actual_followers OR following_count != actual_following
+    """)
+    drift += [{"user_id": r["user_id"], "stored": (r["follower_count"], r["following_count"]), "actual": (r["actual_followers"], r["actual_following"])} for r in c.fetchall()]
+    return drift
@@ -1,18 +1,82 @@
+import atexit
 import sqlite3
-from config import DB_PATH
+import threading
+import time
+from contextlib import contextmanager
+from config import DB_PATH, DB_BUSY_TIMEOUT_MS, DB_CACHE_SIZE_KB, DB_MMAP_SIZE, DB_POOL_MAX_IDLE, TIMELINE_FANOUT_MAX_FOLLOWERS, TIMELINE_BACKFILL_POSTS
 
-def get_conn():
-    """Establishes database connection."""
-    conn = sqlite3.connect(DB_PATH, check_same_thread=False)
+PRAGMAS = (
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    f"PRAGMA cache_size = -{DB_CACHE_SIZE_KB}",
+    f"PRAGMA mmap_size = {DB_MMAP_SIZE}",
+    f"PRAGMA busy_timeout = {DB_BUSY_TIMEOUT_MS}",
+    "PRAGMA temp_store = MEMORY",
+)
+
+# Connections are owned by the thread that checked them out. Streamlit runs each
+# rerun on a short-lived script thread, so connections of finished threads are
+# reaped back into an idle list and handed to the next thread instead of leaking.
+_lock = threading.Lock()
+_owners = {}
+_idle = []
+_db_path = DB_PATH
+
+def configure(db_path: str):
+    """Points the pool at another database file, closing existing connections."""
+    global _db_path
+    close_all()
+    _db_path = db_path
+
+def _connect():
+    """Opens a new tuned database connection."""
+    conn = sqlite3.connect(_db_path, check_same_thread=False, timeout=DB_BUSY_TIMEOUT_MS / 1000)
     conn.row_factory = sqlite3.Row
+    for pragma in PRAGMAS: conn.execute(pragma)
     return conn
 
-def init_db():
-    """Initializes the database tables."""
+def _reap():
+    """Moves connections owned by dead threads back to the idle list. Caller holds _lock."""
+    for thread in [t for t in _owners if not t.is_alive()]:
+        conn = _owners.pop(thread)
+        if conn.in_transaction: conn.rollback()
+        if len(_idle) < DB_POOL_MAX_IDLE: _idle.append(conn)
+        else: conn.close()
+
+def get_conn():
+    """Returns the calling thread's pooled database connection."""
+    thread = threading.current_thread()
+    conn = _owners.get(thread)
+    if conn is not None: return conn
+    with _lock:
+        _reap()
+        conn = _idle.pop() if _idle else _connect()
+        _owners[thread] = conn
+    return conn
+
+def close_all():
+    """Closes every pooled connection."""
+    with _lock:
+        for conn in list(_owners.values()) + _idle: conn.close()
+        _owners.clear()
+        _idle.clear()
+
+atexit.register(close_all)
+
+@contextmanager
+def transaction():
+    """Yields the pooled connection; commits on success and rolls back on error."""
     conn = get_conn()
-    c = conn.cursor()
-    
-    c.execute("""
+    try:
+        yield conn
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+
+# --- SCHEMA ---
+TABLES = [
+    """
     CREATE TABLE IF NOT EXISTS users (
         id INTEGER PRIMARY KEY,
         username TEXT UNIQUE,
@@ -25,14 +89,321 @@ def init_db():
         private_key TEXT,
         mnemonic TEXT
     )
+    """,
+    """CREATE TABLE IF NOT EXISTS posts (id INTEGER PRIMARY KEY, user_id INTEGER, text TEXT, image_path TEXT, created_at REAL, orig_post_id INTEGER DEFAULT NULL, FOREIGN KEY(user_id) REFERENCES users(id))""",
+    """CREATE TABLE IF NOT EXISTS follows (follower_id INTEGER, followed_id INTEGER, created_at REAL, PRIMARY KEY (follower_id, followed_id))""",
+    """CREATE TABLE IF NOT EXISTS likes (user_id INTEGER, post_id INTEGER, created_at REAL, PRIMARY KEY (user_id, post_id))""",
+    """CREATE TABLE IF NOT EXISTS bookmarks (user_id INTEGER, post_id INTEGER, created_at REAL, PRIMARY KEY (user_id, post_id))""",
+    """CREATE TABLE IF NOT EXISTS replies (id INTEGER PRIMARY KEY, post_id INTEGER, user_id INTEGER, text TEXT, created_at REAL, FOREIGN KEY(post_id) REFERENCES posts(id), FOREIGN KEY(user_id) REFERENCES users(id))""",
+    """CREATE TABLE IF NOT EXISTS messages (id INTEGER PRIMARY KEY, sender_id INTEGER, receiver_id INTEGER, text TEXT, created_at REAL, FOREIGN KEY(sender_id) REFERENCES users(id), FOREIGN KEY(receiver_id) REFERENCES users(id))""",
+    """CREATE TABLE IF NOT EXISTS notifications (id INTEGER PRIMARY KEY, user_id INTEGER, text TEXT, seen INTEGER DEFAULT 0, created_at REAL, FOREIGN KEY(user_id) REFERENCES users(id))""",
+]
+
+# Secondary indexes by name. Kept separate so bulk loads can drop and rebuild them.
+INDEXES = {
+    "idx_posts_user_created": "CREATE INDEX IF NOT EXISTS idx_posts_user_created ON posts(user_id, created_at)",
+    "idx_posts_created": "CREATE INDEX IF NOT EXISTS idx_posts_created ON posts(created_at)",
+    "idx_replies_post_created": "CREATE INDEX IF NOT EXISTS idx_replies_post_created ON replies(post_id, created_at)",
+    "idx_replies_user_created": "CREATE INDEX IF NOT EXISTS idx_replies_user_created ON replies(user_id, created_at)",
+    "idx_messages_pair_created": "CREATE INDEX IF NOT EXISTS idx_messages_pair_created ON messages(sender_id, receiver_id, created_at)",
+    "idx_notifications_user_seen_created": "CREATE INDEX IF NOT EXISTS idx_notifications_user_seen_created ON notifications(user_id, seen, created_at)",
+    "idx_notifications_user_created": "CREATE INDEX IF NOT EXISTS idx_notifications_user_created ON notifications(user_id, created_at)",
+    "idx_follows_followed": "CREATE INDEX IF NOT EXISTS idx_follows_followed ON follows(followed_id, follower_id)",
+    "idx_likes_post": "CREATE INDEX IF NOT EXISTS idx_likes_post ON likes(post_id)",
+    "idx_likes_user_created": "CREATE INDEX IF NOT EXISTS idx_likes_user_created ON likes(user_id, created_at)",
+    "idx_bookmarks_user_created": "CREATE INDEX IF NOT EXISTS idx_bookmarks_user_created ON bookmarks(user_id, created_at)",
+}
+
+STATS_TABLES = [
+    """CREATE TABLE IF NOT EXISTS post_stats (post_id INTEGER PRIMARY KEY, like_count INTEGER NOT NULL DEFAULT 0, reply_count INTEGER NOT NULL DEFAULT 0)""",
+    """CREATE TABLE IF NOT EXISTS user_stats (user_id INTEGER PRIMARY KEY, follower_count INTEGER NOT NULL DEFAULT 0, following_count INTEGER NOT NULL DEFAULT 0)""",
+]
+
+# Recomputes the denormalized counters from the source tables.
+REBUILD_STATS = [
+    "DELETE FROM post_stats",
+    """INSERT INTO post_stats (post_id, like_count, reply_count)
+       SELECT p.id, (SELECT COUNT(*) FROM likes l WHERE l.post_id = p.id), (SELECT COUNT(*) FROM replies r WHERE r.post_id = p.id) FROM posts p""",
+    "DELETE FROM user_stats",
+    """INSERT INTO user_stats (user_id, follower_count, following_count)
+       SELECT u.id, (SELECT COUNT(*) FROM follows f WHERE f.followed_id = u.id), (SELECT COUNT(*) FROM follows f WHERE f.follower_id = u.id) FROM users u""",
+]
+
+TIMELINE_TABLES = [
+    """CREATE TABLE IF NOT EXISTS timeline (user_id INTEGER, created_at REAL, post_id INTEGER, author_id INTEGER, PRIMARY KEY (user_id, created_at, post_id)) WITHOUT ROWID""",
+    "CREATE INDEX IF NOT EXISTS idx_timeline_user_author ON timeline(user_id, author_id)",
+    # Authors that have posted while above the fan-out cap. Feeds pull their posts at read time.
+    "CREATE TABLE IF NOT EXISTS timeline_pull_authors (user_id INTEGER PRIMARY KEY)",
+]
+
+def rebuild_timelines(conn):
+    """Refills the timeline table: own posts for everyone, followed posts from fanned-out authors."""
+    conn.execute("DELETE FROM timeline")
+    conn.execute("DELETE FROM timeline_pull_authors")
+    conn.execute("INSERT INTO timeline_pull_authors (user_id) SELECT user_id FROM user_stats WHERE follower_count > ?", (TIMELINE_FANOUT_MAX_FOLLOWERS,))
+    conn.execute("INSERT OR IGNORE INTO timeline (user_id, created_at, post_id, author_id) SELECT p.user_id, p.created_at, p.id, p.user_id FROM posts p")
+    # Followed posts are capped at each author's newest TIMELINE_BACKFILL_POSTS, as follow_user does
+    conn.execute("""
+        INSERT OR IGNORE INTO timeline (user_id, created_at, post_id, author_id)
+        SELECT f.follower_id, p.created_at, p.id, p.user_id
+        FROM follows f JOIN (
+            SELECT id, user_id, created_at, ROW_NUMBER() OVER (PARTITION BY user_id ORDER BY created_at DESC, id DESC) AS n FROM posts
+        ) p ON p.user_id = f.followed_id
+        WHERE p.n <= ? AND f.followed_id NOT IN (SELECT user_id FROM timeline_pull_authors)
+    """, (TIMELINE_BACKFILL_POSTS,))
+
+# Full-text search over external-content FTS5 tables kept in sync by triggers.
+# '#' and '@' are token characters so hashtags and mentions index as whole tokens.
+SEARCH_TABLES = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS posts_fts USING fts5(text, content='posts', content_rowid='id', tokenize="unicode61 tokenchars '#@_'", prefix='2 3')""",
+    """CREATE TRIGGER IF NOT EXISTS posts_fts_ai AFTER INSERT ON posts BEGIN
+        INSERT INTO posts_fts (rowid, text) VALUES (new.id, new.text);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS posts_fts_ad AFTER DELETE ON posts BEGIN
+        INSERT INTO posts_fts (posts_fts, rowid, text) VALUES ('delete', old.id, old.text);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS posts_fts_au AFTER UPDATE OF text ON posts BEGIN
+        INSERT INTO posts_fts (posts_fts, rowid, text) VALUES ('delete', old.id, old.text);
+        INSERT INTO posts_fts (rowid, text) VALUES (new.id, new.text);
+    END""",
+    """CREATE VIRTUAL TABLE IF NOT EXISTS users_fts USING fts5(username, display_name, content='users', content_rowid='id', tokenize="unicode61 tokenchars '_'", prefix='1 2 3')""",
+    """CREATE TRIGGER IF NOT EXISTS users_fts_ai AFTER INSERT ON users BEGIN
+        INSERT INTO users_fts (rowid, username, display_name) VALUES (new.id, new.username, new.display_name);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS users_fts_ad AFTER DELETE ON users BEGIN
+        INSERT INTO users_fts (users_fts, rowid, username, display_name) VALUES ('delete', old.id, old.username, old.display_name);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS users_fts_au AFTER UPDATE OF username, display_name ON users BEGIN
+        INSERT INTO users_fts (users_fts, rowid, username, display_name) VALUES ('delete', old.id, old.username, old.display_name);
+        INSERT INTO users_fts (rowid, username, display_name) VALUES (new.id, new.username, new.display_name);
+    END""",
+]
+
+REBUILD_SEARCH = [
+    "INSERT INTO posts_fts (posts_fts) VALUES ('rebuild')",
+    "INSERT INTO users_fts (users_fts) VALUES ('rebuild')",
+]
+
+# Outgoing SUI transfers, sent by txqueue workers. status: queued -> sending -> sent | failed,
+# or unknown when a submission was interrupted and may or may not have landed on chain.
+TXQUEUE_TABLES = [
+    """CREATE TABLE IF NOT EXISTS outgoing_txns (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        sender_id INTEGER NOT NULL,
+        recipient_id INTEGER,
+        recipient_address TEXT NOT NULL,
+        amount_mist INTEGER NOT NULL,
+        kind TEXT NOT NULL,
+        status TEXT NOT NULL DEFAULT 'queued',
+        digest TEXT,
+        error TEXT,
+        attempts INTEGER NOT NULL DEFAULT 0,
+        next_attempt_at REAL NOT NULL,
+        created_at REAL NOT NULL,
+        updated_at REAL NOT NULL,
+        FOREIGN KEY(sender_id) REFERENCES users(id)
+    )""",
+    "CREATE INDEX IF NOT EXISTS idx_outgoing_txns_ready ON outgoing_txns(status, next_attempt_at)",
+    "CREATE INDEX IF NOT EXISTS idx_outgoing_txns_sender ON outgoing_txns(sender_id, status, id)",
+]
+
+# Local ledger of on-chain SUI movements for custodial wallets, filled by indexer.py.
+# amount_mist is the signed SUI balance change for `address` (gas included), so
+# SUM(amount_mist) is the wallet balance once its history is fully indexed.
+LEDGER_TABLES = [
+    """CREATE TABLE IF NOT EXISTS chain_activity (
+        address TEXT NOT NULL,
+        digest TEXT NOT NULL,
+        checkpoint INTEGER,
+        timestamp REAL,
+        amount_mist INTEGER NOT NULL,
+        counterparty TEXT,
+        PRIMARY KEY (address, digest)
+    ) WITHOUT ROWID""",
+    "CREATE INDEX IF NOT EXISTS idx_chain_activity_address_ts ON chain_activity(address, timestamp, digest)",
+    # One cursor per address and filter direction ('from' / 'to'); NULL cursor means synced with no history yet
+    """CREATE TABLE IF NOT EXISTS chain_cursors (address TEXT, direction TEXT, cursor TEXT, synced_at REAL, PRIMARY KEY (address, direction))""",
+    "CREATE INDEX IF NOT EXISTS idx_users_wallet ON users(wallet_address)",
+]
+
+# DM threads. Each unordered pair of users has one conversation row that points
+# at its latest message; messages carry conversation_id so a window of a thread
+# is a single index range scan.
+CONVERSATION_TABLES = [
+    """CREATE TABLE IF NOT EXISTS conversations (
+        id INTEGER PRIMARY KEY,
+        user_lo INTEGER NOT NULL,
+        user_hi INTEGER NOT NULL,
+        last_message_id INTEGER,
+        last_message_at REAL,
+        UNIQUE (user_lo, user_hi)
+    )""",
+]
+
+def add_conversation_ids(conn):
+    """Adds messages.conversation_id and backfills conversations from existing messages."""
+    if "conversation_id" not in {r[1] for r in conn.execute("PRAGMA table_info(messages)")}:
+        conn.execute("ALTER TABLE messages ADD COLUMN conversation_id INTEGER")
+    conn.execute("""
+        INSERT OR IGNORE INTO conversations (user_lo, user_hi)
+        SELECT DISTINCT MIN(sender_id, receiver_id), MAX(sender_id, receiver_id) FROM messages
+    """)
+    conn.execute("""
+        UPDATE messages SET conversation_id = (
+            SELECT c.id FROM conversations c
+            WHERE c.user_lo = MIN(messages.sender_id, messages.receiver_id) AND c.user_hi = MAX(messages.sender_id, messages.receiver_id)
+        ) WHERE conversation_id IS NULL
     """)
-    c.execute("""CREATE TABLE IF NOT EXISTS posts (id INTEGER PRIMARY KEY, user_id INTEGER, text TEXT, image_path TEXT, created_at REAL, orig_post_id INTEGER DEFAULT NULL, FOREIGN KEY(user_id) REFERENCES users(id))""")
-    c.execute("""CREATE TABLE IF NOT EXISTS follows (follower_id INTEGER, followed_id INTEGER, created_at REAL, PRIMARY KEY (follower_id, followed_id))""")
-    c.execute("""CREATE TABLE IF NOT EXISTS likes (user_id INTEGER, post_id INTEGER, created_at REAL, PRIMARY KEY (user_id, post_id))""")
-    c.execute("""CREATE TABLE IF NOT EXISTS bookmarks (user_id INTEGER, post_id INTEGER, created_at REAL, PRIMARY KEY (user_id, post_id))""")
-    c.execute("""CREATE TABLE IF NOT EXISTS replies (id INTEGER PRIMARY KEY, post_id INTEGER, user_id INTEGER, text TEXT, created_at REAL, FOREIGN KEY(post_id) REFERENCES posts(id), FOREIGN KEY(user_id) REFERENCES users(id))""")
-    c.execute("""CREATE TABLE IF NOT EXISTS messages (id INTEGER PRIMARY KEY, sender_id INTEGER, receiver_id INTEGER, text TEXT, created_at REAL, FOREIGN KEY(sender_id) REFERENCES users(id), FOREIGN KEY(receiver_id) REFERENCES users(id))""")
-    c.execute("""CREATE TABLE IF NOT EXISTS notifications (id INTEGER PRIMARY KEY, user_id INTEGER, text TEXT, seen INTEGER DEFAULT 0, created_at REAL, FOREIGN KEY(user_id) REFERENCES users(id))""")
-    
-    conn.commit()
-    conn.close()
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_messages_conversation ON messages(conversation_id, id)")
+    conn.execute("""
+        UPDATE conversations SET
+            last_message_id = (SELECT MAX(m.id) FROM messages m WHERE m.conversation_id = conversations.id),
+            last_message_at = (SELECT MAX(m.created_at) FROM messages m WHERE m.conversation_id = conversations.id)
+    """)
+
+# Per-user inbox: one row per (user, conversation) with the thread's last activity
+# and how many messages the user hasn't read yet. Maintained by send_message.
+INBOX_TABLES = [
+    """CREATE TABLE IF NOT EXISTS inbox (
+        user_id INTEGER NOT NULL,
+        conversation_id INTEGER NOT NULL,
+        other_id INTEGER NOT NULL,
+        last_message_at REAL,
+        unread_count INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (user_id, conversation_id)
+    ) WITHOUT ROWID""",
+    "CREATE INDEX IF NOT EXISTS idx_inbox_user_last ON inbox(user_id, last_message_at, conversation_id)",
+    # Case-insensitive username prefix lookups for the DM user picker
+    "CREATE INDEX IF NOT EXISTS idx_users_username_nocase ON users(username COLLATE NOCASE)",
+    """INSERT OR IGNORE INTO inbox (user_id, conversation_id, other_id, last_message_at)
+       SELECT user_lo, id, user_hi, last_message_at FROM conversations WHERE last_message_id IS NOT NULL
+       UNION ALL
+       SELECT user_hi, id, user_lo, last_message_at FROM conversations WHERE last_message_id IS NOT NULL""",
+]
+
+def add_notification_fields(conn):
+    """Structured notifications: kind/actor/post references and a coalesced event count.
+    Rows written before this keep kind NULL and their preformatted text."""
+    columns = {r[1] for r in conn.execute("PRAGMA table_info(notifications)")}
+    for name, ddl in (("kind", "TEXT"), ("actor_id", "INTEGER"), ("post_id", "INTEGER"), ("event_count", "INTEGER NOT NULL DEFAULT 1")):
+        if name not in columns: conn.execute(f"ALTER TABLE notifications ADD COLUMN {name} {ddl}")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_notifications_group ON notifications(user_id, seen, kind, post_id, actor_id)")
+
+# Per-user notification watermark: everything with id <= last_seen_id has been
+# seen; unread_count is the number of notification rows above it. Replaces the
+# per-row `seen` flag, which is no longer written.
+NOTIFICATION_STATE_TABLES = [
+    """CREATE TABLE IF NOT EXISTS notification_state (
+        user_id INTEGER PRIMARY KEY,
+        last_seen_id INTEGER NOT NULL DEFAULT 0,
+        unread_count INTEGER NOT NULL DEFAULT 0
+    )""",
+    """INSERT OR REPLACE INTO notification_state (user_id, last_seen_id, unread_count)
+       SELECT user_id, COALESCE(MAX(CASE WHEN seen = 1 THEN id END), 0), 0 FROM notifications GROUP BY user_id""",
+    """UPDATE notification_state SET unread_count = (
+           SELECT COUNT(*) FROM notifications n WHERE n.user_id = notification_state.user_id AND n.id > notification_state.last_seen_id)""",
+    "DROP INDEX IF EXISTS idx_notifications_group",
+    "CREATE INDEX IF NOT EXISTS idx_notifications_user_kind ON notifications(user_id, kind, post_id, actor_id)",
+    "CREATE INDEX IF NOT EXISTS idx_notifications_user ON notifications(user_id)",
+]
+
+# Pre-derived wallets waiting to be claimed by create_user (see walletpool.py)
+WALLET_POOL_TABLES = [
+    """CREATE TABLE IF NOT EXISTS wallet_pool (id INTEGER PRIMARY KEY, wallet_address TEXT NOT NULL, private_key TEXT NOT NULL, mnemonic TEXT NOT NULL, created_at REAL)""",
+]
+
+# Which actors a notification group has already counted, so "@a and 2 others"
+# counts people rather than events. target_id is the grouped post (0 when the
+# kind isn't grouped by post); notification_id is the row the actor last counted in.
+NOTIFICATION_ACTOR_TABLES = [
+    """CREATE TABLE IF NOT EXISTS notification_actors (
+        user_id INTEGER NOT NULL,
+        kind TEXT NOT NULL,
+        target_id INTEGER NOT NULL,
+        actor_id INTEGER NOT NULL,
+        notification_id INTEGER NOT NULL,
+        PRIMARY KEY (user_id, kind, target_id, actor_id)
+    ) WITHOUT ROWID""",
+    """INSERT OR IGNORE INTO notification_actors (user_id, kind, target_id, actor_id, notification_id)
+       SELECT user_id, kind, CASE WHEN kind IN ('like', 'reply') THEN COALESCE(post_id, 0) ELSE 0 END, actor_id, MAX(id)
+       FROM notifications WHERE kind IN ('like', 'reply', 'follow', 'tip') AND actor_id IS NOT NULL
+       GROUP BY user_id, kind, post_id, actor_id""",
+]
+
+# crud.prune_notifications deletes the actor rows of the notifications it prunes
+NOTIFICATION_ACTOR_INDEXES = [
+    "CREATE INDEX IF NOT EXISTS idx_notification_actors_notification ON notification_actors(notification_id)",
+]
+
+# Source post id -> local post id for bulk imports (see importer.py). Lets a
+# re-run skip posts it already loaded and lets later like files refer to them.
+IMPORT_TABLES = [
+    "CREATE TABLE IF NOT EXISTS import_post_map (src_id TEXT PRIMARY KEY, post_id INTEGER NOT NULL) WITHOUT ROWID",
+]
+
+def add_cursor_completion(conn):
+    """chain_cursors.complete: set once a direction has been paged to its end. Until both
+    directions are complete the ledger balance is partial and isn't shown."""
+    if "complete" not in {r[1] for r in conn.execute("PRAGMA table_info(chain_cursors)")}:
+        conn.execute("ALTER TABLE chain_cursors ADD COLUMN complete INTEGER NOT NULL DEFAULT 0")
+
+# Ledger history is ordered with pending transactions (NULL timestamp) first
+LEDGER_SYNC_TABLES = [
+    add_cursor_completion,
+    "CREATE INDEX IF NOT EXISTS idx_chain_activity_address_sort ON chain_activity(address, COALESCE(timestamp, 1e999), digest)",
+]
+
+# Ordered, append-only list of (version, name, steps). A step is either a SQL
+# string or a callable taking the connection. Every step must be idempotent so
+# databases created before versioning existed can be brought under it safely.
+MIGRATIONS = [
+    (1, "base tables", TABLES),
+    (2, "secondary indexes", list(INDEXES.values())),
+    (3, "post and user counters", STATS_TABLES + REBUILD_STATS),
+    (4, "home timeline", TIMELINE_TABLES + [rebuild_timelines]),
+    (5, "full-text search", SEARCH_TABLES + REBUILD_SEARCH),
+    (6, "outgoing transaction queue", TXQUEUE_TABLES),
+    (7, "on-chain ledger", LEDGER_TABLES),
+    (8, "conversations", CONVERSATION_TABLES + [add_conversation_ids]),
+    (9, "inbox", INBOX_TABLES),
+    (10, "structured notifications", [add_notification_fields]),
+    (11, "notification watermark", NOTIFICATION_STATE_TABLES),
+    (12, "wallet pool", WALLET_POOL_TABLES),
+    (13, "notification actors", NOTIFICATION_ACTOR_TABLES),
+    (14, "import post map", IMPORT_TABLES),
+    (15, "ledger sync state", LEDGER_SYNC_TABLES),
+    (16, "notification actor index", NOTIFICATION_ACTOR_INDEXES),
+]
+
+def schema_version(conn) -> int:
+    """Returns the highest applied migration version."""
+    conn.execute("CREATE TABLE IF NOT EXISTS schema_version (version INTEGER PRIMARY KEY, name TEXT, applied_at REAL)")
+    return conn.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version").fetchone()[0]
+
+def migrate(conn=None, target=None) -> int:
+    """Applies pending migrations in order, each in its own transaction. Returns the resulting version."""
+    conn = conn or get_conn()
+    if conn.in_transaction: conn.commit()
+    current = schema_version(conn)
+    for version, name, steps in MIGRATIONS:
+        if version <= current or (target is not None and version > target): continue
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Another process may have applied it while we waited for the write lock.
+            if conn.execute("SELECT 1 FROM schema_version WHERE version = ?", (version,)).fetchone():
+                conn.rollback()
+                continue
+            for step in steps:
+                if callable(step): step(conn)
+                else: conn.execute(step)
+            conn.execute("INSERT INTO schema_version (version, name, applied_at) VALUES (?, ?, ?)", (version, name, time.time()))
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        current = version
+    return schema_version(conn)
+
+def init_db():
+    """Initializes the database by applying pending schema migrations."""
+    migrate()
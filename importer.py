@@ -0,0 +1,161 @@
+"""Bulk import of users, posts, follows and likes from CSV or NDJSON files.
+
+Files are streamed and written with executemany, IMPORT_BATCH_ROWS rows per
+transaction. Wallets for new users are derived across a process pool. During
+the load the secondary indexes and the FTS insert triggers are dropped. Once
+the load finishes, the indexes are recreated and counters, timelines and
+search are rebuilt. Dropping indexes slows reads in a running app, so use
+keep_indexes for small imports into a live database.
+
+Input columns (extra columns are ignored, created_at is epoch seconds or ISO 8601):
+    users:   username, display_name, password | password_hash, bio, created_at
+    posts:   id, username, text, image_path, created_at  (id is the source id that likes refer to)
+    follows: follower, followed, created_at              (usernames)
+    likes:   username, post_id, created_at               (post_id is a source id from this or an earlier import)
+
+Users without a password get an unusable hash, so they can't log in until one is set.
+Imported posts are recorded in import_post_map under their source id (or a hash
+of their content when they have none), so source ids must be unique across
+imports. Rows whose username or source post id already exists (including
+earlier in the same file), or that reference unknown users or posts, are skipped. Because of that, an interrupted
+import can simply be re-run.
+"""
+import csv
+import hashlib
+import json
+import os
+from datetime import datetime
+from itertools import islice
+from typing import Iterable, Iterator, List, Optional
+
+import database
+import walletpool
+from database import get_conn, INDEXES, SEARCH_TABLES, REBUILD_STATS, REBUILD_SEARCH
+from utils import hash_password, now_ts
+from config import TIMELINE_ENABLED, IMPORT_BATCH_ROWS, IMPORT_WALLET_CHUNK
+
+# FTS triggers that fire per inserted row; the indexes are rebuilt in one pass instead
+BULK_TRIGGERS = ("posts_fts_ai", "users_fts_ai")
+UNUSABLE_PASSWORD = "!"
+
+def read_rows(path: str) -> Iterator[dict]:
+    """Streams rows from a .csv file or a newline-delimited JSON file (.ndjson / .jsonl)."""
+    with open(path, newline="", encoding="utf-8") as f:
+        if os.path.splitext(path)[1].lower() in (".ndjson", ".jsonl"):
+            for line in f:
+                if line.strip(): yield json.loads(line)
+        else:
+            yield from csv.DictReader(f)
+
+def _batches(rows: Iterable[dict], size: int) -> Iterator[List[dict]]:
+    it = iter(rows)
+    while batch := list(islice(it, size)):
+        yield batch
+
+def _ts(value) -> float:
+    if value in (None, ""): return now_ts()
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return datetime.fromisoformat(str(value)).timestamp()
+
+def _insert(conn, sql: str, params: list) -> int:
+    n = conn.executemany(sql, params).rowcount
+    conn.commit()
+    return n
+
+def import_users(conn, rows: Iterable[dict], batch: int = IMPORT_BATCH_ROWS, executor=None) -> dict:
+    added = skipped = 0
+    for chunk in _batches(rows, batch):
+        # Drop duplicates before deriving wallets: derivation is the expensive part of a user
+        names = [r.get("username") for r in chunk]
+        existing = {r[0] for r in conn.execute("SELECT username FROM users WHERE username IN (SELECT value FROM json_each(?))", (json.dumps(names),))}
+        fresh = {}
+        for r in chunk:
+            if r.get("username") and r["username"] not in existing: fresh.setdefault(r["username"], r)
+        wallets = [w for ws in walletpool.derive(len(fresh), IMPORT_WALLET_CHUNK, executor) for w in ws]
+        params = [
+            (r["username"], r.get("display_name") or r["username"],
+             r.get("password_hash") or (hash_password(r["password"]) if r.get("password") else UNUSABLE_PASSWORD),
+             r.get("bio") or "", _ts(r.get("created_at")), *wallet)
+            for r, wallet in zip(fresh.values(), wallets)
+        ]
+        n = _insert(conn, "INSERT OR IGNORE INTO users (username, display_name, password_hash, bio, created_at, wallet_address, private_key, mnemonic) VALUES (?, ?, ?, ?, ?, ?, ?, ?)", params)
+        added += n
+        skipped += len(chunk) - n
+    return {"added": added, "skipped": skipped}
+
+def _post_src_id(r: dict) -> str:
+    # Rows without a source id are keyed by their content, so re-runs still skip them
+    if r.get("id") not in (None, ""): return str(r["id"])
+    key = "\x1f".join(str(r.get(c) or "") for c in ("username", "created_at", "text", "image_path"))
+    return "sha1:" + hashlib.sha1(key.encode("utf-8")).hexdigest()
+
+def import_posts(conn, rows: Iterable[dict], batch: int = IMPORT_BATCH_ROWS) -> dict:
+    # Row by row so SQLite assigns each id inside the transaction, and the map row is written
+    # straight after it: a later row of the same chunk with the same source id is then skipped
+    added = skipped = 0
+    for chunk in _batches(rows, batch):
+        for r in chunk:
+            src_id = _post_src_id(r)
+            row = conn.execute("""
+                INSERT INTO posts (user_id, text, image_path, created_at)
+                SELECT id, ?, ?, ? FROM users WHERE username = ? AND NOT EXISTS (SELECT 1 FROM import_post_map WHERE src_id = ?)
+                RETURNING id
+            """, (r.get("text") or "", r.get("image_path") or None, _ts(r.get("created_at")), r.get("username"), src_id)).fetchone()
+            if row is None:
+                skipped += 1
+                continue
+            conn.execute("INSERT OR IGNORE INTO import_post_map (src_id, post_id) VALUES (?, ?)", (src_id, row[0]))
+            added += 1
+        conn.commit()
+    return {"added": added, "skipped": skipped}
+
+def import_follows(conn, rows: Iterable[dict], batch: int = IMPORT_BATCH_ROWS) -> dict:
+    added = skipped = 0
+    for chunk in _batches(rows, batch):
+        n = _insert(conn, """
+            INSERT OR IGNORE INTO follows (follower_id, followed_id, created_at)
+            SELECT a.id, b.id, ? FROM users a, users b WHERE a.username = ? AND b.username = ? AND a.id != b.id
+        """, [(_ts(r.get("created_at")), r.get("follower"), r.get("followed")) for r in chunk])
+        added += n
+        skipped += len(chunk) - n
+    return {"added": added, "skipped": skipped}
+
+def import_likes(conn, rows: Iterable[dict], batch: int = IMPORT_BATCH_ROWS) -> dict:
+    added = skipped = 0
+    for chunk in _batches(rows, batch):
+        n = _insert(conn, """
+            INSERT OR IGNORE INTO likes (user_id, post_id, created_at)
+            SELECT u.id, m.post_id, ? FROM users u, import_post_map m WHERE u.username = ? AND m.src_id = ?
+        """, [(_ts(r.get("created_at")), r.get("username"), str(r.get("post_id"))) for r in chunk])
+        added += n
+        skipped += len(chunk) - n
+    return {"added": added, "skipped": skipped}
+
+def run(users: Optional[str] = None, posts: Optional[str] = None, follows: Optional[str] = None, likes: Optional[str] = None,
+        batch: int = IMPORT_BATCH_ROWS, processes: int = os.cpu_count() or 1, keep_indexes: bool = False) -> dict:
+    """Imports the given files in dependency order. Returns {entity: {"added", "skipped"}}."""
+    conn = get_conn()
+    if conn.in_transaction: conn.commit()
+    result = {}
+    if not keep_indexes:
+        for name in INDEXES: conn.execute(f"DROP INDEX IF EXISTS {name}")
+        for name in BULK_TRIGGERS: conn.execute(f"DROP TRIGGER IF EXISTS {name}")
+        conn.commit()
+    executor = walletpool.new_executor(processes) if users and processes > 1 else None
+    try:
+        if users: result["users"] = import_users(conn, read_rows(users), batch, executor)
+        if posts: result["posts"] = import_posts(conn, read_rows(posts), batch)
+        if follows: result["follows"] = import_follows(conn, read_rows(follows), batch)
+        if likes: result["likes"] = import_likes(conn, read_rows(likes), batch)
+    finally:
+        if executor is not None: executor.shutdown()
+        if conn.in_transaction: conn.rollback()
+        with database.transaction() as c:
+            for sql in INDEXES.values(): c.execute(sql)
+            for sql in SEARCH_TABLES: c.execute(sql)
+            for sql in REBUILD_STATS: c.execute(sql)
+            if TIMELINE_ENABLED: database.rebuild_timelines(c)
+            for sql in REBUILD_SEARCH: c.execute(sql)
+    return result
@@ -0,0 +1,164 @@
+"""Incremental indexer for on-chain activity of custodial wallets.
+
+A background thread pages through suix_queryTransactionBlocks for every wallet
+(once with a FromAddress filter, once with ToAddress) and records each
+transaction's SUI balance change in chain_activity. Cursors are saved in the
+same transaction as the rows they cover, so a restart resumes where it stopped.
+An address counts as indexed once both directions have reached their last page.
+The wallet view reads balances and history from these tables, not from the RPC node.
+
+The periodic sweep only visits wallets that are due: every INDEXER_INTERVAL for
+wallets with activity in the last INDEXER_IDLE_AFTER seconds, every
+INDEXER_IDLE_INTERVAL for the rest. Transfers made in the app ask for a sync of
+both ends right away (request_sync), so mostly inbound transfers from outside wait.
+"""
+import sqlite3
+import threading
+from typing import List, Optional
+
+import requests
+
+import crud
+from database import get_conn, transaction
+from utils import now_ts
+from crud import Cursor
+from config import SUI_RPC_URL, INDEXER_INTERVAL, INDEXER_IDLE_INTERVAL, INDEXER_IDLE_AFTER, INDEXER_PAGE_SIZE, PAGE_SIZE
+
+SUI_COIN_TYPE = "0x2::sui::SUI"
+DIRECTIONS = (("from", "FromAddress"), ("to", "ToAddress"))
+# History sorts pending transactions (no timestamp yet) first; "~" sorts after every base58 digest
+PENDING_TS = float("inf")
+_FIRST_PAGE = (PENDING_TS, "~")
+
+_session = requests.Session()
+_pending = set()
+_pending_lock = threading.Lock()
+_wake = threading.Event()
+_thread: Optional[threading.Thread] = None
+_start_lock = threading.Lock()
+
+def _rpc(method: str, params: list):
+    response = _session.post(SUI_RPC_URL, json={"jsonrpc": "2.0", "id": 1, "method": method, "params": params}, timeout=15)
+    response.raise_for_status()
+    body = response.json()
+    if "error" in body:
+        raise RuntimeError(body["error"].get("message", body["error"]))
+    return body["result"]
+
+def _owner(change) -> Optional[str]:
+    owner = change.get("owner")
+    return owner.get("AddressOwner") if isinstance(owner, dict) else None
+
+def _activity_row(address: str, tx: dict) -> Optional[tuple]:
+    """(address, digest, checkpoint, timestamp, amount_mist, counterparty), or None if SUI didn't move for address."""
+    changes = [c for c in tx.get("balanceChanges") or [] if c.get("coinType") == SUI_COIN_TYPE]
+    amount = sum(int(c["amount"]) for c in changes if _owner(c) == address)
+    if not amount: return None
+    if amount > 0:
+        counterparty = ((tx.get("transaction") or {}).get("data") or {}).get("sender")
+    else:
+        receivers = sorted((c for c in changes if _owner(c) not in (None, address) and int(c["amount"]) > 0), key=lambda c: -int(c["amount"]))
+        counterparty = _owner(receivers[0]) if receivers else None
+    timestamp = int(tx["timestampMs"]) / 1000 if tx.get("timestampMs") else None
+    checkpoint = int(tx["checkpoint"]) if tx.get("checkpoint") else None
+    return (address, tx["digest"], checkpoint, timestamp, amount, counterparty)
+
+def sync_address(address: str) -> int:
+    """Pulls transactions for address since its saved cursors. Returns the number of new ledger rows."""
+    added = 0
+    for direction, filter_name in DIRECTIONS:
+        row = get_conn().execute("SELECT cursor FROM chain_cursors WHERE address = ? AND direction = ?", (address, direction)).fetchone()
+        cursor = row["cursor"] if row else None
+        while True:
+            page = _rpc("suix_queryTransactionBlocks", [
+                {"filter": {filter_name: address}, "options": {"showBalanceChanges": True, "showInput": True}},
+                cursor, INDEXER_PAGE_SIZE, False,
+            ])
+            rows = [r for r in (_activity_row(address, tx) for tx in page["data"]) if r]
+            cursor = page.get("nextCursor") or cursor
+            complete = not page.get("hasNextPage")
+            with transaction() as conn:
+                before = conn.total_changes
+                conn.executemany("INSERT OR IGNORE INTO chain_activity (address, digest, checkpoint, timestamp, amount_mist, counterparty) VALUES (?, ?, ?, ?, ?, ?)", rows)
+                added += conn.total_changes - before
+                # complete only ever goes 0 -> 1: a later catch-up leaves the balance readable, at most a few pages behind
+                conn.execute("""
+                    INSERT INTO chain_cursors (address, direction, cursor, synced_at, complete) VALUES (?, ?, ?, ?, ?)
+                    ON CONFLICT(address, direction) DO UPDATE SET cursor = excluded.cursor, synced_at = excluded.synced_at,
+                        complete = MAX(complete, excluded.complete)
+                """, (address, direction, cursor, now_ts(), complete))
+            if complete: break
+    return added
+
+def due_addresses(now: Optional[float] = None) -> List[str]:
+    """Custodial wallets the sweep should visit now: never fully synced, or last synced longer ago than their interval."""
+    now = now_ts() if now is None else now
+    return [r[0] for r in get_conn().execute("""
+        SELECT u.wallet_address FROM users u
+        LEFT JOIN (SELECT address, MIN(synced_at) AS synced_at, MIN(complete) AS complete, COUNT(*) AS directions
+                   FROM chain_cursors GROUP BY address) c ON c.address = u.wallet_address
+        WHERE u.wallet_address IS NOT NULL AND u.wallet_address != ''
+          AND (c.directions IS NOT ? OR NOT c.complete OR c.synced_at < ? - CASE
+                   WHEN EXISTS (SELECT 1 FROM chain_activity a WHERE a.address = u.wallet_address AND a.timestamp > ?) THEN ? ELSE ? END)
+        ORDER BY u.id
+    """, (len(DIRECTIONS), now, now - INDEXER_IDLE_AFTER, INDEXER_INTERVAL - 1, INDEXER_IDLE_INTERVAL - 1))]
+
+def sync_all(addresses: Optional[List[str]] = None) -> dict:
+    """Syncs the given addresses, by default every custodial wallet. Returns {"synced", "added", "errors": {address: message}}."""
+    if addresses is None: addresses = [u["wallet_address"] for u in crud.get_wallet_addresses()]
+    synced, added, errors = 0, 0, {}
+    for address in addresses:
+        try:
+            added += sync_address(address)
+            synced += 1
+        except Exception as e:
+            errors[address] = str(e)
+    return {"synced": synced, "added": added, "errors": errors}
+
+def request_sync(*addresses: str):
+    """Asks the background indexer to sync these addresses soon, e.g. right after a transfer."""
+    with _pending_lock: _pending.update(a for a in addresses if a)
+    _wake.set()
+
+def _run():
+    last_sweep = 0.0
+    while True:
+        _wake.wait(max(0.0, last_sweep + INDEXER_INTERVAL - now_ts()))
+        _wake.clear()
+        with _pending_lock:
+            addresses = list(_pending)
+            _pending.clear()
+        for address in addresses:
+            try: sync_address(address)
+            except Exception: pass
+        if now_ts() - last_sweep >= INDEXER_INTERVAL:
+            sync_all(due_addresses())
+            last_sweep = now_ts()
+
+def start():
+    """Starts the background indexer once per process."""
+    global _thread
+    with _start_lock:
+        if _thread is None:
+            _thread = threading.Thread(target=_run, name="chain-indexer", daemon=True)
+            _thread.start()
+
+# --- LOCAL QUERIES ---
+def is_synced(address: str) -> bool:
+    """True once both directions have been paged through to the end at least once."""
+    return get_conn().execute("SELECT COUNT(*) FROM chain_cursors WHERE address = ? AND complete", (address,)).fetchone()[0] == len(DIRECTIONS)
+
+def get_balance(address: str) -> Optional[float]:
+    """Balance in SUI from the local ledger, or None if the address hasn't been indexed yet."""
+    if not is_synced(address): return None
+    total = get_conn().execute("SELECT COALESCE(SUM(amount_mist), 0) FROM chain_activity WHERE address = ?", (address,)).fetchone()[0]
+    return total / 1_000_000_000
+
+def get_history(address: str, limit=PAGE_SIZE, before: Optional[Cursor] = None) -> List[sqlite3.Row]:
+    """Ledger entries for address, newest first, with the counterparty's username when it's one of ours."""
+    return get_conn().execute("""
+        SELECT a.*, u.username AS counterparty_username, COALESCE(a.timestamp, 1e999) AS sort_key, a.digest AS sort_id
+        FROM chain_activity a LEFT JOIN users u ON u.wallet_address = a.counterparty
+        WHERE a.address = ? AND (COALESCE(a.timestamp, 1e999), a.digest) < (?, ?)
+        ORDER BY COALESCE(a.timestamp, 1e999) DESC, a.digest DESC LIMIT ?
+    """, (address, *(before or _FIRST_PAGE), limit)).fetchall()
@@ -1,6 +1,5 @@
 import streamlit as st
 import extra_streamlit_components as stx
-import time
 import os
 from datetime import datetime, timedelta
 
@@ -10,28 +9,50 @@ import database
 import crud
 import components
 import blockchain
-from utils import get_image_base64, human_time
+import media
+import txqueue
+import indexer
+import walletpool
+from utils import human_time
 
 # --- INITIALIZATION ---
-database.init_db()
+@st.cache_resource
+def startup():
+    """Runs once per server process, not on every rerun."""
+    config.ensure_dirs()
+    database.init_db()
+    txqueue.start()
+    if config.INDEXER_ENABLED: indexer.start()
+    if config.WALLET_POOL_ENABLED: walletpool.start()
+
+startup()
 st.set_page_config(page_title="Sketchy Twitter", layout="wide", page_icon="📝")
 components.apply_theme()
+components.show_flash()
 
 # --- COOKIE MANAGER ---
 cookie_manager = stx.CookieManager(key="auth_mgr_production_v2")
-time.sleep(0.5) # Allow cookie mount
-cookies = cookie_manager.get_all()
+# None until the browser has reported its cookies; that report triggers the next rerun
+cookies = cookie_manager.cookie_manager(method="getAll", key="get_all", default=None)
 
 if cookies is None:
-    st.spinner("Loading Sketchy UI...")
+    st.caption("Loading Sketchy UI...")
     st.stop()
 
+# Cookie writes requested before an st.rerun() are rendered here, on a run that completes
+pending_cookie = st.session_state.pop("pending_cookie", None)
+if pending_cookie == "delete":
+    if "current_user_id" in cookies: cookie_manager.delete("current_user_id")
+elif pending_cookie:
+    cookie_manager.set("current_user_id", pending_cookie, expires_at=datetime.now() + timedelta(days=7))
+
 cookie_user_id = cookies.get("current_user_id")
 
 if "user" not in st.session_state:
     st.session_state.user = None
 
-if not st.session_state.user and cookie_user_id:
+# After a logout the browser may still report the old cookie until the delete lands
+if not st.session_state.user and cookie_user_id and not st.session_state.get("logged_out"):
     try:
         user_data = crud.get_user_by_id(int(cookie_user_id))
         if user_data:
@@ -64,9 +85,9 @@ if not st.session_state.user:
                         row = crud.authenticate(username.strip(), password)
                         if row:
                             st.session_state.user = row
-                            cookie_manager.set("current_user_id", row['id'], expires_at=datetime.now() + timedelta(days=7))
-                            st.toast("Welcome back!", icon="👋")
-                            time.sleep(1)
+                            st.session_state.pending_cookie = row['id']
+                            st.session_state.pop("logged_out", None)
+                            components.flash("Welcome back!", icon="👋")
                             st.rerun()
                         else:
                             st.error("Invalid username or password")
@@ -88,16 +109,11 @@ if not st.session_state.user:
                         if not su_user or not su_name or not su_pass: st.error("Please fill required fields")
                         else:
                             pic_path = None
-                            if su_pic:
-                                fname = f"{su_user}_{int(time.time()*1000)}_{su_pic.name}"
-                                path = os.path.join(config.PROFILE_PIC_DIR, fname)
-                                with open(path, "wb") as f: f.write(su_pic.getbuffer())
-                                pic_path = path
+                            if su_pic: pic_path = media.save_upload(su_pic.getvalue(), su_pic.name)
                             with st.spinner("Generating Keys on Blockchain..."):
                                 new_id = crud.create_user(su_user.strip(), su_name.strip(), su_pass, su_bio.strip(), pic_path)
                             if new_id:
-                                st.success("Account created! Please log in.")
-                                time.sleep(1.5)
+                                components.flash("Account created! Please log in.", icon="✅")
                                 st.session_state.auth_mode = "login"
                                 st.rerun()
                             else: st.error("Username already exists")
@@ -110,13 +126,19 @@ if not st.session_state.user:
 # MAIN APP - LOGGED IN
 # ==========================================
 if "view" not in st.session_state: st.session_state.view = "home"
+# Paginated lists start over at one page whenever the view changes.
+if st.session_state.get("last_view") != st.session_state.view:
+    for k in [k for k in st.session_state.keys() if str(k).startswith("pages:")]: del st.session_state[k]
+    st.session_state.last_view = st.session_state.view
 
 with st.sidebar:
     st.markdown("<h1 style='text-align: center; margin-bottom: 20px; font-size: 60px; font-family: sans-serif;'>𝕏</h1>", unsafe_allow_html=True)
     if st.button("   Home", use_container_width=True): st.session_state.view = "home"; st.rerun()
     if st.button("   Explore", use_container_width=True): st.session_state.view = "explore"; st.rerun()
-    if st.button("   Notifications", use_container_width=True): st.session_state.view = "notifications"; st.rerun()
-    if st.button("   Messages", use_container_width=True): st.session_state.view = "messages"; st.rerun()
+    unread = crud.get_notification_state(st.session_state.user['id'])[1]
+    if st.button(f"   Notifications ({unread})" if unread else "   Notifications", key="nav_notifications", use_container_width=True): st.session_state.view = "notifications"; st.rerun()
+    unread_messages = crud.get_unread_message_count(st.session_state.user['id'])
+    if st.button(f"   Messages ({unread_messages})" if unread_messages else "   Messages", key="nav_messages", use_container_width=True): st.session_state.view = "messages"; st.rerun()
     if st.button("   Bookmarks", use_container_width=True): st.session_state.view = "bookmarks"; st.rerun()
     if st.button("   Wallet", use_container_width=True): st.session_state.view = "wallet"; st.rerun()
     if st.button("   Profile", use_container_width=True): st.session_state.view = f"profile:{st.session_state.user['username']}"; st.rerun()
@@ -131,10 +153,7 @@ with st.sidebar:
         with st.container():
             col_p1, col_p2 = st.columns([1, 3])
             with col_p1:
-                img_src = "https://cdn-icons-png.flaticon.com/512/149/149071.png"
-                if usr.get('profile_pic_path') and os.path.exists(usr['profile_pic_path']):
-                    b64 = get_image_base64(usr['profile_pic_path'])
-                    if b64: img_src = f"data:image/png;base64,{b64}"
+                img_src = components.avatar_src(usr.get('profile_pic_path'))
                 st.markdown(f"""<div style="width: 50px; height: 50px; border-radius: 50%; overflow: hidden;"><img src="{img_src}" style="width: 100%; height: 100%; object-fit: cover; border: none !important;"></div>""", unsafe_allow_html=True)
             with col_p2:
                 st.markdown(f"<div style='line-height: 1.1; margin-top: 2px;'><b>{usr.get('display_name')}</b><br><span style='color: #666; font-size: 0.9em;'>@{usr.get('username')}</span></div>", unsafe_allow_html=True)
@@ -147,8 +166,8 @@ with st.sidebar:
         st.session_state.user = None
         st.session_state.auth_mode = "login"
         st.session_state.view = "home"
-        cookie_manager.delete("current_user_id")
-        time.sleep(1) 
+        st.session_state.pending_cookie = "delete"
+        st.session_state.logged_out = True
         st.rerun()
 
 # --- VIEW HANDLERS ---
@@ -161,11 +180,7 @@ if st.session_state.view == "create_post":
             ok = st.form_submit_button("PUBLISH", type="primary")
             if ok:
                 img_path = None
-                if img:
-                    fname = f"{int(time.time()*1000)}_{img.name}"
-                    path = os.path.join(config.POST_IMAGE_DIR, fname)
-                    with open(path, "wb") as f: f.write(img.getbuffer())
-                    img_path = path
+                if img: img_path = media.save_upload(img.getvalue(), img.name)
                 crud.create_post(st.session_state.user['id'], text, img_path)
                 st.success("Posted!")
                 st.session_state.view = "home"
@@ -206,15 +221,10 @@ elif st.session_state.view == "edit_profile":
                 if not new_name.strip(): st.error("Display Name cannot be empty")
                 else:
                     final_path = None
-                    if new_pic:
-                        fname = f"updated_{curr['id']}_{int(time.time())}_{new_pic.name}"
-                        path = os.path.join(config.PROFILE_PIC_DIR, fname)
-                        with open(path, "wb") as f: f.write(new_pic.getbuffer())
-                        final_path = path
+                    if new_pic: final_path = media.save_upload(new_pic.getvalue(), new_pic.name)
                     updated_user = crud.update_user_details(curr['id'], new_name.strip(), new_bio.strip(), final_path)
                     st.session_state.user = updated_user
-                    st.success("Profile updated successfully!")
-                    time.sleep(1)
+                    components.flash("Profile updated successfully!", icon="✅")
                     st.session_state.view = f"profile:{curr['username']}"
                     st.rerun()
     if st.button("Cancel"):
@@ -223,63 +233,85 @@ elif st.session_state.view == "edit_profile":
 
 elif st.session_state.view == "home":
     st.header("TODAY")
-    posts = crud.get_feed(st.session_state.user['id'], limit=100)
-    if not posts: st.info("Timeline empty. Go to Explore!")
-    for p in posts: components.render_post(p, "home")
+    uid = st.session_state.user['id']
+    components.render_post_pages("pages:home", lambda before: crud.get_feed(uid, before=before), "home", "Timeline empty. Go to Explore!")
 
 elif st.session_state.view == "explore":
     st.header("EXPLORE")
     term = st.text_input("Search...", placeholder="Find users or posts...")
     if term:
         st.subheader("Users")
-        for u in crud.search_users(term):
+        found_users, users_next = components.load_pages(f"pages:users:{term}", lambda before: crud.search_users(term, before=before))
+        if not found_users: st.info("No users found.")
+        for u in found_users:
             st.write(f"@{u['username']} — {u['display_name']}")
             if st.button("View", key=f"viewu:{u['id']}"):
                 st.session_state.view = f"profile:{u['username']}"; st.rerun()
+        components.load_more_button(f"pages:users:{term}", users_next)
         st.subheader("Posts")
-        for p in crud.search_posts(term): components.render_post(p, "explore")
+        components.render_post_pages(f"pages:search:{term}", lambda before: crud.search_posts(term, before=before), "explore", "No posts found.")
     else:
         st.subheader("Recent Activity")
-        c = database.get_conn().cursor()
-        c.execute("SELECT p.*, u.username, u.display_name, u.profile_pic_path FROM posts p JOIN users u ON p.user_id = u.id ORDER BY p.created_at DESC LIMIT 100")
-        for p in c.fetchall(): components.render_post(p, "explore")
+        components.render_post_pages("pages:recent", lambda before: crud.get_recent_posts(before=before), "explore", "No posts yet.")
 
 elif st.session_state.view == "bookmarks":
     st.header("SAVED")
-    bookmarks = crud.get_bookmarks_for_user(st.session_state.user['id'])
-    if not bookmarks: st.info("No bookmarks yet.")
-    for p in bookmarks: components.render_post(p, "bookmarks")
+    uid = st.session_state.user['id']
+    components.render_post_pages("pages:bookmarks", lambda before: crud.get_bookmarks_for_user(uid, before=before), "bookmarks", "No bookmarks yet.")
 
 elif st.session_state.view == "notifications":
     st.header("ALERTS")
     with st.container(border=True):
         notes = crud.get_notifications(st.session_state.user['id'])
+        last_seen_id, _ = crud.get_notification_state(st.session_state.user['id'])
         if not notes: st.info("No notifications.")
-        for n in notes: st.write(f"**{human_time(n['created_at'])}** — {n['text']}")
-        crud.mark_notifications_seen(st.session_state.user['id'])
+        for n in notes: st.write(f"{'🆕 ' if n['id'] > last_seen_id else ''}**{human_time(n['created_at'])}** — {crud.notification_text(n)}")
+        if notes: crud.mark_notifications_seen(st.session_state.user['id'], max(n['id'] for n in notes))
 
 elif st.session_state.view == "messages":
     st.header("CHAT")
     user = st.session_state.user
-    rows = database.get_conn().cursor().execute("SELECT username FROM users WHERE id != ?", (user['id'],)).fetchall()
-    options = [r['username'] for r in rows]
-    other = st.selectbox("Select User", options=options)
-    if other:
-        other_row = crud.get_user_by_username(other)
-        st.subheader(f"Chat with @{other_row['username']}")
-        components.render_realtime_chat(user['id'], other_row['id'], user['username'], other_row['username'])
-        with st.form("send_msg", clear_on_submit=True):
-            txt = st.text_area("Message")
-            ok = st.form_submit_button("SEND", type="primary")
-            if ok and txt.strip():
-                crud.send_message(user['id'], other_row['id'], txt)
-                st.toast("Message sent!")
+    inbox_col, chat_col = st.columns([1, 2])
+    with inbox_col:
+        q = st.text_input("New message", key="dm_search", placeholder="Start typing a username...")
+        for u in crud.search_usernames(q.strip(), exclude_id=user['id']):
+            if st.button(f"@{u['username']} — {u['display_name']}", key=f"dm_pick_{u['id']}", use_container_width=True):
+                st.session_state.chat_with = u['username']
+                st.rerun()
+        st.subheader("Inbox")
+        conversations, next_cursor = components.load_pages("pages:inbox", lambda before: crud.get_inbox(user['id'], config.PAGE_SIZE, before))
+        if not conversations: st.caption("No conversations yet.")
+        for c in conversations:
+            label = f"@{c['username']}" + (f" ({c['unread_count']} new)" if c['unread_count'] else "")
+            if st.button(label, key=f"inbox_{c['conversation_id']}", type="primary" if c['unread_count'] else "secondary", use_container_width=True):
+                crud.mark_conversation_read(user['id'], c['other_id'])
+                st.session_state.chat_with = c['username']
+                st.rerun()
+            if c['last_text']: st.caption(f"{'You: ' if c['last_sender_id'] == user['id'] else ''}{c['last_text'][:60]} · {human_time(c['last_message_at'])}")
+        components.load_more_button("pages:inbox", next_cursor)
+    with chat_col:
+        other_row = crud.get_user_by_username(st.session_state.get("chat_with") or "")
+        if not other_row:
+            st.info("Pick a conversation or search for someone to message.")
+        else:
+            st.subheader(f"Chat with @{other_row['username']}")
+            components.render_realtime_chat(user['id'], other_row['id'], user['username'], other_row['username'])
+            with st.form("send_msg", clear_on_submit=True):
+                txt = st.text_area("Message")
+                ok = st.form_submit_button("SEND", type="primary")
+                if ok and txt.strip():
+                    crud.send_message(user['id'], other_row['id'], txt)
+                    st.toast("Message sent!")
 
 elif st.session_state.view == "wallet":
     curr = st.session_state.user
-    with st.spinner("Syncing with Blockchain..."):
-        balance = blockchain.get_sui_balance(curr['wallet_address'])
-        sui_price, price_change_pct = blockchain.get_sui_market_data()
+    local_balance = indexer.get_balance(curr['wallet_address'])
+    if local_balance is None:
+        with st.spinner("Syncing with Blockchain..."):
+            balance, sui_price, price_change_pct = blockchain.get_wallet_snapshot(curr['wallet_address'])
+    else:
+        balance = local_balance
+        sui_price, price_change_pct = blockchain.get_cached_market_data()
     holdings_value = balance * sui_price
     change_color = "#00ba7c" if price_change_pct >= 0 else "#f91880"
     change_sign = "+" if price_change_pct >= 0 else ""
@@ -312,19 +344,17 @@ elif st.session_state.view == "wallet":
                 if amount <= 0: st.error("Amount must be positive.")
                 elif not dest_addr.startswith("0x"): st.error("Invalid SUI address.")
                 else:
-                    with st.spinner("Processing on Blockchain..."):
-                        success, msg = blockchain.send_sui_payment(curr['private_key'], dest_addr, amount)
-                        if success:
-                            st.success(f"Transaction Sent! Digest: {msg}")
-                            st.balloons()
-                            time.sleep(2)
-                            st.rerun()
-                        else: st.error(f"Failed: {msg}")
+                    txqueue.enqueue(curr['id'], dest_addr, amount, "withdrawal")
+                    st.success("Transaction queued! Track it under Recent Transfers.")
+    components.render_transfers(curr['id'])
+    components.render_chain_activity(curr['wallet_address'])
     st.divider()
     with st.expander("🔐 View Keys"):
         st.warning("These are your keys. Never share them.")
-        st.text_input("Private Key", curr['private_key'], type="password", disabled=True)
-        st.text_area("Mnemonic Phrase", curr['mnemonic'], disabled=True)
+        if st.toggle("Reveal keys", key="reveal_keys"):
+            secrets = crud.get_wallet_secrets(curr['id'])
+            st.text_input("Private Key", secrets['private_key'], type="password", disabled=True)
+            st.text_area("Mnemonic Phrase", secrets['mnemonic'], disabled=True)
 
 elif st.session_state.view.startswith("profile:"):
     _, uname = st.session_state.view.split(":")
@@ -339,10 +369,7 @@ elif st.session_state.view.startswith("profile:"):
         with st.container(border=True):
             header_cols = st.columns([1.2, 4, 1.2])
             with header_cols[0]:
-                img_src = "https://cdn-icons-png.flaticon.com/512/149/149071.png"
-                if u.get('profile_pic_path') and os.path.exists(u['profile_pic_path']):
-                    b64 = get_image_base64(u['profile_pic_path'])
-                    if b64: img_src = f"data:image/png;base64,{b64}"
+                img_src = components.avatar_src(u.get('profile_pic_path'))
                 st.markdown(f"""
                     <div style="width: 110px; height: 110px; border-radius: 50%; overflow: hidden; display: flex; justify-content: center; align-items: center; box-shadow: 0px 0px 0px 3px white; margin-bottom: 10px;">
                         <img src="{img_src}" style="width: 100%; height: 100%; object-fit: cover;">
@@ -370,10 +397,7 @@ elif st.session_state.view.startswith("profile:"):
                     if mutuals:
                         avatar_html = ""
                         for m in mutuals:
-                            m_src = "https://cdn-icons-png.flaticon.com/512/149/149071.png"
-                            if m['profile_pic_path'] and os.path.exists(m['profile_pic_path']):
-                                b64 = get_image_base64(m['profile_pic_path'])
-                                if b64: m_src = f"data:image/png;base64,{b64}"
+                            m_src = components.avatar_src(m['profile_pic_path'])
                             avatar_html += f"""<img src="{m_src}" style="width: 24px; height: 24px; border-radius: 50%; border: 1px solid white; margin-right: -8px;">"""
                         st.write("") 
                         if len(mutuals) == 1:
@@ -409,10 +433,8 @@ elif st.session_state.view.startswith("profile:"):
                     with st.popover("💸 Tip SUI", use_container_width=True):
                         tip_val = st.number_input("Amount", 0.1, step=0.1, key=f"tip_{user_id}")
                         if st.button("Send Tip", key=f"pay_{user_id}"):
-                            with st.spinner("..."):
-                                s, m = blockchain.send_sui_payment(st.session_state.user['private_key'], u['wallet_address'], tip_val)
-                                if s: st.success("Sent!"); crud.create_notification(user_id, f"Tip from @{st.session_state.user['username']}")
-                                else: st.error(m)
+                            txqueue.enqueue(st.session_state.user['id'], u['wallet_address'], tip_val, "tip", recipient_id=user_id)
+                            st.success("Tip queued!")
                 else:
                     if st.button("Edit Profile", key="edit_profile_btn", use_container_width=True): 
                         st.session_state.view = "edit_profile"
@@ -421,12 +443,11 @@ elif st.session_state.view.startswith("profile:"):
         st.markdown("---")
         tab_posts, tab_replies, tab_likes = st.tabs(["POSTS", "REPLIES", "LIKES"])
         with tab_posts:
-            user_posts = crud.get_posts_for_user(user_id, limit=100)
-            if not user_posts: st.info("No posts yet.")
-            for p in user_posts: components.render_post(p, "prof_posts")
+            components.render_post_pages("pages:prof_posts", lambda before: crud.get_posts_for_user(user_id, before=before), "prof_posts", "No posts yet.")
         with tab_replies:
-            replies_list = crud.get_replies_for_user(user_id)
+            replies_list, replies_next = components.load_pages("pages:prof_replies", lambda before: crud.get_replies_for_user(user_id, before=before))
             if not replies_list: st.info("No replies yet.")
+            ctx_meta = crud.hydrate_posts([r["orig_post_id"] for r in replies_list], current_user_id)
             for r in replies_list:
                 with st.container(border=True):
                     col_icon, col_txt = st.columns([1, 20])
@@ -436,11 +457,10 @@ elif st.session_state.view.startswith("profile:"):
                         st.markdown(f"**{r['reply_text']}**")
                         with st.expander("Original Post Context"):
                             fake_post_row = { "id": r["orig_post_id"], "username": r["orig_username"], "display_name": r["orig_display"], "profile_pic_path": r["orig_pic"], "text": r["orig_text"], "image_path": r["orig_image"], "created_at": r["orig_created"] }
-                            components.render_post(fake_post_row, key_prefix=f"reply_ctx_{r['reply_id']}")
+                            components.render_post(fake_post_row, key_prefix=f"reply_ctx_{r['reply_id']}", meta=ctx_meta[r["orig_post_id"]])
+            components.load_more_button("pages:prof_replies", replies_next)
         with tab_likes:
-             liked_posts = crud.get_liked_posts_for_user(user_id)
-             if not liked_posts: st.info("No liked posts yet.")
-             for p in liked_posts: components.render_post(p, "prof_likes")
+             components.render_post_pages("pages:prof_likes", lambda before: crud.get_liked_posts_for_user(user_id, before=before), "prof_likes", "No liked posts yet.")
 
 elif st.session_state.view.startswith("following_list:"):
     _, user_id_str, uname = st.session_state.view.split(":")
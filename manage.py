@@ -0,0 +1,129 @@
+"""Maintenance commands. Usage: python manage.py <command> [options]"""
+import argparse
+import os
+import sys
+
+import config
+import database
+
+def cmd_migrate(args):
+    print(f"Schema version {database.migrate()}")
+
+def cmd_verify_stats(args):
+    import crud
+    drift = crud.verify_stats()
+    for d in drift: print(d)
+    print(f"{len(drift)} counter(s) drifted")
+    return 1 if drift else 0
+
+def cmd_rebuild_stats(args):
+    import crud
+    crud.rebuild_stats()
+    print("Counters rebuilt")
+
+def cmd_rebuild_timelines(args):
+    import crud
+    crud.rebuild_timelines()
+    print("Timelines rebuilt")
+
+def cmd_rebuild_search(args):
+    import crud
+    crud.rebuild_search_index()
+    print("Search index rebuilt")
+
+def cmd_import_media(args):
+    import media
+    conn = database.get_conn()
+    moved = 0
+    for table, column in (("users", "profile_pic_path"), ("posts", "image_path")):
+        for row in conn.execute(f"SELECT id, {column} AS path FROM {table} WHERE {column} IS NOT NULL AND {column} != ''").fetchall():
+            new_path = media.import_file(row["path"])
+            if new_path and new_path != row["path"]:
+                with database.transaction() as c: c.execute(f"UPDATE {table} SET {column} = ? WHERE id = ?", (new_path, row["id"]))
+                moved += 1
+    print(f"Imported {moved} image(s) into the media store")
+
+def cmd_balances(args):
+    import blockchain, crud
+    users = crud.get_wallet_addresses()
+    balances, errors = blockchain.get_balances([u["wallet_address"] for u in users], args.concurrency)
+    ranked = sorted((u for u in users if u["wallet_address"] in balances), key=lambda u: balances[u["wallet_address"]], reverse=True)
+    for rank, u in enumerate(ranked[:args.top], 1):
+        print(f"{rank:>4}  {balances[u['wallet_address']]:>16.4f} SUI  @{u['username']}")
+    for u in users:
+        if u["wallet_address"] in errors: print(f"error  @{u['username']} {u['wallet_address']}: {errors[u['wallet_address']]}")
+    print(f"{len(balances)} balance(s) fetched, {len(errors)} error(s)")
+    return 1 if errors else 0
+
+def cmd_index_chain(args):
+    import indexer
+    if args.address:
+        print(f"{indexer.sync_address(args.address)} new ledger row(s)")
+        return 0
+    result = indexer.sync_all()
+    for address, error in result["errors"].items(): print(f"error  {address}: {error}")
+    print(f"{result['synced']} wallet(s) synced, {result['added']} new ledger row(s), {len(result['errors'])} error(s)")
+    return 1 if result["errors"] else 0
+
+def cmd_prune_notifications(args):
+    import time
+    import crud
+    before = time.time() - args.days * 86400
+    if args.archive:
+        with open(args.archive, "a", encoding="utf-8") as archive: deleted = crud.prune_notifications(before, archive=archive)
+    else:
+        deleted = crud.prune_notifications(before)
+    print(f"Pruned {deleted} seen notification(s) older than {args.days} day(s)")
+
+def cmd_fill_wallet_pool(args):
+    import walletpool
+    added = walletpool.fill(args.target)
+    print(f"Added {added} wallet(s); {walletpool.stats()}")
+
+def cmd_import(args):
+    import importer
+    if not any((args.users, args.posts, args.follows, args.likes)):
+        print("Nothing to import: pass at least one of --users, --posts, --follows, --likes")
+        return 2
+    result = importer.run(args.users, args.posts, args.follows, args.likes, batch=args.batch, processes=args.processes, keep_indexes=args.keep_indexes)
+    for entity, counts in result.items(): print(f"{entity}: {counts['added']} added, {counts['skipped']} skipped")
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Mini Twitter maintenance commands")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("migrate", help="apply pending schema migrations").set_defaults(func=cmd_migrate)
+    sub.add_parser("verify-stats", help="report like/reply/follow counters that drifted from the source tables").set_defaults(func=cmd_verify_stats)
+    sub.add_parser("rebuild-stats", help="recompute all like/reply/follow counters").set_defaults(func=cmd_rebuild_stats)
+    sub.add_parser("rebuild-timelines", help="recompute every home timeline from posts and follows").set_defaults(func=cmd_rebuild_timelines)
+    sub.add_parser("rebuild-search", help="rebuild the full-text search indexes").set_defaults(func=cmd_rebuild_search)
+    sub.add_parser("import-media", help="move legacy uploads into the content-addressed media store").set_defaults(func=cmd_import_media)
+    balances = sub.add_parser("balances", help="fetch every custodial wallet balance and print a leaderboard")
+    balances.add_argument("--top", type=int, default=20, help="number of leaderboard rows to print")
+    balances.add_argument("--concurrency", type=int, default=config.SUI_BATCH_CONCURRENCY, help="concurrent balance requests")
+    balances.set_defaults(func=cmd_balances)
+    index_chain = sub.add_parser("index-chain", help="pull new on-chain transactions for custodial wallets into the local ledger")
+    index_chain.add_argument("--address", help="sync a single address instead of every wallet")
+    index_chain.set_defaults(func=cmd_index_chain)
+    prune = sub.add_parser("prune-notifications", help="delete seen notifications older than a retention period")
+    prune.add_argument("--days", type=int, default=90, help="retention period in days")
+    prune.add_argument("--archive", help="append pruned rows to this NDJSON file first")
+    prune.set_defaults(func=cmd_prune_notifications)
+    fill_pool = sub.add_parser("fill-wallet-pool", help="pre-derive wallets so signups can claim them")
+    fill_pool.add_argument("--target", type=int, default=config.WALLET_POOL_TARGET, help="pool size to fill up to")
+    fill_pool.set_defaults(func=cmd_fill_wallet_pool)
+    bulk = sub.add_parser("import", help="bulk-load users, posts, follows and likes from CSV or NDJSON files")
+    bulk.add_argument("--users", help="users file (username, display_name, password|password_hash, bio, created_at)")
+    bulk.add_argument("--posts", help="posts file (id, username, text, image_path, created_at)")
+    bulk.add_argument("--follows", help="follows file (follower, followed, created_at)")
+    bulk.add_argument("--likes", help="likes file (username, post_id, created_at)")
+    bulk.add_argument("--batch", type=int, default=config.IMPORT_BATCH_ROWS, help="rows per transaction")
+    bulk.add_argument("--processes", type=int, default=os.cpu_count() or 1, help="wallet derivation processes")
+    bulk.add_argument("--keep-indexes", action="store_true", help="keep indexes and search triggers during the load (small imports into a live database)")
+    bulk.set_defaults(func=cmd_import)
+    args = parser.parse_args(argv)
+    config.ensure_dirs()
+    database.init_db()
+    return args.func(args) or 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,106 @@
+import hashlib
+import io
+import mimetypes
+import os
+import re
+from typing import Optional
+from PIL import Image, ImageOps, features
+from config import MEDIA_DIR, MEDIA_STATIC_DIR, MEDIA_URL_PREFIX, MEDIA_VARIANTS, MEDIA_QUALITY
+from utils import get_image_base64
+
+# Variants are WebP where Pillow supports it; animated GIFs are kept as-is so they still play.
+VARIANT_FORMAT, VARIANT_EXT = ("WEBP", ".webp") if features.check("webp") else ("JPEG", ".jpg")
+_DIGEST_NAME = re.compile(r"^([0-9a-f]{64})\.\w+$")
+
+def _write_atomic(path: str, data: bytes):
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f: f.write(data)
+    os.replace(tmp, path)
+
+def _variant_path(digest: str, variant: str, ext: str) -> str:
+    return os.path.join(MEDIA_STATIC_DIR, f"{digest}_{variant}{ext}")
+
+def _digest_of(path: str) -> Optional[str]:
+    """Returns the content hash of a path inside the media store, or None for legacy uploads."""
+    if os.path.dirname(os.path.abspath(path)) != os.path.abspath(MEDIA_DIR): return None
+    m = _DIGEST_NAME.match(os.path.basename(path))
+    return m.group(1) if m else None
+
+def make_variants(digest: str, data: bytes) -> dict:
+    """Writes every resized variant of an image that is not already on disk. Returns variant -> path."""
+    try:
+        img = Image.open(io.BytesIO(data))
+        img.load()
+    except Exception:
+        return {}
+    animated = getattr(img, "is_animated", False)
+    img = ImageOps.exif_transpose(img)
+    out = {}
+    for variant, (width, height) in MEDIA_VARIANTS.items():
+        if animated and height is None:
+            path = _variant_path(digest, variant, ".gif")
+            if not os.path.exists(path): _write_atomic(path, data)
+            out[variant] = path
+            continue
+        path = _variant_path(digest, variant, VARIANT_EXT)
+        if not os.path.exists(path):
+            if height is None:
+                resized = img.copy()
+                resized.thumbnail((width, width * 4), Image.LANCZOS)
+            else:
+                resized = ImageOps.fit(img, (width, height), Image.LANCZOS)
+            mode = "RGBA" if VARIANT_FORMAT == "WEBP" and resized.mode in ("RGBA", "LA", "P") else "RGB"
+            opts = {"method": 4} if VARIANT_FORMAT == "WEBP" else {"optimize": True}
+            buf = io.BytesIO()
+            resized.convert(mode).save(buf, VARIANT_FORMAT, quality=MEDIA_QUALITY, **opts)
+            _write_atomic(path, buf.getvalue())
+        out[variant] = path
+    return out
+
+_FORMAT_EXT = {"JPEG": ".jpg", "PNG": ".png", "GIF": ".gif", "WEBP": ".webp"}
+
+def save_upload(data: bytes, filename: str = "") -> str:
+    """Stores an upload under its SHA-256, generates its variants and returns the stored path.
+    Identical uploads share one file."""
+    digest = hashlib.sha256(data).hexdigest()
+    try:
+        ext = _FORMAT_EXT.get(Image.open(io.BytesIO(data)).format)
+    except Exception:
+        ext = None
+    ext = ext or os.path.splitext(filename)[1].lower() or ".bin"
+    path = os.path.join(MEDIA_DIR, f"{digest}{ext}")
+    if not os.path.exists(path): _write_atomic(path, data)
+    make_variants(digest, data)
+    return path
+
+def import_file(path: str) -> Optional[str]:
+    """Copies a legacy upload into the media store. Returns the new path, or None if unreadable."""
+    if _digest_of(path): return path
+    try:
+        with open(path, "rb") as f: data = f.read()
+    except OSError:
+        return None
+    return save_upload(data, path)
+
+def image_src(path: Optional[str], variant: str) -> Optional[str]:
+    """Returns an <img> src for a stored image: a static URL for media-store files, or an
+    inline data URI for legacy uploads that were never imported.
+
+    Streamlit's static route sends no Cache-Control, only ETag and Last-Modified, so browsers
+    revalidate these URLs rather than caching them outright. What the store buys is that the image
+    bytes leave the script's websocket payload, and a URL never changes content, so a repeat view
+    is at most a 304. Long-lived caching needs a proxy or CDN in front that adds the header."""
+    if not path: return None
+    digest = _digest_of(path)
+    if digest:
+        for ext in (VARIANT_EXT, ".gif"):
+            if os.path.exists(_variant_path(digest, variant, ext)):
+                return f"{MEDIA_URL_PREFIX}/{digest}_{variant}{ext}"
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                if variant in make_variants(digest, f.read()): return image_src(path, variant)
+    if not os.path.exists(path): return None
+    b64 = get_image_base64(path)
+    if not b64: return None
+    mime = mimetypes.guess_type(path)[0] or "image/png"
+    return f"data:{mime};base64,{b64}"
@@ -0,0 +1,137 @@
+"""Write-behind notification pipeline.
+
+notify() only puts an event on an in-memory queue; a background thread drains
+it every NOTIFY_BATCH_WINDOW seconds and writes the batch in one transaction.
+Events coalesce into the recipient's latest unseen notification (one above
+their notification_state watermark) of the same group ("@a and 12 others liked
+your post"), both within a batch and against rows already stored. The count is
+of distinct actors, except for messages, which count messages. Text is
+formatted at read time by crud.notification_text.
+"""
+import atexit
+import logging
+import queue
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+from database import transaction
+from utils import now_ts
+from config import NOTIFY_BATCH_WINDOW, NOTIFY_BATCH_MAX
+
+log = logging.getLogger(__name__)
+
+# Columns (besides user_id and kind) that define a coalescing group, per kind
+GROUP_BY = {"like": ("post_id",), "reply": ("post_id",), "message": ("actor_id",)}
+# How a group counts an actor it has already counted (see notification_actors):
+#   once:     never again, so like/unlike/like or follow/unfollow/follow doesn't re-notify
+#   distinct: once per notification row ("@a and 2 others replied"); a repeat only refreshes it
+# Other kinds count every event ("3 new messages from @a").
+ACTOR_COUNTING = {"like": "once", "follow": "once", "reply": "distinct", "tip": "distinct"}
+
+_queue: "queue.Queue[tuple]" = queue.Queue()
+_thread: Optional[threading.Thread] = None
+_start_lock = threading.Lock()
+
+def notify(user_id: int, kind: str, actor_id: Optional[int] = None, post_id: Optional[int] = None):
+    """Queues a notification for user_id. Returns immediately."""
+    _start()
+    _queue.put((user_id, kind, actor_id, post_id, now_ts()))
+
+def flush(timeout: float = 5.0) -> bool:
+    """Waits until every queued event has been written. Returns False on timeout."""
+    deadline = time.monotonic() + timeout
+    while _queue.unfinished_tasks:
+        if time.monotonic() > deadline: return False
+        time.sleep(0.01)
+    return True
+
+def bump_unread(conn, user_id: int, delta: int = 1):
+    conn.execute("""
+        INSERT INTO notification_state (user_id, unread_count) VALUES (?, ?)
+        ON CONFLICT(user_id) DO UPDATE SET unread_count = unread_count + excluded.unread_count
+    """, (user_id, delta))
+
+def _group_key(event) -> tuple:
+    user_id, kind, actor_id, post_id, _ = event
+    fields = {"actor_id": actor_id, "post_id": post_id}
+    return (user_id, kind) + tuple(fields[c] for c in GROUP_BY.get(kind, ()))
+
+def _write(events):
+    # Coalesce within the batch first, then once per group against the stored rows
+    groups = {}
+    for e in events: groups.setdefault(_group_key(e), []).append(e)
+    with transaction() as conn:
+        for group in groups.values(): _write_group(conn, group)
+
+def _write_group(conn, events):
+    user_id, kind, _, post_id, _ = events[0]
+    cols = GROUP_BY.get(kind, ())
+    where = " ".join(f"AND {c} IS ?" for c in cols)
+    params = [{"actor_id": events[0][2], "post_id": post_id}[c] for c in cols]
+    target = post_id if "post_id" in cols else 0
+    row = conn.execute(f"""
+        SELECT id FROM notifications WHERE user_id = ? AND kind = ? {where}
+          AND id > COALESCE((SELECT last_seen_id FROM notification_state WHERE user_id = ?), 0)
+        ORDER BY id DESC LIMIT 1
+    """, (user_id, kind, *params, user_id)).fetchone()
+    note_id = row[0] if row else None
+
+    mode, added, latest, counted = ACTOR_COUNTING.get(kind), 0, None, []
+    for e in events:
+        actor_id = e[2]
+        if mode and actor_id is not None:
+            prev = conn.execute("SELECT notification_id FROM notification_actors WHERE user_id = ? AND kind = ? AND target_id = ? AND actor_id = ?",
+                                (user_id, kind, target, actor_id)).fetchone()
+            if actor_id in counted or (prev and (mode == "once" or prev[0] == note_id)):
+                # A repeat: "once" kinds drop it, "distinct" kinds only move the row's actor and time
+                if mode == "distinct": latest = e
+                continue
+            counted.append(actor_id)
+        added += 1
+        latest = e
+    if latest is None: return
+
+    _, _, actor_id, _, ts = latest
+    if note_id is not None:
+        conn.execute("UPDATE notifications SET actor_id = ?, event_count = event_count + ?, created_at = ? WHERE id = ?", (actor_id, added, ts, note_id))
+    else:
+        note_id = conn.execute("INSERT INTO notifications (user_id, kind, actor_id, post_id, event_count, seen, created_at) VALUES (?, ?, ?, ?, ?, 0, ?)",
+                               (user_id, kind, actor_id, post_id, added, ts)).lastrowid
+        bump_unread(conn, user_id)
+    conn.executemany("""
+        INSERT INTO notification_actors (user_id, kind, target_id, actor_id, notification_id) VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT DO UPDATE SET notification_id = excluded.notification_id
+    """, [(user_id, kind, target, a, note_id) for a in counted])
+
+def _run():
+    while True:
+        events = [_queue.get()]
+        deadline = time.monotonic() + NOTIFY_BATCH_WINDOW
+        while len(events) < NOTIFY_BATCH_MAX:
+            try: events.append(_queue.get(timeout=max(0.0, deadline - time.monotonic())))
+            except queue.Empty: break
+        for attempt in range(3):
+            try:
+                _write(events)
+                break
+            except sqlite3.OperationalError:
+                log.warning("notification batch of %d locked, retrying", len(events), exc_info=True)
+                time.sleep(0.5 * (attempt + 1))
+            except Exception:
+                log.exception("dropping notification batch: %r", events)
+                break
+        else:
+            log.error("dropping notification batch after 3 attempts: %r", events)
+        for _ in events: _queue.task_done()
+
+def _start():
+    global _thread
+    if _thread is not None: return
+    with _start_lock:
+        if _thread is None:
+            _thread = threading.Thread(target=_run, name="notifier", daemon=True)
+            _thread.start()
+
+atexit.register(flush, 2.0)
@@ -0,0 +1,23 @@
+import os
+import sys
+
+# The app is a set of top-level modules, not a package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+import database
+
+ALICE, BOB, CAROL = 1, 2, 3
+
+@pytest.fixture
+def conn(tmp_path):
+    """A migrated database in tmp_path with three users, set as the pool's database."""
+    database.configure(str(tmp_path / "test.db"))
+    conn = database.get_conn()
+    database.migrate(conn)
+    conn.executemany("INSERT INTO users (id, username, display_name, password_hash, created_at, wallet_address, private_key, mnemonic) VALUES (?, ?, ?, '!', 0, ?, ?, '')",
+                     [(ALICE, "alice", "Alice", "0xa11ce", "key-alice"), (BOB, "bob", "Bob", "0xb0b", "key-bob"), (CAROL, "carol", "Carol", "0xca201", "key-carol")])
+    conn.commit()
+    yield conn
+    database.close_all()
@@ -0,0 +1,42 @@
+"""Bulk post and like imports; users are created by the conn fixture."""
+import json
+
+import importer
+
+def write_ndjson(path, rows):
+    path.write_text("".join(json.dumps(r) + "\n" for r in rows), encoding="utf-8")
+    return str(path)
+
+def counts(conn):
+    return tuple(conn.execute(f"SELECT COUNT(*) FROM {t}").fetchone()[0] for t in ("posts", "likes", "import_post_map"))
+
+def test_duplicate_source_ids_in_one_batch_are_skipped(conn, tmp_path):
+    posts = write_ndjson(tmp_path / "posts.ndjson", [
+        {"id": "p1", "username": "alice", "text": "first"},
+        {"id": "p1", "username": "alice", "text": "same source id again"},
+        {"username": "alice", "text": "gm"},
+        {"username": "alice", "text": "gm"},
+        {"username": "bob", "text": "gm"},
+    ])
+    result = importer.run(posts=posts, keep_indexes=True)
+    assert result["posts"] == {"added": 3, "skipped": 2}
+    assert [r[0] for r in conn.execute("SELECT text FROM posts ORDER BY id")] == ["first", "gm", "gm"]
+
+def test_rerunning_the_same_files_adds_nothing(conn, tmp_path):
+    posts = write_ndjson(tmp_path / "posts.ndjson", [{"id": i, "username": u, "text": f"post {i}", "created_at": 1000 + i}
+                                                      for i, u in enumerate(["alice", "bob", "carol", "nobody"] * 5)])
+    likes = write_ndjson(tmp_path / "likes.ndjson", [{"username": u, "post_id": i} for i in range(20) for u in ("alice", "bob")])
+    first = importer.run(posts=posts, likes=likes, batch=7)
+    assert first["posts"] == {"added": 15, "skipped": 5}
+    assert first["likes"]["added"] == 30
+    after_first = counts(conn)
+    second = importer.run(posts=posts, likes=likes, batch=7)
+    assert second["posts"] == {"added": 0, "skipped": 20}
+    assert second["likes"]["added"] == 0
+    assert counts(conn) == after_first == (15, 30, 15)
+
+def test_likes_resolve_posts_from_an_earlier_import(conn, tmp_path):
+    importer.run(posts=write_ndjson(tmp_path / "posts.ndjson", [{"id": "src-9", "username": "carol", "text": "hello"}]))
+    result = importer.run(likes=write_ndjson(tmp_path / "likes.ndjson", [{"username": "alice", "post_id": "src-9"}]))
+    assert result["likes"]["added"] == 1
+    assert conn.execute("SELECT p.text FROM likes l JOIN posts p ON p.id = l.post_id").fetchone()[0] == "hello"
@@ -0,0 +1,58 @@
+"""Upgrading a database created by the original init_db to the current schema."""
+import sqlite3
+
+import crud
+import database
+
+# What init_db created before schema versioning existed
+BASELINE_SCHEMA = [
+    "CREATE TABLE users (id INTEGER PRIMARY KEY, username TEXT UNIQUE, display_name TEXT, password_hash TEXT, bio TEXT, profile_pic_path TEXT, created_at REAL, wallet_address TEXT, private_key TEXT, mnemonic TEXT)",
+    "CREATE TABLE posts (id INTEGER PRIMARY KEY, user_id INTEGER, text TEXT, image_path TEXT, created_at REAL, orig_post_id INTEGER DEFAULT NULL, FOREIGN KEY(user_id) REFERENCES users(id))",
+    "CREATE TABLE follows (follower_id INTEGER, followed_id INTEGER, created_at REAL, PRIMARY KEY (follower_id, followed_id))",
+    "CREATE TABLE likes (user_id INTEGER, post_id INTEGER, created_at REAL, PRIMARY KEY (user_id, post_id))",
+    "CREATE TABLE bookmarks (user_id INTEGER, post_id INTEGER, created_at REAL, PRIMARY KEY (user_id, post_id))",
+    "CREATE TABLE replies (id INTEGER PRIMARY KEY, post_id INTEGER, user_id INTEGER, text TEXT, created_at REAL, FOREIGN KEY(post_id) REFERENCES posts(id), FOREIGN KEY(user_id) REFERENCES users(id))",
+    "CREATE TABLE messages (id INTEGER PRIMARY KEY, sender_id INTEGER, receiver_id INTEGER, text TEXT, created_at REAL, FOREIGN KEY(sender_id) REFERENCES users(id), FOREIGN KEY(receiver_id) REFERENCES users(id))",
+    "CREATE TABLE notifications (id INTEGER PRIMARY KEY, user_id INTEGER, text TEXT, seen INTEGER DEFAULT 0, created_at REAL, FOREIGN KEY(user_id) REFERENCES users(id))",
+]
+
+def schema(conn) -> dict:
+    """{name: columns} of every table and index, leaving out the schema_version bookkeeping."""
+    pragma = {"table": "table_info", "index": "index_info"}
+    return {name: [r["name"] for r in conn.execute(f"PRAGMA {pragma[kind]}('{name}')")]
+            for kind, name in conn.execute("SELECT type, name FROM sqlite_master WHERE type IN ('table', 'index') AND name NOT LIKE 'sqlite_%' AND name != 'schema_version'")}
+
+def test_baseline_database_migrates_to_the_fresh_schema(tmp_path):
+    fresh = sqlite3.connect(tmp_path / "fresh.db")
+    fresh.row_factory = sqlite3.Row
+    database.migrate(fresh)
+
+    database.configure(str(tmp_path / "old.db"))
+    conn = database.get_conn()
+    for sql in BASELINE_SCHEMA: conn.execute(sql)
+    conn.executemany("INSERT INTO users (id, username, display_name, password_hash, created_at) VALUES (?, ?, ?, '!', 0)", [(1, "alice", "Alice"), (2, "bob", "Bob")])
+    conn.executemany("INSERT INTO posts (id, user_id, text, created_at) VALUES (?, ?, ?, ?)", [(1, 1, "gm from alice", 10), (2, 2, "gm from bob", 20)])
+    conn.execute("INSERT INTO follows VALUES (1, 2, 5)")
+    conn.execute("INSERT INTO likes VALUES (1, 2, 30)")
+    conn.execute("INSERT INTO replies (post_id, user_id, text, created_at) VALUES (2, 1, 'hey', 40)")
+    conn.execute("INSERT INTO messages (sender_id, receiver_id, text, created_at) VALUES (2, 1, 'hi', 50)")
+    conn.execute("INSERT INTO notifications (user_id, text, created_at) VALUES (2, '@alice liked your post', 30)")
+    conn.commit()
+    try:
+        latest = database.MIGRATIONS[-1][0]
+        assert database.migrate(conn) == latest
+        assert schema(conn) == schema(fresh)
+        # Existing rows keep working through the new tables and counters
+        assert [p["id"] for p in crud.get_feed(1)] == [2, 1]
+        meta = crud.hydrate_posts([2], viewer_id=1)[2]
+        assert (meta["likes"], meta["reply_count"], meta["liked"]) == (1, 1, True)
+        assert [p["id"] for p in crud.search_posts("gm")] and crud.search_users("bob")[0]["id"] == 2
+        assert crud.get_follower_count(2) == 1
+        assert [m["text"] for m in crud.get_messages_between(1, 2)] == ["hi"]
+        assert len(crud.get_notifications(2)) == 1
+        # Running again applies nothing
+        assert database.migrate(conn) == latest
+        assert conn.execute("SELECT COUNT(*) FROM schema_version").fetchone()[0] == len(database.MIGRATIONS)
+    finally:
+        database.close_all()
+        fresh.close()
@@ -0,0 +1,54 @@
+"""Coalescing of notifications by notifier, and its interaction with the seen watermark and pruning."""
+import crud
+import notifier
+from conftest import ALICE, BOB, CAROL
+
+POST = 7
+
+def send(*events):
+    for user_id, kind, actor_id, post_id in events: notifier.notify(user_id, kind, actor_id=actor_id, post_id=post_id)
+    assert notifier.flush()
+
+def rows(conn, user_id=ALICE):
+    return [tuple(r) for r in conn.execute("SELECT kind, actor_id, event_count FROM notifications WHERE user_id = ? ORDER BY id", (user_id,))]
+
+def actor_rows(conn):
+    return conn.execute("SELECT COUNT(*) FROM notification_actors").fetchone()[0]
+
+def seen_all(conn, user_id=ALICE):
+    crud.mark_notifications_seen(user_id, conn.execute("SELECT MAX(id) FROM notifications").fetchone()[0])
+
+def test_likes_count_each_actor_once(conn):
+    send((ALICE, "like", BOB, POST), (ALICE, "like", CAROL, POST))
+    # like/unlike/like from the same actor, in a later batch and after the row was seen
+    send((ALICE, "like", BOB, POST))
+    seen_all(conn)
+    send((ALICE, "like", BOB, POST))
+    assert rows(conn) == [("like", CAROL, 2)]
+
+def test_replies_count_distinct_actors_per_row(conn):
+    send((ALICE, "reply", BOB, POST), (ALICE, "reply", BOB, POST), (ALICE, "reply", CAROL, POST))
+    send((ALICE, "reply", BOB, POST))
+    assert rows(conn) == [("reply", BOB, 2)]
+    # Once seen, a new reply from an actor already counted starts a new row
+    seen_all(conn)
+    send((ALICE, "reply", CAROL, POST))
+    assert rows(conn) == [("reply", BOB, 2), ("reply", CAROL, 1)]
+
+def test_prune_removes_actor_rows_of_pruned_notifications(conn):
+    send((ALICE, "like", BOB, POST), (BOB, "follow", CAROL, None))
+    seen_all(conn)
+    send((BOB, "follow", ALICE, None))
+    assert actor_rows(conn) == 3
+
+    # Only Alice's seen like is pruned; Bob's rows stay with their actors
+    assert crud.prune_notifications(crud.now_ts() + 1) == 1
+    assert rows(conn) == []
+    assert [tuple(r) for r in conn.execute("SELECT actor_id FROM notification_actors ORDER BY actor_id")] == [(ALICE,), (CAROL,)]
+    assert conn.execute("SELECT COUNT(*) FROM notification_actors a LEFT JOIN notifications n ON n.id = a.notification_id WHERE n.id IS NULL").fetchone()[0] == 0
+
+    # The pruned like no longer suppresses a new one from the same actor
+    send((ALICE, "like", BOB, POST))
+    assert rows(conn) == [("like", BOB, 1)]
+    send((ALICE, "like", BOB, POST))
+    assert rows(conn) == [("like", BOB, 1)]
@@ -0,0 +1,40 @@
+"""Keyset pagination: following page_cursor visits every row once, in order, across timestamp ties."""
+import pytest
+
+import crud
+import database
+from conftest import ALICE, BOB, CAROL
+
+def all_pages(fetch, limit):
+    rows, before = [], None
+    while True:
+        page = fetch(limit=limit, before=before)
+        assert len(page) <= limit
+        rows += page
+        before = crud.page_cursor(page, limit)
+        if before is None: return rows
+
+@pytest.fixture
+def posts(conn):
+    """Bob and Carol post 23 times each, several posts sharing a timestamp; Alice follows both."""
+    conn.executemany("INSERT INTO posts (user_id, text, created_at) VALUES (?, ?, ?)",
+                     [(user, f"post {i}", 1000 + i // 3) for i in range(23) for user in (BOB, CAROL)])
+    conn.executemany("INSERT INTO follows (follower_id, followed_id, created_at) VALUES (?, ?, 0)", [(ALICE, BOB), (ALICE, CAROL)])
+    conn.commit()
+    with database.transaction() as c: database.rebuild_timelines(c)
+    return [r[0] for r in conn.execute("SELECT id FROM posts ORDER BY created_at DESC, id DESC")]
+
+@pytest.mark.parametrize("limit", [1, 4, 5, 46, 50])
+def test_feed_pages_cover_every_post_once(posts, limit):
+    assert [p["id"] for p in all_pages(lambda **kw: crud.get_feed(ALICE, **kw), limit)] == posts
+
+@pytest.mark.parametrize("limit", [3, 7, 23])
+def test_profile_pages_cover_every_post_once(conn, posts, limit):
+    bobs = [r[0] for r in conn.execute("SELECT id FROM posts WHERE user_id = ? ORDER BY created_at DESC, id DESC", (BOB,))]
+    assert [p["id"] for p in all_pages(lambda **kw: crud.get_posts_for_user(BOB, **kw), limit)] == bobs
+
+def test_cursor_is_none_only_after_a_short_page(posts):
+    page = crud.get_feed(ALICE, limit=len(posts))
+    assert crud.page_cursor(page, len(posts)) is not None
+    assert crud.get_feed(ALICE, limit=len(posts), before=crud.page_cursor(page, len(posts))) == []
+    assert crud.page_cursor(crud.get_feed(ALICE, limit=len(posts) + 1), len(posts) + 1) is None
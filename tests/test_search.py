@@ -0,0 +1,52 @@
+"""Full-text search over users and posts."""
+import pytest
+
+import crud
+
+@pytest.fixture
+def many_johns(conn, monkeypatch):
+    """'john' signed up first; 30 newer 'John Doe N' accounts share his name token."""
+    monkeypatch.setattr(crud, "SEARCH_CANDIDATES", 10)
+    conn.execute("INSERT INTO users (id, username, display_name, password_hash, created_at) VALUES (10, 'john', 'John', '!', 0)")
+    conn.executemany("INSERT INTO users (id, username, display_name, password_hash, created_at) VALUES (?, ?, ?, '!', 0)",
+                     [(100 + i, f"jd_{i}", f"John Doe {i}") for i in range(30)])
+    conn.commit()
+
+@pytest.mark.parametrize("term", ["john", "@john", "JOHN", "joh"])
+def test_older_username_match_beats_newer_name_matches(many_johns, term):
+    assert crud.search_users(term)[0]["username"] == "john"
+
+def test_user_search_pages_cover_candidates_once(many_johns):
+    seen, before = [], None
+    while True:
+        page = crud.search_users("john", limit=4, before=before)
+        seen += [r["username"] for r in page]
+        before = crud.page_cursor(page, 4)
+        if before is None: break
+    assert seen[0] == "john"
+    assert len(seen) == len(set(seen)) == 11  # john plus the 10 newest candidates
+
+def test_username_prefix_is_matched_literally(conn):
+    conn.executemany("INSERT INTO users (username, display_name, password_hash, created_at) VALUES (?, ?, '!', 0)",
+                     [("a_b", "Underscore"), ("axb", "Not An Underscore"), ("a%c", "Percent")])
+    conn.commit()
+    assert [r["username"] for r in crud.search_users("a_b")][:1] == ["a_b"]
+    assert "axb" not in [r["username"] for r in crud.search_users("a_")]
+
+def test_username_typeahead(conn):
+    conn.executemany("INSERT INTO users (username, display_name, password_hash, created_at) VALUES (?, ?, '!', 0)",
+                     [("Alicia", "Alicia"), ("al_x", "Underscore"), ("alex", "Alex"), ("émile", "Émile")])
+    conn.commit()
+    assert [r["username"] for r in crud.search_usernames("AL", exclude_id=1)] == ["al_x", "alex", "Alicia"]
+    assert [r["username"] for r in crud.search_usernames("al_")] == ["al_x"]
+    assert [r["username"] for r in crud.search_usernames("é")] == ["émile"]
+    # Prefixes ending in the last code point, or just below the surrogates, used to break the range bound
+    assert crud.search_usernames("\U0010ffff") == crud.search_usernames("a퟿") == []
+
+def test_post_search_ranks_and_pages(conn):
+    for i in range(25): crud.create_post(1, f"gm number {i}" + (" #sui" if i % 5 == 0 else ""))
+    hits = crud.search_posts("#sui")
+    assert sorted(p["text"].split()[2] for p in hits) == ["0", "10", "15", "20", "5"]
+    first = crud.search_posts("gm", limit=10)
+    rest = crud.search_posts("gm", limit=20, before=crud.page_cursor(first, 10))
+    assert len({p["id"] for p in first + rest}) == 25
@@ -0,0 +1,159 @@
+"""txqueue against a real SQLite database, with the chain calls stubbed out."""
+import pytest
+
+import blockchain
+import indexer
+import notifier
+import txqueue
+from config import TXQUEUE_MAX_ATTEMPTS, TXQUEUE_BACKOFF_BASE, TIP_BATCH_GAS_PER_TRANSFER
+from conftest import ALICE, BOB, CAROL
+
+class FakeChain:
+    """Records what would have been submitted. outcome is returned by execute_transfer,
+    or raised if it is an exception; balance_mist bounds what pick_gas_coin accepts."""
+
+    def __init__(self):
+        self.built, self.executed, self.notified = [], [], []
+        self.outcome = (True, "0xdigest")
+        self.balance_mist = 10 ** 12
+
+    def pick_gas_coin(self, address, need_mist):
+        if need_mist > self.balance_mist: raise blockchain.InsufficientFunds("short")
+        return "0xcoin"
+
+    def build_transfer(self, private_key, transfers):
+        self.built.append((private_key, transfers))
+        return transfers
+
+    def execute_transfer(self, txn, gas_object=None, gas_budget=blockchain.GAS_BUDGET_MIST):
+        self.executed.append((txn, gas_object, gas_budget))
+        if isinstance(self.outcome, Exception): raise self.outcome
+        return self.outcome
+
+@pytest.fixture
+def chain(monkeypatch):
+    fake = FakeChain()
+    monkeypatch.setattr(blockchain, "pick_gas_coin", fake.pick_gas_coin)
+    monkeypatch.setattr(blockchain, "build_transfer", fake.build_transfer)
+    monkeypatch.setattr(blockchain, "execute_transfer", fake.execute_transfer)
+    monkeypatch.setattr(blockchain, "invalidate_balance", lambda *a: None)
+    monkeypatch.setattr(indexer, "request_sync", lambda *a: None)
+    monkeypatch.setattr(notifier, "notify", lambda *a, **kw: fake.notified.append((a, kw)))
+    monkeypatch.setattr(txqueue, "TIP_BATCH_WINDOW", 0)
+    return fake
+
+def status(txn_id):
+    return txqueue.get_txn(txn_id)["status"]
+
+def run_once():
+    rows = txqueue._claim()
+    if rows: txqueue._process(rows)
+    return rows
+
+def test_claim_hands_out_one_row_per_sender(conn, chain):
+    a1 = txqueue.enqueue(ALICE, "0xb0b", 1.0)
+    a2 = txqueue.enqueue(ALICE, "0xca201", 1.0)
+    b1 = txqueue.enqueue(BOB, "0xa11ce", 1.0)
+    assert [r["id"] for r in txqueue._claim()] == [a1]
+    # a2 waits behind a1, which is still 'sending'
+    assert [r["id"] for r in txqueue._claim()] == [b1]
+    assert txqueue._claim() == []
+    assert status(a1) == status(b1) == "sending" and status(a2) == "queued"
+
+def test_claim_skips_rows_not_yet_due(conn, chain):
+    txn_id = txqueue.enqueue(ALICE, "0xb0b", 1.0)
+    conn.execute("UPDATE outgoing_txns SET next_attempt_at = ? WHERE id = ?", (txqueue.now_ts() + 60, txn_id))
+    conn.commit()
+    assert txqueue._claim() == []
+
+def test_sent_transfer_records_digest(conn, chain):
+    txn_id = txqueue.enqueue(ALICE, "0xb0b", 1.5)
+    run_once()
+    row = txqueue.get_txn(txn_id)
+    assert (row["status"], row["digest"], row["attempts"]) == ("sent", "0xdigest", 1)
+    assert chain.built == [("key-alice", [("0xb0b", 1_500_000_000)])]
+
+def test_tips_are_batched_into_one_transaction(conn, chain):
+    ids = [txqueue.enqueue(ALICE, addr, 0.1, kind="tip", recipient_id=rid) for addr, rid in (("0xb0b", BOB), ("0xca201", CAROL), ("0xb0b", BOB))]
+    assert [r["id"] for r in run_once()] == ids
+    # Tips to the same recipient are merged into one transfer
+    assert chain.built == [("key-alice", [("0xb0b", 200_000_000), ("0xca201", 100_000_000)])]
+    assert chain.executed[0][2] == blockchain.GAS_BUDGET_MIST + TIP_BATCH_GAS_PER_TRANSFER
+    assert [status(i) for i in ids] == ["sent"] * 3
+    assert [a[0] for a, _ in chain.notified] == [BOB, CAROL, BOB]
+
+def test_tip_batch_stops_at_a_queued_withdrawal(conn, chain):
+    tip1 = txqueue.enqueue(ALICE, "0xb0b", 0.1, kind="tip", recipient_id=BOB)
+    withdrawal = txqueue.enqueue(ALICE, "0xca201", 1.0)
+    tip2 = txqueue.enqueue(ALICE, "0xca201", 0.1, kind="tip", recipient_id=CAROL)
+    assert [r["id"] for r in run_once()] == [tip1]
+    assert [r["id"] for r in run_once()] == [withdrawal]
+    assert [r["id"] for r in run_once()] == [tip2]
+
+def test_unaffordable_batch_falls_back_to_single_tips(conn, chain):
+    ids = [txqueue.enqueue(ALICE, "0xb0b", 1.0, kind="tip", recipient_id=BOB) for _ in range(3)]
+    chain.balance_mist = 1_500_000_000 + blockchain.GAS_BUDGET_MIST
+    run_once()
+    # The lead tip went alone; the others are back in the queue with their attempt not counted
+    assert status(ids[0]) == "sent"
+    assert [(txqueue.get_txn(i)["status"], txqueue.get_txn(i)["attempts"]) for i in ids[1:]] == [("queued", 0), ("queued", 0)]
+
+def test_rejected_submission_backs_off_then_fails(conn, chain):
+    txn_id = txqueue.enqueue(ALICE, "0xb0b", 1.0)
+    chain.outcome = (False, "InsufficientGas")
+    before = txqueue.now_ts()
+    run_once()
+    row = txqueue.get_txn(txn_id)
+    assert (row["status"], row["attempts"], row["error"]) == ("queued", 1, "InsufficientGas")
+    assert row["next_attempt_at"] >= before + TXQUEUE_BACKOFF_BASE
+    assert txqueue._claim() == []
+    for attempt in range(2, TXQUEUE_MAX_ATTEMPTS + 1):
+        conn.execute("UPDATE outgoing_txns SET next_attempt_at = 0 WHERE id = ?", (txn_id,))
+        conn.commit()
+        run_once()
+    row = txqueue.get_txn(txn_id)
+    assert (row["status"], row["attempts"]) == ("failed", TXQUEUE_MAX_ATTEMPTS)
+    assert len(chain.executed) == TXQUEUE_MAX_ATTEMPTS
+
+def test_transport_error_parks_the_transfer_as_unknown(conn, chain):
+    first = txqueue.enqueue(ALICE, "0xb0b", 1.0)
+    second = txqueue.enqueue(ALICE, "0xb0b", 1.0)
+    chain.outcome = ConnectionError("reset by peer")
+    run_once()
+    assert status(first) == "unknown"
+    # Never resent automatically, and it no longer holds up the sender's queue
+    chain.outcome = (True, "0xdigest")
+    assert [r["id"] for r in run_once()] == [second]
+    assert status(first) == "unknown" and status(second) == "sent"
+
+def test_start_marks_interrupted_sends_unknown(conn, chain, monkeypatch):
+    txn_id = txqueue.enqueue(ALICE, "0xb0b", 1.0)
+    txqueue._claim()
+    monkeypatch.setattr(txqueue, "_workers", [])
+    txqueue.start(workers=0)
+    row = txqueue.get_txn(txn_id)
+    assert (row["status"], row["error"]) == ("unknown", "Interrupted while sending")
+
+def test_worker_survives_claim_and_process_errors(conn, chain, monkeypatch):
+    class Stop(BaseException):
+        pass
+
+    txn_id = txqueue.enqueue(ALICE, "0xb0b", 1.0)
+    rows = [txqueue.get_txn(txn_id)]
+    claims = iter([RuntimeError("database disk image is malformed"), rows, Stop()])
+
+    def claim():
+        step = next(claims)
+        if isinstance(step, BaseException): raise step
+        return step
+
+    def process(rows):
+        raise KeyError("wallet_address")
+
+    monkeypatch.setattr(txqueue, "_claim", claim)
+    monkeypatch.setattr(txqueue, "_process", process)
+    monkeypatch.setattr(txqueue._wake, "wait", lambda timeout=None: True)
+    with pytest.raises(Stop):
+        txqueue._work()
+    row = txqueue.get_txn(txn_id)
+    assert (row["status"], row["error"]) == ("unknown", "Worker error: 'wallet_address'")
@@ -0,0 +1,173 @@
+"""Persistent queue for outgoing SUI transfers (wallet withdrawals and tips).
+
+Requests are rows in outgoing_txns; a pool of worker threads sends them. The
+claim query only hands out a sender's oldest pending row, so each wallet has
+at most one transaction in flight and its gas coin is never used twice.
+Tips wait TIP_BATCH_WINDOW seconds and are then sent together with the
+sender's other queued tips as one programmable transaction block.
+Rejected submissions are retried with exponential backoff. A submission that
+fails in transport may still have landed, so it is parked as 'unknown' and
+never resent automatically.
+"""
+import logging
+import sqlite3
+import threading
+from typing import List, Optional
+
+import blockchain
+import indexer
+import notifier
+from database import get_conn, transaction
+from utils import now_ts
+from config import (TXQUEUE_WORKERS, TXQUEUE_MAX_ATTEMPTS, TXQUEUE_BACKOFF_BASE, TXQUEUE_BACKOFF_MAX, TXQUEUE_POLL_INTERVAL,
+                    TIP_BATCH_WINDOW, TIP_BATCH_MAX, TIP_BATCH_GAS_PER_TRANSFER)
+
+PENDING = ("queued", "sending")
+
+log = logging.getLogger(__name__)
+
+_wake = threading.Event()
+_workers: List[threading.Thread] = []
+_start_lock = threading.Lock()
+
+# Oldest ready row whose sender has nothing older still pending (in particular nothing 'sending')
+CLAIM_SQL = """
+    UPDATE outgoing_txns SET status = 'sending', attempts = attempts + 1, updated_at = :now
+    WHERE id = (
+        SELECT o.id FROM outgoing_txns o
+        WHERE o.status = 'queued' AND o.next_attempt_at <= :now
+          AND o.id = (SELECT MIN(f.id) FROM outgoing_txns f WHERE f.sender_id = o.sender_id AND f.status IN ('queued', 'sending'))
+        ORDER BY o.next_attempt_at, o.id LIMIT 1
+    )
+    RETURNING id, sender_id, recipient_id, recipient_address, amount_mist, kind, attempts
+"""
+
+# The sender's other queued tips that come before any queued withdrawal, to ride in the same transaction
+CLAIM_TIPS_SQL = """
+    UPDATE outgoing_txns SET status = 'sending', attempts = attempts + 1, updated_at = :now
+    WHERE id IN (
+        SELECT t.id FROM outgoing_txns t
+        WHERE t.sender_id = :sender_id AND t.status = 'queued' AND t.kind = 'tip'
+          AND NOT EXISTS (SELECT 1 FROM outgoing_txns w WHERE w.sender_id = :sender_id AND w.status = 'queued' AND w.kind != 'tip' AND w.id < t.id)
+        ORDER BY t.id LIMIT :limit
+    )
+    RETURNING id, sender_id, recipient_id, recipient_address, amount_mist, kind, attempts
+"""
+
+def enqueue(sender_id: int, recipient_address: str, amount_sui: float, kind: str = "withdrawal", recipient_id: Optional[int] = None) -> int:
+    """Queues a transfer and returns its id. Poll get_txn() for status and digest."""
+    ts = now_ts()
+    ready_at = ts + TIP_BATCH_WINDOW if kind == "tip" else ts
+    with transaction() as conn:
+        cur = conn.execute("""
+            INSERT INTO outgoing_txns (sender_id, recipient_id, recipient_address, amount_mist, kind, next_attempt_at, created_at, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """, (sender_id, recipient_id, recipient_address, blockchain.to_mist(amount_sui), kind, ready_at, ts, ts))
+    _wake.set()
+    return cur.lastrowid
+
+def get_txn(txn_id: int) -> Optional[sqlite3.Row]:
+    return get_conn().execute("SELECT * FROM outgoing_txns WHERE id = ?", (txn_id,)).fetchone()
+
+def get_txns_for_user(sender_id: int, limit: int = 10) -> List[sqlite3.Row]:
+    """Most recent transfers sent by a user, newest first."""
+    return get_conn().execute("SELECT * FROM outgoing_txns WHERE sender_id = ? ORDER BY id DESC LIMIT ?", (sender_id, limit)).fetchall()
+
+def _update(rows, status: str, **fields):
+    fields.update(status=status, updated_at=now_ts())
+    with transaction() as conn:
+        conn.executemany(f"UPDATE outgoing_txns SET {', '.join(f'{k} = ?' for k in fields)} WHERE id = ?",
+                         [(*fields.values(), r["id"]) for r in rows])
+
+def _retry_or_fail(rows, error: str):
+    for r in rows:
+        if r["attempts"] >= TXQUEUE_MAX_ATTEMPTS:
+            _update([r], "failed", error=error)
+        else:
+            delay = min(TXQUEUE_BACKOFF_BASE * 2 ** (r["attempts"] - 1), TXQUEUE_BACKOFF_MAX)
+            _update([r], "queued", error=error, next_attempt_at=now_ts() + delay)
+
+def _release(rows):
+    """Puts claimed rows back in the queue without counting the attempt."""
+    with transaction() as conn:
+        conn.executemany("UPDATE outgoing_txns SET status = 'queued', attempts = attempts - 1, next_attempt_at = ?, updated_at = ? WHERE id = ?",
+                         [(now_ts(), now_ts(), r["id"]) for r in rows])
+    _wake.set()
+
+def _on_sent(rows, sender, digest: str):
+    _update(rows, "sent", digest=digest, error=None)
+    blockchain.invalidate_balance(sender["wallet_address"], *{r["recipient_address"] for r in rows})
+    indexer.request_sync(sender["wallet_address"], *{r["recipient_address"] for r in rows})
+    for r in rows:
+        if r["kind"] == "tip" and r["recipient_id"]:
+            notifier.notify(r["recipient_id"], "tip", actor_id=r["sender_id"])
+
+def _process(rows):
+    """Sends one claimed row, or a batch of one sender's tips, as a single transaction."""
+    sender = get_conn().execute("SELECT username, wallet_address, private_key FROM users WHERE id = ?", (rows[0]["sender_id"],)).fetchone()
+    if sender is None:
+        return _update(rows, "failed", error="Sender no longer exists")
+    # Tips to the same recipient share one split_coin/transfer_objects pair
+    transfers = {}
+    for r in rows: transfers[r["recipient_address"]] = transfers.get(r["recipient_address"], 0) + r["amount_mist"]
+    gas_budget = blockchain.GAS_BUDGET_MIST + (len(transfers) - 1) * TIP_BATCH_GAS_PER_TRANSFER
+    try:
+        gas_coin = blockchain.pick_gas_coin(sender["wallet_address"], sum(transfers.values()) + gas_budget)
+        txn = blockchain.build_transfer(sender["private_key"], list(transfers.items()))
+    except (blockchain.InsufficientFunds, ValueError) as e:
+        if len(rows) > 1:
+            # Don't let one unaffordable or malformed tip sink the batch; retry the rest separately
+            _release(rows[1:])
+            return _process(rows[:1])
+        return _update(rows, "failed", error=str(e))
+    except Exception as e:
+        return _retry_or_fail(rows, str(e))
+    try:
+        ok, msg = blockchain.execute_transfer(txn, gas_coin, gas_budget)
+    except Exception as e:
+        return _update(rows, "unknown", error=f"Submission outcome unknown: {e}")
+    if ok: _on_sent(rows, sender, msg)
+    else: _retry_or_fail(rows, msg)
+
+def _claim() -> List[sqlite3.Row]:
+    now = now_ts()
+    with transaction() as conn:
+        lead = conn.execute(CLAIM_SQL, {"now": now}).fetchone()
+        if lead is None: return []
+        if lead["kind"] != "tip" or TIP_BATCH_MAX <= 1: return [lead]
+        tips = conn.execute(CLAIM_TIPS_SQL, {"now": now, "sender_id": lead["sender_id"], "limit": TIP_BATCH_MAX - 1}).fetchall()
+        return [lead] + sorted(tips, key=lambda r: r["id"])
+
+def _work():
+    # Nothing may end this loop: a dead worker silently shrinks the pool
+    while True:
+        try:
+            rows = _claim()
+        except Exception:
+            log.exception("claiming a transfer failed")
+            rows = []
+        if not rows:
+            _wake.wait(TXQUEUE_POLL_INTERVAL)
+            _wake.clear()
+            continue
+        try:
+            _process(rows)
+        except Exception as e:
+            log.exception("sending transfers %s failed", [r["id"] for r in rows])
+            try:
+                _update(rows, "unknown", error=f"Worker error: {e}")
+            except Exception:
+                # Left 'sending'; the next start() marks them 'unknown'
+                log.exception("could not park transfers %s as unknown", [r["id"] for r in rows])
+
+def start(workers: int = TXQUEUE_WORKERS):
+    """Starts the worker threads once per process. Rows left 'sending' by a previous
+    process are marked 'unknown' first, since they may already be on chain."""
+    with _start_lock:
+        if _workers: return
+        with transaction() as conn:
+            conn.execute("UPDATE outgoing_txns SET status = 'unknown', error = 'Interrupted while sending', updated_at = ? WHERE status = 'sending'", (now_ts(),))
+        for i in range(workers):
+            t = threading.Thread(target=_work, name=f"txqueue-{i}", daemon=True)
+            t.start()
+            _workers.append(t)
@@ -1,7 +1,13 @@
 import hashlib
+import os
 import time
 import base64
 from datetime import datetime
+from cache import LRUCache
+from config import IMAGE_CACHE_MAX_BYTES
+
+# Encoded images keyed by (path, mtime, size), so a replaced file is never served stale.
+_image_cache = LRUCache(IMAGE_CACHE_MAX_BYTES)
 
 def hash_password(password: str) -> str:
     """Hashes a password for storage."""
@@ -18,8 +24,17 @@ def human_time(ts: float) -> str:
 
 def get_image_base64(path):
     """Converts an image file to a base64 string for HTML rendering."""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    key = (os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
+    b64 = _image_cache.get(key)
+    if b64 is not None: return b64
     try:
         with open(path, "rb") as img_file:
-            return base64.b64encode(img_file.read()).decode('utf-8')
+            b64 = base64.b64encode(img_file.read()).decode('utf-8')
     except:
         return None
+    _image_cache.put(key, b64)
+    return b64
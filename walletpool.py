@@ -0,0 +1,145 @@
+"""Reserve of pre-derived custodial wallets.
+
+Deriving a wallet (mnemonic + Ed25519 BIP-32 derivation) is CPU-bound, so a
+background thread keeps wallet_pool topped up from a process pool and
+create_user claims a row inside its own transaction. If the INSERT fails the
+claim rolls back with it. When the pool is empty create_user derives inline,
+as before.
+"""
+import contextlib
+import multiprocessing
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from importlib.machinery import ModuleSpec
+from typing import List, Optional, Tuple
+
+from database import get_conn, transaction
+from config import WALLET_POOL_LOW_WATER, WALLET_POOL_TARGET, WALLET_POOL_PROCESSES, WALLET_POOL_CHUNK, WALLET_POOL_CHECK_INTERVAL
+
+Wallet = Tuple[str, str, str]  # (address, private key, mnemonic)
+
+_metrics = {"claimed": 0, "misses": 0, "generated": 0, "refills": 0, "last_refill_seconds": 0.0}
+_metrics_lock = threading.Lock()
+_wake = threading.Event()
+_thread: Optional[threading.Thread] = None
+_executor: Optional[ProcessPoolExecutor] = None
+_start_lock = threading.Lock()
+_main_lock = threading.Lock()
+
+def _derive_batch(count: int) -> List[Wallet]:
+    # Runs in a worker process
+    from blockchain import generate_new_wallet
+    return [generate_new_wallet() for _ in range(count)]
+
+def new_executor(processes: int) -> ProcessPoolExecutor:
+    # Never fork: the server process has live threads (tornado, txqueue, notifier, indexer)
+    # and open SQLite connections. Forkserver children start from a clean process that has
+    # only imported blockchain; _derive_batch is importable, so that is all they need.
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context("forkserver")
+        context.set_forkserver_preload(["blockchain"])
+    else:
+        context = multiprocessing.get_context("spawn")
+    return ProcessPoolExecutor(processes, mp_context=context)
+
+@contextlib.contextmanager
+def _hidden_main():
+    """Keeps new worker processes from re-running the __main__ script.
+
+    Spawned and forkserver workers re-import __main__ by path unless it has a module spec.
+    Under Streamlit __main__ is main.py, which would start the app in every worker. A spec
+    named "__main__" makes multiprocessing skip that import. Workers are only started
+    while tasks are submitted, so this wraps the submitting call."""
+    with _main_lock:
+        main = sys.modules.get("__main__")
+        hide = main is not None and getattr(main, "__spec__", None) is None
+        if hide: main.__spec__ = ModuleSpec("__main__", None)
+        try:
+            yield
+        finally:
+            if hide: main.__spec__ = None
+
+def _get_executor() -> Optional[ProcessPoolExecutor]:
+    global _executor
+    if _executor is None and WALLET_POOL_PROCESSES > 0:
+        _executor = new_executor(WALLET_POOL_PROCESSES)
+    return _executor
+
+def _reset_executor():
+    global _executor
+    if _executor is not None: _executor.shutdown(wait=False, cancel_futures=True)
+    _executor = None
+
+def derive(count: int, chunk: int = WALLET_POOL_CHUNK, executor: Optional[ProcessPoolExecutor] = None):
+    """Yields batches of freshly derived wallets, computed in the given process pool or the
+    shared one (or in this thread if worker processes are disabled or can't start)."""
+    chunks = [min(chunk, count - i) for i in range(0, count, chunk)]
+    shared = executor is None
+    if shared:
+        try:
+            executor = _get_executor()
+        except (OSError, RuntimeError):
+            executor = None
+    if executor is not None:
+        try:
+            with _hidden_main(): results = executor.map(_derive_batch, chunks)
+            for wallets in results:
+                chunks.pop(0)
+                yield wallets
+        except BrokenProcessPool:
+            if shared: _reset_executor()
+    for n in chunks: yield _derive_batch(n)
+
+def _add(wallets: List[Wallet]):
+    with transaction() as conn:
+        conn.executemany("INSERT INTO wallet_pool (wallet_address, private_key, mnemonic, created_at) VALUES (?, ?, ?, ?)",
+                         [(*w, time.time()) for w in wallets])
+    with _metrics_lock: _metrics["generated"] += len(wallets)
+
+def size() -> int:
+    return get_conn().execute("SELECT COUNT(*) FROM wallet_pool").fetchone()[0]
+
+def fill(target: int = WALLET_POOL_TARGET) -> int:
+    """Tops the pool up to target. Returns the number of wallets added."""
+    need = target - size()
+    if need <= 0: return 0
+    started = time.perf_counter()
+    for wallets in derive(need): _add(wallets)
+    with _metrics_lock:
+        _metrics["refills"] += 1
+        _metrics["last_refill_seconds"] = round(time.perf_counter() - started, 3)
+    return need
+
+def claim(conn) -> Optional[Wallet]:
+    """Takes the oldest pooled wallet within the caller's transaction, or returns None if the pool is empty."""
+    # Check with a plain SELECT first so an empty pool doesn't open a write transaction
+    row = None
+    if conn.execute("SELECT 1 FROM wallet_pool LIMIT 1").fetchone():
+        row = conn.execute("DELETE FROM wallet_pool WHERE id = (SELECT MIN(id) FROM wallet_pool) RETURNING wallet_address, private_key, mnemonic").fetchone()
+    with _metrics_lock: _metrics["claimed" if row else "misses"] += 1
+    _wake.set()
+    return tuple(row) if row else None
+
+def stats() -> dict:
+    with _metrics_lock: metrics = dict(_metrics)
+    return {**metrics, "size": size()}
+
+def _run():
+    while True:
+        try:
+            if size() < WALLET_POOL_LOW_WATER: fill()
+        except Exception:
+            pass
+        _wake.wait(WALLET_POOL_CHECK_INTERVAL)
+        _wake.clear()
+
+def start():
+    """Starts the refill thread once per process."""
+    global _thread
+    with _start_lock:
+        if _thread is None:
+            _thread = threading.Thread(target=_run, name="wallet-pool", daemon=True)
+            _thread.start()